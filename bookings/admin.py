@@ -1,5 +1,5 @@
 from django.contrib import admin
-from .models import Booking, Passenger, Payment, Baggage
+from .models import Booking, Notification, Passenger, Payment, Baggage, SeatHold
 
 class PassengerInline(admin.TabularInline):
     model = Passenger
@@ -30,3 +30,17 @@ class PaymentAdmin(admin.ModelAdmin):
 class BaggageAdmin(admin.ModelAdmin):
     list_display = ('passenger', 'weight', 'additional_fee')
     search_fields = ('passenger__first_name', 'passenger__last_name')
+
+@admin.register(SeatHold)
+class SeatHoldAdmin(admin.ModelAdmin):
+    list_display = ('booking', 'flight', 'seat_class', 'seats', 'expires_at')
+    search_fields = ('booking__booking_reference',)
+    readonly_fields = ('created_at',)
+
+@admin.register(Notification)
+class NotificationAdmin(admin.ModelAdmin):
+    list_display = ('booking', 'user', 'kind', 'status', 'attempts', 'next_attempt_at', 'created_at', 'sent_at')
+    list_filter = ('kind', 'status')
+    search_fields = ('booking__booking_reference', 'user__username')
+    raw_id_fields = ('booking', 'user')
+    readonly_fields = ('created_at', 'sent_at')
@@ -0,0 +1,120 @@
+from collections import Counter
+from datetime import timedelta
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Case, Exists, F, IntegerField, OuterRef, Q, Subquery, Sum, Value, When
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+from flights import page_cache, seatmap
+from flights.models import Flight, Seat, SeatClass
+from . import summary
+from .models import Booking, Passenger, SeatHold
+
+
+def hold_expiry(now=None):
+    minutes = getattr(settings, 'SEAT_HOLD_MINUTES', 15)
+    return (now or timezone.now()) + timedelta(minutes=minutes)
+
+
+def create_hold(booking, seats):
+    return SeatHold.objects.create(
+        booking=booking,
+        flight_id=booking.flight_id,
+        seat_class_id=booking.seat_class_id,
+        seats=seats,
+        expires_at=hold_expiry()
+    )
+
+
+def release_hold(booking):
+    """Drop the hold once a booking is paid for or cancelled by the user."""
+    SeatHold.objects.filter(booking=booking).delete()
+
+
+def expired_holds(now=None):
+    return SeatHold.objects.filter(expires_at__lte=now or timezone.now(), booking__status='pending')
+
+
+def expired_hold_seats(field, now=None):
+    """Subquery summing seats held by expired holds, correlated on `field` (flight or seat_class).
+
+    Reads add this to the stored counters so expired holds count as free
+    before the sweeper has released them.
+    """
+    holds = expired_holds(now).filter(**{field: OuterRef('pk')}).order_by().values(field).annotate(
+        total=Sum('seats')
+    ).values('total')
+    return Coalesce(Subquery(holds, output_field=IntegerField()), Value(0))
+
+
+def seat_is_free(now=None):
+    # Seat rows stay is_available=False until swept; an expired hold frees them for reads
+    return Q(is_available=True) | Exists(Passenger.objects.filter(
+        seat=OuterRef('pk'),
+        booking__status='pending',
+        booking__seat_hold__expires_at__lte=now or timezone.now()
+    ))
+
+
+def _increment(model, amounts):
+    if not amounts:
+        return
+    model.objects.filter(id__in=amounts.keys()).update(
+        available_seats=F('available_seats') + Case(
+            *[When(id=pk, then=Value(n)) for pk, n in amounts.items()],
+            default=Value(0),
+            output_field=IntegerField()
+        )
+    )
+
+
+def return_seats(flight_seats, class_seats):
+    """Add seats back to flights and their classes, given as {id: seats}, with one UPDATE per table."""
+    _increment(Flight, flight_seats)
+    _increment(SeatClass, class_seats)
+
+
+def release_expired_holds(now=None, flight_id=None, batch_size=1000):
+    """Cancel pending bookings whose hold has expired and return their seats to inventory.
+
+    Each batch is a handful of set-based statements regardless of how many
+    bookings it covers. Returns the number of bookings released.
+    """
+    now = now or timezone.now()
+    released = 0
+    while True:
+        with transaction.atomic():
+            holds = expired_holds(now)
+            if flight_id is not None:
+                holds = holds.filter(flight_id=flight_id)
+            rows = list(holds.select_for_update().order_by('expires_at').values_list(
+                'id', 'booking_id', 'flight_id', 'seat_class_id', 'seats', 'booking__user_id'
+            )[:batch_size])
+            if not rows:
+                return released
+
+            booking_ids = [row[1] for row in rows]
+            Booking.objects.filter(id__in=booking_ids, status='pending').update(status='cancelled', updated_at=now)
+            summary.invalidate(*(row[5] for row in rows))
+
+            flight_seats = Counter()
+            class_seats = Counter()
+            for _, _, hold_flight_id, seat_class_id, seats, _ in rows:
+                flight_seats[hold_flight_id] += seats
+                class_seats[seat_class_id] += seats
+            return_seats(flight_seats, class_seats)
+
+            Seat.objects.filter(
+                id__in=Passenger.objects.filter(booking_id__in=booking_ids, seat__isnull=False).values('seat_id')
+            ).update(is_available=True)
+            SeatHold.objects.filter(id__in=[row[0] for row in rows]).delete()
+            for released_flight_id in flight_seats:
+                transaction.on_commit(lambda pk=released_flight_id: seatmap.invalidate(pk))
+            # flights.fare_calendar imports flights.search, which imports this module
+            from flights import fare_calendar
+            fare_calendar.inventory_changed(class_seats)
+            page_cache.invalidate_flights(*flight_seats)
+
+        released += len(rows)
+        if len(rows) < batch_size:
+            return released
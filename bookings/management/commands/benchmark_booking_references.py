@@ -0,0 +1,61 @@
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from decimal import Decimal
+from flights.models import SeatClass
+from bookings.models import Booking
+from bookings.references import reserve_block, format_reference
+import statistics
+import time
+
+class Command(BaseCommand):
+    help = 'Show booking insert latency stays flat as the bookings table grows'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--total', type=int, default=10_000_000, help='Existing bookings to grow the table to')
+        parser.add_argument('--checkpoints', type=int, default=10, help='How many times to measure along the way')
+        parser.add_argument('--samples', type=int, default=200, help='Single-booking inserts timed per checkpoint')
+        parser.add_argument('--batch-size', type=int, default=10000, help='Rows per bulk INSERT while seeding')
+        parser.add_argument('--keep', action='store_true', help='Keep the synthetic bookings afterwards')
+
+    def handle(self, *args, **options):
+        seat_class = SeatClass.objects.select_related('flight').first()
+        if seat_class is None:
+            raise CommandError('No seat classes found; run populate_sample_data first')
+        user = get_user_model().objects.create_user(username=f'benchmark-{time.time_ns()}', password=None)
+
+        def booking(**kwargs):
+            return Booking(user=user, flight=seat_class.flight, seat_class=seat_class,
+                           total_amount=Decimal('0'), status='cancelled', **kwargs)
+
+        step = options['total'] // options['checkpoints']
+        seeded = 0
+        try:
+            for checkpoint in range(options['checkpoints'] + 1):
+                latencies = []
+                for _ in range(options['samples']):
+                    start = time.perf_counter()
+                    booking().save()
+                    latencies.append(time.perf_counter() - start)
+                latencies.sort()
+                self.stdout.write(
+                    f'{seeded:>11} bookings: median {statistics.median(latencies) * 1000:.2f} ms, '
+                    f'p95 {latencies[int(len(latencies) * 0.95) - 1] * 1000:.2f} ms'
+                )
+                if checkpoint < options['checkpoints']:
+                    seeded += self._seed(booking, step, options['batch_size'])
+        finally:
+            if not options['keep']:
+                user.delete()
+
+    def _seed(self, booking, count, batch_size):
+        created = 0
+        while created < count:
+            size = min(batch_size, count - created)
+            first = reserve_block(size)
+            with transaction.atomic():
+                Booking.objects.bulk_create(
+                    [booking(booking_reference=format_reference(first + i)) for i in range(size)]
+                )
+            created += size
+        return created
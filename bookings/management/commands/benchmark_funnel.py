@@ -0,0 +1,240 @@
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, connections
+from django.test import Client
+from django.urls import resolve, reverse
+from django.utils import timezone
+from flights.models import SeatClass
+from flights.seatmap import is_free
+from bookings.models import Passenger
+from datetime import datetime
+import base64
+import json
+import logging
+import random
+import re
+import statistics
+import subprocess
+import threading
+import time
+
+QUERIES = re.compile(r'desc="(\d+) queries"')
+
+# Largest party a simulated user books for; only classes with at least this many seats are sampled
+MAX_PARTY = 3
+
+STEPS = ['search_flights', 'flight_list', 'flight_detail', 'create_booking', 'seat_map', 'seat_selection',
+         'payment_view', 'cancel_booking']
+
+
+def percentile(values, fraction):
+    return values[max(0, int(round(len(values) * fraction)) - 1)]
+
+
+class Command(BaseCommand):
+    help = 'Drive the booking funnel end to end with concurrent simulated users and report latency per step'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=10, help='Concurrent simulated users')
+        parser.add_argument('--iterations', type=int, default=20, help='Funnels each user walks through')
+        parser.add_argument('--warmup', type=int, default=1, help='Untimed funnels per user before measuring')
+        parser.add_argument('--seed', type=int, default=1, help='Random seed for routes and seat choices')
+        parser.add_argument('--seed-data', action='store_true',
+                            help='Run populate_sample_data first; it adds to any existing data and schedules '
+                                 'flights from today, so results are only comparable on a fresh database')
+        parser.add_argument('--scale', type=int, default=1, help='Schedule scale passed to populate_sample_data')
+        parser.add_argument('--days', type=int, default=30, help='Schedule days passed to populate_sample_data')
+        parser.add_argument('--output', help='Write the results as JSON to this file')
+        parser.add_argument('--compare', help='Earlier JSON results to print p95 and query deltas against')
+
+    def handle(self, *args, **options):
+        if options['seed_data']:
+            call_command('populate_sample_data', scale=options['scale'], days=options['days'],
+                         seed=options['seed'], stdout=self.stdout)
+
+        routes = list(SeatClass.objects.filter(
+            flight__status='scheduled', flight__departure_time__gte=timezone.now(), available_seats__gte=MAX_PARTY
+        ).values_list(
+            'flight_id', 'id', 'flight__departure_airport__city', 'flight__arrival_airport__city',
+            'flight__departure_time'
+        ).order_by('flight__departure_time', 'id')[:5000])
+        if not routes:
+            raise CommandError('No upcoming flights with free seats; run with --seed-data or populate_sample_data')
+
+        run = f'{time.time_ns():x}'
+        User = get_user_model()
+        users = [User.objects.create_user(username=f'loadtest-{run}-{i}', password=None)
+                 for i in range(options['users'])]
+
+        samples = {step: [] for step in STEPS}
+        completed = [0]
+        lock = threading.Lock()
+        barrier = threading.Barrier(len(users))
+
+        def simulated_user(index):
+            rng = random.Random(options['seed'] * 1000 + index)
+            client = Client(raise_request_exception=False)
+            client.force_login(users[index])
+            try:
+                for _ in range(options['warmup']):
+                    self._funnel(client, rng, routes, None)
+                barrier.wait()
+                for _ in range(options['iterations']):
+                    funnel = {}
+                    if self._funnel(client, rng, routes, funnel):
+                        with lock:
+                            completed[0] += 1
+                    with lock:
+                        for step, sample in funnel.items():
+                            samples[step].append(sample)
+            finally:
+                connections.close_all()
+
+        # Server errors are counted per step below rather than logged with a traceback each
+        request_logger = logging.getLogger('django.request')
+        level = request_logger.level
+        request_logger.setLevel(logging.CRITICAL)
+        threads = [threading.Thread(target=simulated_user, args=(i,)) for i in range(len(users))]
+        started = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = time.perf_counter() - started
+        request_logger.setLevel(level)
+
+        User.objects.filter(id__in=[user.id for user in users]).delete()
+        results = self._results(samples, completed[0], elapsed, options)
+        self._report(results)
+        if options['compare']:
+            with open(options['compare']) as f:
+                self._compare(json.load(f), results)
+        if options['output']:
+            with open(options['output'], 'w') as f:
+                json.dump(results, f, indent=2)
+            self.stdout.write(f'Results written to {options["output"]}')
+
+        failed = {step: row for step, row in results['steps'].items() if row['errors']}
+        if failed:
+            raise CommandError('Requests failed, so the timings above do not describe a working funnel: ' + ', '.join(
+                f'{step} {row["errors"]}/{row["requests"]}' for step, row in failed.items()
+            ))
+
+    def _funnel(self, client, rng, routes, timings):
+        """Walk one search-to-cancel funnel, recording (seconds, queries, ok) per step; True if it completed."""
+        flight_id, seat_class_id, departure_city, arrival_city, departure_time = rng.choice(routes)
+
+        def call(step, method, url, ok_status, **kwargs):
+            began = time.perf_counter()
+            response = getattr(client, method)(url, **kwargs)
+            elapsed = time.perf_counter() - began
+            match = QUERIES.search(response.get('Server-Timing', ''))
+            if timings is not None:
+                timings[step] = (elapsed, int(match.group(1)) if match else None,
+                                 response.status_code == ok_status)
+            return response if response.status_code == ok_status else None
+
+        call('search_flights', 'post', reverse('flights:search'), 200, data=json.dumps({
+            'departure_city': departure_city, 'arrival_city': arrival_city,
+            'departure_date': str(timezone.localtime(departure_time).date()), 'passengers': 1,
+        }), content_type='application/json')
+        call('flight_list', 'get', reverse('flights:list'), 200, data={'departure_city': departure_city})
+        call('flight_detail', 'get', reverse('flights:detail', args=[flight_id]), 200)
+
+        passengers = [{'first_name': 'Load', 'last_name': f'Tester{n}', 'dob': '1990-01-01', 'gender': 'O',
+                       'nationality': 'Test'} for n in range(rng.randint(1, MAX_PARTY))]
+        response = call('create_booking', 'post', reverse('bookings:create', args=[flight_id]), 302, data={
+            'seat_class': seat_class_id, 'passengers_data': json.dumps(passengers),
+        })
+        if response is None:
+            # Sold out since the routes were sampled: the form re-rendered with an error
+            return False
+        booking_id = resolve(response['Location']).kwargs['booking_id']
+
+        response = call('seat_map', 'get', reverse('flights:seat_map', args=[flight_id]), 200,
+                        data={'class': seat_class_id})
+        if response is not None:
+            seat_map = response.json()
+            bits = base64.b64decode(seat_map['available'])
+            free = [seat[0] for position, seat in enumerate(seat_map['seats']) if is_free(bits, position)]
+            passenger_ids = list(Passenger.objects.filter(booking_id=booking_id).values_list('id', flat=True))
+            if len(free) >= len(passenger_ids):
+                call('seat_selection', 'post', reverse('bookings:seat_selection', args=[booking_id]), 200,
+                     data=json.dumps({'seat_assignments': [
+                         {'passenger_id': passenger_id, 'seat_id': seat_id}
+                         for passenger_id, seat_id in zip(passenger_ids, rng.sample(free, len(passenger_ids)))
+                     ]}), content_type='application/json')
+
+        call('payment_view', 'post', reverse('bookings:payment', args=[booking_id]), 302,
+             data={'payment_method': 'credit_card'})
+        call('cancel_booking', 'get', reverse('bookings:cancel', args=[booking_id]), 302)
+        return True
+
+    def _results(self, samples, completed, elapsed, options):
+        try:
+            commit = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                                    cwd=settings.BASE_DIR).stdout.strip() or None
+        except OSError:
+            commit = None
+        steps = {}
+        for step in STEPS:
+            rows = samples[step]
+            if not rows:
+                continue
+            # Failed requests often return early, so only successful ones are timed
+            ok = [row for row in rows if row[2]]
+            latencies = sorted(row[0] * 1000 for row in ok)
+            queries = [row[1] for row in ok if row[1] is not None]
+            steps[step] = {
+                'requests': len(rows),
+                'errors': len(rows) - len(ok),
+                'p50_ms': round(statistics.median(latencies), 2) if latencies else None,
+                'p95_ms': round(percentile(latencies, 0.95), 2) if latencies else None,
+                'p99_ms': round(percentile(latencies, 0.99), 2) if latencies else None,
+                'avg_queries': round(statistics.mean(queries), 2) if queries else None,
+                'max_queries': max(queries) if queries else None,
+            }
+        requests = sum(step['requests'] for step in steps.values())
+        return {
+            'commit': commit,
+            'timestamp': datetime.now().astimezone().isoformat(timespec='seconds'),
+            'database': connection.vendor,
+            'users': options['users'],
+            'iterations': options['iterations'],
+            'seed': options['seed'],
+            'elapsed_s': round(elapsed, 2),
+            'requests': requests,
+            'throughput_rps': round(requests / elapsed, 1) if elapsed else None,
+            'funnels_completed': completed,
+            'funnels_per_s': round(completed / elapsed, 2) if elapsed else None,
+            'steps': steps,
+        }
+
+    def _report(self, results):
+        self.stdout.write(
+            f'{results["users"]} users x {results["iterations"]} funnels on {results["database"]} '
+            f'(commit {results["commit"] or "unknown"}): {results["requests"]} requests in {results["elapsed_s"]}s, '
+            f'{results["throughput_rps"]} req/s, {results["funnels_completed"]} funnels completed'
+        )
+        self.stdout.write(f'{"step":<16}{"reqs":>6}{"errors":>8}{"p50 ms":>9}{"p95 ms":>9}{"p99 ms":>9}{"queries":>9}')
+        for step, row in results['steps'].items():
+            queries = '-' if row['avg_queries'] is None else f'{row["avg_queries"]:g}'
+            p50, p95, p99 = ('-' if row[key] is None else f'{row[key]:.1f}' for key in ('p50_ms', 'p95_ms', 'p99_ms'))
+            line = f'{step:<16}{row["requests"]:>6}{row["errors"]:>8}{p50:>9}{p95:>9}{p99:>9}{queries:>9}'
+            self.stdout.write(self.style.ERROR(line + '  FAILING') if row['errors'] else line)
+
+    def _compare(self, previous, results):
+        self.stdout.write(f'Compared with commit {previous.get("commit") or "unknown"} ({previous.get("timestamp")}):')
+        for step, row in results['steps'].items():
+            before = previous.get('steps', {}).get(step)
+            if not before or before.get('p95_ms') is None or row['p95_ms'] is None:
+                continue
+            change = (row['p95_ms'] - before['p95_ms']) / before['p95_ms'] * 100 if before['p95_ms'] else 0
+            queries = ''
+            if row['avg_queries'] is not None and before.get('avg_queries') is not None:
+                queries = f', queries {before["avg_queries"]:g} -> {row["avg_queries"]:g}'
+            self.stdout.write(f'  {step:<16} p95 {before["p95_ms"]:.1f} -> {row["p95_ms"]:.1f} ms ({change:+.0f}%){queries}')
+        if previous.get('throughput_rps') and results['throughput_rps']:
+            self.stdout.write(f'  throughput {previous["throughput_rps"]} -> {results["throughput_rps"]} req/s')
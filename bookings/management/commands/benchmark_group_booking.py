@@ -0,0 +1,54 @@
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.db.models import F
+from django.test.utils import CaptureQueriesContext
+from flights.models import Flight, SeatClass
+from bookings import services
+from bookings.models import Booking
+import time
+
+class Command(BaseCommand):
+    help = 'Measure booking creation throughput for group bookings of different sizes'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sizes', type=str, default='1,9,50', help='Comma separated group sizes')
+        parser.add_argument('--iterations', type=int, default=20, help='Bookings created per group size')
+
+    def handle(self, *args, **options):
+        sizes = [int(size) for size in options['sizes'].split(',')]
+        seat_class = SeatClass.objects.select_related('flight').first()
+        if seat_class is None:
+            raise CommandError('No seat classes found; run populate_sample_data first')
+
+        # Lend the class enough capacity for the run; it is taken back afterwards
+        extra = sum(sizes) * options['iterations']
+        SeatClass.objects.filter(id=seat_class.id).update(available_seats=F('available_seats') + extra)
+        Flight.objects.filter(id=seat_class.flight_id).update(available_seats=F('available_seats') + extra)
+
+        user = get_user_model().objects.create_user(username=f'benchmark-{time.time_ns()}', password=None)
+        try:
+            for size in sizes:
+                passengers = [
+                    {'first_name': f'Passenger{i}', 'last_name': 'Benchmark', 'date_of_birth': '1990-01-01',
+                     'gender': 'O', 'nationality': 'Test'}
+                    for i in range(size)
+                ]
+                start = time.perf_counter()
+                with CaptureQueriesContext(connection) as queries:
+                    for _ in range(options['iterations']):
+                        services.create_booking(user, seat_class.flight, seat_class, passengers)
+                elapsed = time.perf_counter() - start
+
+                self.stdout.write(
+                    f'{size:>3} passengers: {options["iterations"] / elapsed:8.1f} bookings/s, '
+                    f'{size * options["iterations"] / elapsed:8.1f} passengers/s, '
+                    f'{len(queries) / options["iterations"]:.0f} queries per booking'
+                )
+        finally:
+            # Hand the seats back before removing the synthetic bookings
+            for booking in Booking.objects.filter(user=user):
+                services.cancel_and_release(booking)
+            user.delete()
+            SeatClass.objects.filter(id=seat_class.id).update(available_seats=F('available_seats') - extra)
+            Flight.objects.filter(id=seat_class.flight_id).update(available_seats=F('available_seats') - extra)
@@ -0,0 +1,50 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Count, IntegerField, OuterRef, Subquery, Sum
+from django.db.models.functions import Coalesce
+from flights import page_cache
+from flights.models import Flight, Seat, SeatClass
+from bookings.models import Passenger
+
+# Bookings in these states hold inventory
+HELD_STATUSES = ['pending', 'confirmed', 'completed']
+
+class Command(BaseCommand):
+    help = 'Recompute Flight and SeatClass available_seats counters from Seat rows and active bookings'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--flight', type=int, action='append', help='Only reconcile these flight ids')
+
+    def handle(self, *args, **options):
+        seat_classes = SeatClass.objects.all()
+        flights = Flight.objects.all()
+        if options['flight']:
+            seat_classes = seat_classes.filter(flight_id__in=options['flight'])
+            flights = flights.filter(id__in=options['flight'])
+
+        total_seats = Seat.objects.filter(seat_class=OuterRef('pk')).order_by().values('seat_class').annotate(
+            n=Count('id')
+        ).values('n')
+        held_seats = Passenger.objects.filter(
+            booking__seat_class=OuterRef('pk'),
+            booking__status__in=HELD_STATUSES
+        ).order_by().values('booking__seat_class').annotate(n=Count('id')).values('n')
+        class_totals = SeatClass.objects.filter(flight=OuterRef('pk')).order_by().values('flight').annotate(
+            n=Sum('available_seats')
+        ).values('n')
+
+        with transaction.atomic():
+            # Classes without Seat rows (created by hand in the admin) keep their counter
+            class_count = seat_classes.filter(id__in=Seat.objects.values('seat_class_id')).update(
+                available_seats=Subquery(total_seats, output_field=IntegerField())
+                - Coalesce(Subquery(held_seats, output_field=IntegerField()), 0)
+            )
+            flight_count = flights.filter(id__in=SeatClass.objects.values('flight_id')).update(
+                available_seats=Subquery(class_totals, output_field=IntegerField())
+            )
+            # The counters moved without signals, so cached pages would keep showing the old ones
+            transaction.on_commit(page_cache.invalidate_all)
+
+        self.stdout.write(
+            self.style.SUCCESS(f'Reconciled {class_count} seat classes and {flight_count} flights')
+        )
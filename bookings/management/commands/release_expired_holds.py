@@ -0,0 +1,23 @@
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+from bookings.holds import release_expired_holds
+import time
+
+class Command(BaseCommand):
+    help = ('Cancel pending bookings whose seat hold has expired and release their seats '
+            '(run from cron, or with --interval as a worker)')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000, help='Holds released per transaction')
+        parser.add_argument('--interval', type=float, default=0,
+                            help='Keep running, sweeping every N seconds (0: sweep once and exit)')
+
+    def handle(self, *args, **options):
+        while True:
+            released = release_expired_holds(batch_size=options['batch_size'])
+            if released or not options['interval']:
+                self.stdout.write(self.style.SUCCESS(f'Released {released} expired seat holds'))
+            if not options['interval']:
+                return
+            time.sleep(options['interval'])
+            close_old_connections()
@@ -0,0 +1,35 @@
+from collections import Counter
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+from bookings.notifications import deliver_batch
+import time
+
+class Command(BaseCommand):
+    help = 'Deliver queued booking notifications in batches (run from cron, or with --interval as a worker)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=100, help='Notifications claimed and sent per batch')
+        parser.add_argument('--interval', type=float, default=0,
+                            help='Keep running, polling the outbox every N seconds once it is drained (0: drain once and exit)')
+
+    def handle(self, *args, **options):
+        while True:
+            totals = self.drain(options['batch_size'])
+            if totals or not options['interval']:
+                self.stdout.write(self.style.SUCCESS(
+                    f"Sent {totals['sent']} notifications; {totals['skipped']} skipped (no email), "
+                    f"{totals['failed']} failed attempts"
+                ))
+            if not options['interval']:
+                return
+            time.sleep(options['interval'])
+            close_old_connections()
+
+    def drain(self, batch_size):
+        totals = Counter()
+        while outcomes := deliver_batch(batch_size):
+            totals.update(outcomes)
+            if not outcomes['sent'] and not outcomes['skipped']:
+                # Nothing got through (mail server down?); the failures are backed off, so stop rather than spinning
+                break
+        return totals
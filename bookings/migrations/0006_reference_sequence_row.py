@@ -0,0 +1,21 @@
+from django.db import migrations
+
+# bookings.references.SEQUENCE_NAME, copied so the migration doesn't change if the module does
+SEQUENCE_NAME = 'booking_reference'
+
+
+def create_sequence(apps, schema_editor):
+    # Created here so the first bookings never race to insert the row
+    ReferenceSequence = apps.get_model('bookings', 'ReferenceSequence')
+    ReferenceSequence.objects.get_or_create(name=SEQUENCE_NAME)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bookings', '0005_notification'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_sequence, migrations.RunPython.noop),
+    ]
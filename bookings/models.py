@@ -1,5 +1,6 @@
 from django.db import models
 from django.conf import settings
+from django.utils import timezone
 from flights.models import Flight, Seat, SeatClass
 
 class Booking(models.Model):
@@ -19,16 +20,27 @@ class Booking(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
     
+    class Meta:
+        indexes = [
+            models.Index(fields=['user', 'created_at'], name='booking_user_created_idx'),
+        ]
+    
     def save(self, *args, **kwargs):
         if not self.booking_reference:
-            import random
-            import string
-            self.booking_reference = ''.join(random.choices(string.ascii_uppercase + string.digits, k=6))
+            from .references import allocate_reference
+            self.booking_reference = allocate_reference()
         super().save(*args, **kwargs)
     
     def __str__(self):
         return f"Booking {self.booking_reference} - {self.user.username}"
 
+class ReferenceSequence(models.Model):
+    name = models.CharField(max_length=50, unique=True)
+    next_value = models.BigIntegerField(default=1)
+    
+    def __str__(self):
+        return f"{self.name}: {self.next_value}"
+
 class Passenger(models.Model):
     GENDER_CHOICES = [
         ('M', 'Male'),
@@ -82,3 +94,53 @@ class Baggage(models.Model):
     
     def __str__(self):
         return f"Baggage for {self.passenger}"
+
+class SeatHold(models.Model):
+    booking = models.OneToOneField(Booking, related_name='seat_hold', on_delete=models.CASCADE)
+    flight = models.ForeignKey(Flight, related_name='seat_holds', on_delete=models.CASCADE)
+    seat_class = models.ForeignKey(SeatClass, related_name='seat_holds', on_delete=models.CASCADE)
+    seats = models.IntegerField()
+    expires_at = models.DateTimeField()
+    created_at = models.DateTimeField(auto_now_add=True)
+    
+    class Meta:
+        indexes = [
+            models.Index(fields=['expires_at'], name='seathold_expires_idx'),
+            models.Index(fields=['flight', 'expires_at'], name='seathold_flight_expires_idx'),
+        ]
+    
+    def __str__(self):
+        return f"Hold for {self.booking.booking_reference} until {self.expires_at}"
+
+class Notification(models.Model):
+    """Outbox row for a message to a booking's customer, delivered in batches by send_notifications."""
+    KIND_CHOICES = [
+        ('flight_status', 'Flight Status Change'),
+    ]
+    
+    STATUS_CHOICES = [
+        ('pending', 'Pending'),
+        ('sent', 'Sent'),
+        ('skipped', 'Skipped'),
+        ('failed', 'Failed'),
+    ]
+    
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE)
+    booking = models.ForeignKey(Booking, related_name='notifications', on_delete=models.CASCADE)
+    kind = models.CharField(max_length=20, choices=KIND_CHOICES)
+    payload = models.JSONField(default=dict)
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='pending')
+    attempts = models.PositiveSmallIntegerField(default=0)
+    last_error = models.TextField(blank=True)
+    # Not claimed again before this; pushed back while a worker is sending it and after each failed attempt
+    next_attempt_at = models.DateTimeField(default=timezone.now)
+    created_at = models.DateTimeField(auto_now_add=True)
+    sent_at = models.DateTimeField(null=True, blank=True)
+    
+    class Meta:
+        indexes = [
+            models.Index(fields=['status', 'next_attempt_at'], name='notification_due_idx'),
+        ]
+    
+    def __str__(self):
+        return f"{self.get_kind_display()} for {self.booking.booking_reference} ({self.status})"
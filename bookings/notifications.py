@@ -0,0 +1,153 @@
+import logging
+from collections import Counter, defaultdict
+from datetime import datetime, timedelta
+from itertools import islice
+from django.conf import settings
+from django.core.mail import EmailMessage, get_connection
+from django.db import connection, transaction
+from django.db.models import F
+from django.utils import timezone
+from .models import Notification, Passenger
+
+logger = logging.getLogger(__name__)
+
+# Flight statuses customers hear about; departed and arrived are operational only
+NOTIFIED_FLIGHT_STATUSES = ['scheduled', 'delayed', 'cancelled']
+
+FLIGHT_STATUS_MESSAGES = {
+    'scheduled': 'is back on schedule.',
+    'delayed': 'is delayed. We will let you know the new departure time as soon as it is confirmed.',
+    'cancelled': 'has been cancelled, and booking {booking_reference} with it. '
+                 'Contact us to be rebooked or refunded.',
+}
+
+
+def max_attempts():
+    return getattr(settings, 'NOTIFICATION_MAX_ATTEMPTS', 5)
+
+
+def retry_delay(attempts):
+    """How long to wait before retrying a notification that has failed `attempts` times."""
+    return timedelta(seconds=getattr(settings, 'NOTIFICATION_RETRY_DELAY', 60) * 2 ** (attempts - 1))
+
+
+def enqueue_flight_status(bookings, flights, status, chunk_size=1000):
+    """Queue one notification per booking in `bookings` about its flight's new status.
+
+    `flights` maps flight ids to their Flight. Bookings are read a chunk at a
+    time, with one passenger query and one bulk INSERT per chunk, so a fleet
+    of cancellations costs a few statements per thousand bookings rather than
+    several per booking. Returns the number queued.
+    """
+    if status not in NOTIFIED_FLIGHT_STATUSES:
+        return 0
+    rows = bookings.order_by('id').values_list('id', 'user_id', 'flight_id', 'booking_reference').iterator(
+        chunk_size=chunk_size
+    )
+    queued = 0
+    while chunk := list(islice(rows, chunk_size)):
+        passengers = defaultdict(list)
+        for booking_id, first_name, last_name in Passenger.objects.filter(
+            booking_id__in=[row[0] for row in chunk]
+        ).order_by('id').values_list('booking_id', 'first_name', 'last_name'):
+            passengers[booking_id].append(f'{first_name} {last_name}')
+        Notification.objects.bulk_create([
+            Notification(
+                user_id=user_id,
+                booking_id=booking_id,
+                kind='flight_status',
+                payload={
+                    'booking_reference': booking_reference,
+                    'flight_number': flights[flight_id].flight_number,
+                    'departure_time': flights[flight_id].departure_time.isoformat(),
+                    'status': status,
+                    'passengers': passengers[booking_id],
+                }
+            )
+            for booking_id, user_id, flight_id, booking_reference in chunk
+        ])
+        queued += len(chunk)
+    return queued
+
+
+def render(notification):
+    """(subject, body) of the email for a notification."""
+    payload = notification.payload
+    departure = timezone.localtime(datetime.fromisoformat(payload['departure_time']))
+    subject = f"Flight {payload['flight_number']} on {departure:%d %b %Y}: {payload['status']}"
+    lines = [
+        f"Flight {payload['flight_number']} departing {departure:%d %b %Y %H:%M} "
+        + FLIGHT_STATUS_MESSAGES[payload['status']].format(**payload),
+        '',
+        f"Booking reference: {payload['booking_reference']}",
+    ]
+    if payload['passengers']:
+        lines.append(f"Passengers: {', '.join(payload['passengers'])}")
+    return subject, '\n'.join(lines)
+
+
+def _claim(batch_size):
+    """Lease up to `batch_size` due notifications to this worker and return them.
+
+    Counting the attempt and pushing next_attempt_at past the claim timeout
+    happen in one short transaction, so the row locks are gone before any
+    mail is sent and other workers skip the leased rows until then. A worker
+    that dies mid-batch leaves its rows to be picked up once the lease runs out.
+    """
+    now = timezone.now()
+    with transaction.atomic():
+        due = Notification.objects.filter(status='pending', next_attempt_at__lte=now).order_by('next_attempt_at', 'id')
+        if connection.features.has_select_for_update_skip_locked:
+            # Concurrent workers each take different rows instead of queueing behind one another
+            due = due.select_for_update(skip_locked=True)
+        else:
+            due = due.select_for_update()
+        ids = list(due.values_list('id', flat=True)[:batch_size])
+        Notification.objects.filter(id__in=ids).update(
+            attempts=F('attempts') + 1,
+            next_attempt_at=now + timedelta(seconds=getattr(settings, 'NOTIFICATION_CLAIM_TIMEOUT', 300)),
+        )
+    return list(Notification.objects.filter(id__in=ids).select_related('user').order_by('id'))
+
+
+def deliver_batch(batch_size=100):
+    """Send up to `batch_size` due notifications over one mail connection.
+
+    The batch is claimed and committed before the first message goes out, so
+    no row locks are held while talking to the mail server. Outcomes are
+    written back with one UPDATE for the sent rows and one for the skipped
+    ones; a failure is retried after NOTIFICATION_RETRY_DELAY, doubling with
+    each attempt, until it has been tried NOTIFICATION_MAX_ATTEMPTS times.
+    Returns a Counter of outcomes, empty once nothing is due.
+    """
+    outcomes = Counter()
+    notifications = _claim(batch_size)
+    if not notifications:
+        return outcomes
+    sent, skipped, failed = [], [], []
+    with get_connection() as mail:
+        for notification in notifications:
+            if not notification.user.email:
+                skipped.append(notification.id)
+                continue
+            subject, body = render(notification)
+            try:
+                mail.send_messages([EmailMessage(subject, body, to=[notification.user.email])])
+            except Exception as exc:
+                logger.warning('Could not send notification %d: %s', notification.id, exc)
+                failed.append((notification, str(exc)))
+            else:
+                sent.append(notification.id)
+
+    now = timezone.now()
+    Notification.objects.filter(id__in=sent).update(status='sent', sent_at=now)
+    Notification.objects.filter(id__in=skipped).update(status='skipped')
+    for notification, error in failed:
+        Notification.objects.filter(id=notification.id).update(
+            status='failed' if notification.attempts >= max_attempts() else 'pending',
+            last_error=error,
+            next_attempt_at=now + retry_delay(notification.attempts),
+        )
+
+    outcomes.update(sent=len(sent), skipped=len(skipped), failed=len(failed))
+    return outcomes
@@ -0,0 +1,334 @@
+import json
+from collections import Counter
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Count, F
+from django.utils import timezone
+from flights import connections, fare_calendar, fares, page_cache, popularity, seatmap
+from flights.models import Flight, Seat, SeatClass
+from . import notifications, summary
+from .forms import PassengerForm
+from .holds import create_hold, release_expired_holds, release_hold, return_seats
+from .models import Booking, Passenger, SeatHold
+from .references import allocate_reference
+
+ACTIVE_BOOKING_STATUSES = ['pending', 'confirmed']
+
+
+class SeatAssignmentError(Exception):
+    pass
+
+
+class InventoryError(Exception):
+    pass
+
+
+class PassengerDataError(Exception):
+    pass
+
+
+# Keys the booking page sends that differ from the Passenger field names
+PASSENGER_FIELD_ALIASES = {'dob': 'date_of_birth', 'passport': 'passport_number'}
+PASSENGER_DEFAULTS = {'date_of_birth': '1990-01-01', 'gender': 'M', 'passport_number': '', 'nationality': 'Unknown'}
+
+
+def parse_passengers(passengers_data):
+    """Validate raw passengers_data (a JSON string or list) into unsaved Passenger objects.
+
+    Everything is checked before any row is written, so a bad entry can never
+    leave a half-created booking behind. An empty list means "no passenger
+    details given" and is returned as is.
+    """
+    if isinstance(passengers_data, str):
+        try:
+            passengers_data = json.loads(passengers_data or '[]')
+        except json.JSONDecodeError:
+            raise PassengerDataError('Passenger details could not be read.')
+    if not isinstance(passengers_data, list):
+        raise PassengerDataError('Passenger details could not be read.')
+    limit = getattr(settings, 'MAX_PASSENGERS_PER_BOOKING', 50)
+    if len(passengers_data) > limit:
+        raise PassengerDataError(f'A booking can have at most {limit} passengers.')
+
+    passengers = []
+    for number, raw in enumerate(passengers_data, start=1):
+        if not isinstance(raw, dict):
+            raise PassengerDataError(f'Passenger {number}: details could not be read.')
+        data = dict(PASSENGER_DEFAULTS)
+        for key, value in raw.items():
+            if value not in (None, ''):
+                data[PASSENGER_FIELD_ALIASES.get(key, key)] = value
+        form = PassengerForm(data=data)
+        if not form.is_valid():
+            field, errors = next(iter(form.errors.items()))
+            raise PassengerDataError(f'Passenger {number}: {field.replace("_", " ")} - {errors[0]}')
+        passengers.append(form.save(commit=False))
+    return passengers
+
+
+def create_booking(user, flight, seat_class, passengers_data):
+    """Create a pending booking with its passengers, inventory and hold in one transaction."""
+    passengers = parse_passengers(passengers_data)
+    if not passengers:
+        # Create a default passenger if no data provided
+        passengers = [Passenger(
+            first_name=user.first_name or 'Guest',
+            last_name=user.last_name or 'User',
+            **PASSENGER_DEFAULTS
+        )]
+
+    booking = Booking(
+        user=user,
+        # Allocated before the transaction so it comes from the per-process block
+        booking_reference=allocate_reference(),
+        flight=flight,
+        seat_class=seat_class,
+        total_amount=fares.booking_total(flight, seat_class, len(passengers))
+    )
+    with transaction.atomic():
+        reserve_inventory(flight.id, seat_class.id, len(passengers))
+        booking.save()
+        for passenger in passengers:
+            passenger.booking = booking
+        Passenger.objects.bulk_create(passengers)
+        create_hold(booking, len(passengers))
+    return booking
+
+
+def _decrement_inventory(flight_id, seat_class_id, count):
+    updated = Flight.objects.filter(
+        id=flight_id, available_seats__gte=count
+    ).update(available_seats=F('available_seats') - count)
+    if not updated:
+        raise InventoryError('Not enough seats left on this flight.')
+    updated = SeatClass.objects.filter(
+        id=seat_class_id, flight_id=flight_id, available_seats__gte=count
+    ).update(available_seats=F('available_seats') - count)
+    if not updated:
+        raise InventoryError('Not enough seats left in this class.')
+
+
+def reserve_inventory(flight_id, seat_class_id, count):
+    """Decrement the flight and class seat counters, or raise if either would go negative.
+
+    If the flight looks sold out, expired holds on it are released and the
+    decrement retried once, so customers never wait on the sweeper.
+    """
+    try:
+        with transaction.atomic():
+            _decrement_inventory(flight_id, seat_class_id, count)
+    except InventoryError:
+        if not release_expired_holds(flight_id=flight_id):
+            raise
+        with transaction.atomic():
+            _decrement_inventory(flight_id, seat_class_id, count)
+    fare_calendar.inventory_changed({seat_class_id: 0})
+    page_cache.invalidate_flights(flight_id)
+
+
+def release_inventory(flight_id, seat_class_id, count):
+    Flight.objects.filter(id=flight_id).update(available_seats=F('available_seats') + count)
+    SeatClass.objects.filter(id=seat_class_id).update(available_seats=F('available_seats') + count)
+    fare_calendar.inventory_changed({seat_class_id: count})
+    page_cache.invalidate_flights(flight_id)
+
+
+def cancel_and_release(booking):
+    """Cancel an active booking and hand its seats back to inventory.
+
+    Returns False if the booking was not in a cancellable state. The status
+    change is a conditional UPDATE so two concurrent cancels release once.
+    """
+    with transaction.atomic():
+        now = timezone.now()
+        was_confirmed = Booking.objects.filter(
+            id=booking.id, status='confirmed'
+        ).update(status='cancelled', updated_at=now)
+        if was_confirmed:
+            popularity.adjust_for_flight(booking.flight_id, bookings=-1)
+        elif not Booking.objects.filter(
+            id=booking.id, status='pending'
+        ).update(status='cancelled', updated_at=now):
+            return False
+        summary.invalidate(booking.user_id)
+
+        release_hold(booking)
+        passengers = booking.passengers.all()
+        release_inventory(booking.flight_id, booking.seat_class_id, passengers.count())
+        seat_ids = list(passengers.filter(seat__isnull=False).values_list('seat_id', flat=True))
+        Seat.objects.filter(id__in=seat_ids).update(is_available=True)
+        seatmap.mark_seats(booking.flight_id, seat_ids, available=True)
+
+    booking.status = 'cancelled'
+    return True
+
+
+def assign_seats(booking, seat_assignments):
+    """Claim every requested seat for a booking in one transaction.
+
+    Seats are claimed with a single conditional UPDATE; if any seat was already
+    taken the rowcount comes up short and the whole assignment is rolled back,
+    so two concurrent requests can never both hold the same seat.
+    """
+    try:
+        wanted = {int(a['passenger_id']): int(a['seat_id']) for a in seat_assignments}
+    except (KeyError, TypeError, ValueError):
+        raise SeatAssignmentError('Invalid seat assignment data.')
+    if not wanted:
+        return []
+    seat_ids = set(wanted.values())
+    if len(seat_ids) != len(wanted):
+        raise SeatAssignmentError('Each passenger needs a different seat.')
+
+    if booking.status not in ACTIVE_BOOKING_STATUSES:
+        raise SeatAssignmentError('Seats can only be selected for active bookings.')
+    if SeatHold.objects.filter(booking=booking, expires_at__lte=timezone.now()).exists():
+        raise SeatAssignmentError('Your seat hold has expired. Please book again.')
+
+    with transaction.atomic():
+        passengers = list(Passenger.objects.select_for_update().filter(booking=booking, id__in=wanted.keys()))
+        if len(passengers) != len(wanted):
+            raise SeatAssignmentError('Unknown passenger for this booking.')
+
+        # Seats these passengers hold already are theirs to keep or swap between them
+        held = {p.seat_id for p in passengers if p.seat_id}
+        try:
+            _claim_seats(booking, seat_ids, held)
+        except SeatAssignmentError:
+            # Seats held by expired bookings are free; release them and try once more
+            if not release_expired_holds(flight_id=booking.flight_id):
+                raise
+            _claim_seats(booking, seat_ids, held)
+
+        # Release seats the passengers held before this reassignment
+        previous_seats = {p.seat_id for p in passengers if p.seat_id and p.seat_id not in seat_ids}
+        if previous_seats:
+            Seat.objects.filter(id__in=previous_seats).update(is_available=True)
+            seatmap.mark_seats(booking.flight_id, previous_seats, available=True)
+        seatmap.mark_seats(booking.flight_id, seat_ids, available=False)
+
+        for passenger in passengers:
+            passenger.seat_id = wanted[passenger.id]
+        Passenger.objects.bulk_update(passengers, ['seat'])
+
+    return passengers
+
+
+def _claim_seats(booking, seat_ids, held=()):
+    with transaction.atomic():
+        # Only seats in the booking's own class on its flight can be claimed
+        seats = Seat.objects.filter(id__in=seat_ids, flight_id=booking.flight_id, seat_class_id=booking.seat_class_id)
+        claimed = seats.exclude(id__in=held).filter(is_available=True).update(is_available=False)
+        kept = seats.filter(id__in=held).count() if held else 0
+        if claimed + kept != len(seat_ids):
+            raise SeatAssignmentError('One or more selected seats are no longer available.')
+
+
+def confirm_booking(booking):
+    """Mark a paid booking confirmed and drop its hold.
+
+    Returns False if the booking is no longer pending or its hold had already
+    expired and the booking was released.
+    """
+    with transaction.atomic():
+        # Judge by the locked row, not the caller's copy: a hold sweep or cancel may have
+        # released the booking since it was loaded, and must wait for us until we commit
+        status = Booking.objects.select_for_update().filter(id=booking.id).values_list('status', flat=True).first()
+        if status != 'pending':
+            return False
+        if SeatHold.objects.filter(booking=booking, expires_at__lte=timezone.now()).exists():
+            release_expired_holds(flight_id=booking.flight_id)
+            return False
+        # Conditional too, for backends where select_for_update() does not lock (SQLite)
+        if not Booking.objects.filter(id=booking.id, status='pending').update(
+            status='confirmed', updated_at=timezone.now()
+        ):
+            return False
+        release_hold(booking)
+        summary.invalidate(booking.user_id)
+        popularity.adjust_for_flight(booking.flight_id, bookings=1)
+    booking.status = 'confirmed'
+    return True
+
+
+def _cancel_flight_bookings(bookings, now):
+    """Cancel `bookings` (a queryset) and hand their seats back in a fixed number of statements."""
+    passengers = Passenger.objects.filter(booking__in=bookings)
+    flight_seats = Counter()
+    class_seats = Counter()
+    for flight_id, seat_class_id, count in passengers.order_by().values_list(
+        'booking__flight_id', 'booking__seat_class_id'
+    ).annotate(n=Count('id')):
+        flight_seats[flight_id] += count
+        class_seats[seat_class_id] += count
+    confirmed = bookings.filter(status='confirmed').order_by().values_list('flight__arrival_airport_id').annotate(
+        n=Count('id')
+    )
+    user_ids = list(bookings.order_by().values_list('user_id', flat=True).distinct())
+
+    Seat.objects.filter(id__in=passengers.filter(seat__isnull=False).values('seat_id')).update(is_available=True)
+    SeatHold.objects.filter(booking__in=bookings).delete()
+    for airport_id, count in confirmed:
+        popularity.adjust(airport_id, bookings=-count)
+    cancelled = bookings.update(status='cancelled', updated_at=now)
+    return_seats(flight_seats, class_seats)
+    summary.invalidate(*user_ids)
+    for flight_id in flight_seats:
+        transaction.on_commit(lambda pk=flight_id: seatmap.invalidate(pk))
+    return cancelled
+
+
+def change_flight_status(flight_ids, status):
+    """Move many flights to `status` with one UPDATE and cascade the change to their bookings.
+
+    Active bookings on the changed flights are found with set-based queries
+    and each gets a notification in the outbox (see bookings.notifications),
+    sent later by the send_notifications worker. Cancelling flights also
+    cancels those bookings and releases their seats. The statement count
+    does not grow with the number of bookings. Flights already in `status` are
+    left alone. Returns counts of flights changed, bookings cancelled and
+    notifications queued.
+    """
+    now = timezone.now()
+    with transaction.atomic():
+        flights = {
+            flight.id: flight
+            for flight in Flight.objects.select_for_update().filter(id__in=flight_ids).exclude(status=status).only(
+                'id', 'flight_number', 'status', 'departure_airport_id', 'arrival_airport_id',
+                'departure_time', 'arrival_time', 'base_price', 'available_seats'
+            )
+        }
+        result = {'flights': len(flights), 'bookings_cancelled': 0, 'notifications': 0}
+        if not flights:
+            return result
+        Flight.objects.filter(id__in=flights).update(status=status)
+
+        bookings = Booking.objects.filter(flight_id__in=flights, status__in=ACTIVE_BOOKING_STATUSES)
+        result['notifications'] = notifications.enqueue_flight_status(bookings, flights, status)
+        if status == 'cancelled':
+            result['bookings_cancelled'] = _cancel_flight_bookings(bookings, now)
+
+        # QuerySet.update skips the Flight signals, so apply what they would have done once per batch
+        arrivals = Counter()
+        route_days = {}
+        for flight in flights.values():
+            # Cancelled flights don't count towards a destination's popularity
+            if flight.status == 'cancelled':
+                arrivals[flight.arrival_airport_id] += 1
+            if status == 'cancelled':
+                arrivals[flight.arrival_airport_id] -= 1
+            flight.status = status
+            day = timezone.localtime(flight.departure_time).date()
+            route_days[(flight.departure_airport_id, flight.arrival_airport_id, day)] = flight.departure_time
+        for airport_id, delta in arrivals.items():
+            popularity.adjust(airport_id, flights=delta)
+        for (departure_airport_id, arrival_airport_id, _), departure_time in route_days.items():
+            fare_calendar.schedule_refresh(departure_airport_id, arrival_airport_id, departure_time)
+        transaction.on_commit(lambda: _flights_changed(flights.values()))
+    return result
+
+
+def _flights_changed(flights):
+    for flight in flights:
+        connections.graphs.update_flight(flight)
+    page_cache.invalidate_all()
@@ -0,0 +1,9 @@
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from . import summary
+from .models import Booking
+
+
+@receiver([post_save, post_delete], sender=Booking)
+def invalidate_booking_summary(sender, instance, **kwargs):
+    summary.invalidate(instance.user_id)
@@ -0,0 +1,44 @@
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Count, Q
+from django.utils import timezone
+from flights.page_cache import get_cache
+from .models import Booking
+
+SUMMARY_KEY = 'bookings:summary:{}'
+
+
+def _timeout():
+    return getattr(settings, 'DASHBOARD_SUMMARY_TIMEOUT', 300)
+
+
+def build_summary(user_id):
+    """Every dashboard counter for one user in a single aggregate query."""
+    return Booking.objects.filter(user_id=user_id).aggregate(
+        total_bookings=Count('id'),
+        upcoming_trips=Count('id', filter=Q(status='confirmed', flight__departure_time__gte=timezone.now())),
+        pending_bookings=Count('id', filter=Q(status='pending')),
+        cancelled_bookings=Count('id', filter=Q(status='cancelled')),
+    )
+
+
+def booking_summary(user_id):
+    # Cached per user when DASHBOARD_SUMMARY_TIMEOUT is set; the timeout also
+    # bounds how long a departed trip keeps counting as upcoming
+    timeout = _timeout()
+    if not timeout:
+        return build_summary(user_id)
+    cache = get_cache()
+    key = SUMMARY_KEY.format(user_id)
+    summary = cache.get(key)
+    if summary is None:
+        summary = build_summary(user_id)
+        cache.set(key, summary, timeout)
+    return summary
+
+
+def invalidate(*user_ids):
+    """Drop cached summaries once the current transaction commits."""
+    user_ids = set(user_ids)
+    if user_ids and _timeout():
+        transaction.on_commit(lambda: get_cache().delete_many([SUMMARY_KEY.format(pk) for pk in user_ids]))
@@ -1,3 +1,316 @@
-from django.test import TestCase
+import threading
+from datetime import timedelta
+from decimal import Decimal
+from unittest import mock
+from django.contrib.auth import get_user_model
+from django.core import mail
+from django.core.cache import cache
+from django.db import connection, connections
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+from flights.models import Flight, Seat, SeatClass
+from flights.test_utils import make_flight
+from .holds import release_expired_holds
+from .models import Booking, Notification, Passenger, ReferenceSequence, SeatHold
+from . import notifications, references, services
 
-# Create your tests here.
+
+class DashboardTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.flight = make_flight(timezone.now() + timedelta(days=3), economy=100)
+        cls.seat_class = cls.flight.economy
+        cls.user = get_user_model().objects.create_user(username='traveller', password='secret')
+
+    def setUp(self):
+        cache.clear()
+        self.client.force_login(self.user)
+
+    def add_bookings(self, count, status='confirmed'):
+        first = Booking.objects.count()
+        return Booking.objects.bulk_create([
+            Booking(user=self.user, flight=self.flight, seat_class=self.seat_class, total_amount=Decimal('100.00'),
+                    status=status, booking_reference=f'TEST{first + i:05d}')
+            for i in range(count)
+        ])
+
+    def dashboard_queries(self):
+        with self.assertNumQueries(4):
+            response = self.client.get(reverse('dashboard'))
+        self.assertEqual(response.status_code, 200)
+        return response
+
+    @override_settings(DASHBOARD_SUMMARY_TIMEOUT=0)
+    def test_query_count_does_not_grow_with_history(self):
+        # Session, user, the summary aggregate and the recent bookings
+        self.add_bookings(1)
+        self.dashboard_queries()
+        self.add_bookings(40)
+        self.add_bookings(10, status='cancelled')
+        response = self.dashboard_queries()
+        self.assertEqual(response.context['total_bookings'], 51)
+        self.assertEqual(response.context['upcoming_trips'], 41)
+
+    def test_cached_summary_skips_the_aggregate(self):
+        self.add_bookings(3)
+        self.dashboard_queries()
+        with self.assertNumQueries(3):
+            self.client.get(reverse('dashboard'))
+
+    def test_status_change_invalidates_cached_summary(self):
+        booking = self.add_bookings(2)[0]
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.get(reverse('dashboard'))
+        self.assertEqual(response.context['upcoming_trips'], 2)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            services.cancel_and_release(booking)
+        response = self.client.get(reverse('dashboard'))
+        self.assertEqual(response.context['total_bookings'], 2)
+        self.assertEqual(response.context['upcoming_trips'], 1)
+
+
+class ReferenceSequenceTests(TestCase):
+    def test_sequence_row_comes_from_the_migrations(self):
+        sequence = ReferenceSequence.objects.get(name=references.SEQUENCE_NAME)
+        self.assertEqual(references.reserve_block(10), sequence.next_value)
+        self.assertEqual(references.reserve_block(1), sequence.next_value + 10)
+
+
+class ConfirmBookingTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.flight = make_flight(timezone.now() + timedelta(days=3), economy=100)
+        cls.seat_class = cls.flight.economy
+        cls.user = get_user_model().objects.create_user(username='traveller', password='secret')
+
+    def test_stale_booking_released_by_the_sweeper_is_not_confirmed(self):
+        booking = services.create_booking(self.user, self.flight, self.seat_class, [])
+        SeatHold.objects.filter(booking=booking).update(expires_at=timezone.now() - timedelta(minutes=1))
+        self.assertEqual(release_expired_holds(), 1)
+        # `booking` still says pending in memory
+        self.assertFalse(services.confirm_booking(booking))
+        booking.refresh_from_db()
+        self.assertEqual(booking.status, 'cancelled')
+        self.flight.refresh_from_db()
+        self.assertEqual(self.flight.available_seats, 100)
+
+    def test_confirming_twice_counts_once(self):
+        booking = services.create_booking(self.user, self.flight, self.seat_class, [])
+        stale = Booking.objects.get(id=booking.id)
+        self.assertTrue(services.confirm_booking(booking))
+        self.assertFalse(services.confirm_booking(stale))
+        self.assertEqual(Booking.objects.get(id=booking.id).status, 'confirmed')
+        self.assertFalse(SeatHold.objects.filter(booking=booking).exists())
+
+
+class SeatAssignmentTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.flight = make_flight(timezone.now() + timedelta(days=3), economy=90)
+        cls.seat_class = cls.flight.economy
+        cls.business = SeatClass.objects.create(flight=cls.flight, class_type='business', available_seats=10,
+                                                baggage_allowance=32)
+        cls.seats = Seat.objects.bulk_create([
+            Seat(flight=cls.flight, seat_class=cls.seat_class, seat_number=f'E1{letter}') for letter in 'ABC'
+        ] + [Seat(flight=cls.flight, seat_class=cls.business, seat_number='B1A')])
+        cls.user = get_user_model().objects.create_user(username='traveller', password='secret')
+
+    def setUp(self):
+        self.booking = services.create_booking(self.user, self.flight, self.seat_class, [
+            {'first_name': 'Ada', 'last_name': 'One'}, {'first_name': 'Bo', 'last_name': 'Two'}
+        ])
+        self.first, self.second = self.booking.passengers.order_by('id')
+
+    def assign(self, *pairs):
+        return services.assign_seats(self.booking, [
+            {'passenger_id': passenger.id, 'seat_id': seat.id} for passenger, seat in pairs
+        ])
+
+    def seat_of(self, passenger):
+        return Passenger.objects.get(id=passenger.id).seat_id
+
+    def test_resubmitting_the_same_seats_succeeds(self):
+        self.assign((self.first, self.seats[0]), (self.second, self.seats[1]))
+        self.assign((self.first, self.seats[0]), (self.second, self.seats[1]))
+        self.assertEqual(self.seat_of(self.first), self.seats[0].id)
+        self.assertEqual(Seat.objects.filter(is_available=False).count(), 2)
+
+    def test_passengers_can_swap_seats(self):
+        self.assign((self.first, self.seats[0]), (self.second, self.seats[1]))
+        self.assign((self.first, self.seats[1]), (self.second, self.seats[0]))
+        self.assertEqual(self.seat_of(self.first), self.seats[1].id)
+        self.assertEqual(self.seat_of(self.second), self.seats[0].id)
+        self.assertEqual(Seat.objects.filter(is_available=False).count(), 2)
+
+    def test_moving_to_a_new_seat_releases_the_old_one(self):
+        self.assign((self.first, self.seats[0]))
+        self.assign((self.first, self.seats[2]))
+        self.assertTrue(Seat.objects.get(id=self.seats[0].id).is_available)
+        self.assertFalse(Seat.objects.get(id=self.seats[2].id).is_available)
+
+    def test_seat_in_another_class_is_rejected(self):
+        with self.assertRaises(services.SeatAssignmentError):
+            self.assign((self.first, self.seats[3]))
+        self.assertTrue(Seat.objects.get(id=self.seats[3].id).is_available)
+        self.assertIsNone(self.seat_of(self.first))
+
+
+class SeatContentionTests(TransactionTestCase):
+    clients = 50
+    pool_size = 5
+
+    def setUp(self):
+        if connection.vendor == 'sqlite' and (
+            connection.is_in_memory_db()
+            or connection.settings_dict['OPTIONS'].get('transaction_mode') != 'IMMEDIATE'
+        ):
+            # In memory, concurrent writers fail with "table is locked"; on file, deferred transactions
+            # that both read and then write fail with "database is locked" instead of waiting their turn
+            self.skipTest('needs concurrent writers; on SQLite use a file TEST NAME and transaction_mode IMMEDIATE')
+        flight = make_flight(timezone.now() + timedelta(days=3), economy=100)
+        seat_class = flight.economy
+        self.pool = [
+            Seat.objects.create(flight=flight, seat_class=seat_class, seat_number=f'E1{letter}')
+            for letter in 'ABCDEF'[:self.pool_size]
+        ]
+        user = get_user_model().objects.create_user(username='traveller', password='secret')
+        self.passengers = []
+        for i in range(self.clients):
+            booking = Booking.objects.create(user=user, flight=flight, seat_class=seat_class,
+                                             total_amount=Decimal('100.00'), booking_reference=f'TEST{i:05d}')
+            self.passengers.append(Passenger.objects.create(
+                booking=booking, first_name='Load', last_name='Test', date_of_birth='1990-01-01', gender='O',
+                nationality='Test'
+            ))
+
+    def test_each_contested_seat_has_exactly_one_winner(self):
+        barrier = threading.Barrier(self.clients)
+        outcomes, errors = [], []
+
+        def client(passenger, seat):
+            barrier.wait()
+            try:
+                services.assign_seats(passenger.booking, [{'passenger_id': passenger.id, 'seat_id': seat.id}])
+                outcomes.append('claimed')
+            except services.SeatAssignmentError:
+                outcomes.append('rejected')
+            except Exception as exc:
+                errors.append(exc)
+            finally:
+                connections.close_all()
+
+        # Every seat in the pool is wanted by clients / pool_size clients at once
+        threads = [
+            threading.Thread(target=client, args=(passenger, self.pool[i % self.pool_size]))
+            for i, passenger in enumerate(self.passengers)
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(errors, [])
+        self.assertEqual(outcomes.count('claimed'), self.pool_size)
+        self.assertEqual(outcomes.count('rejected'), self.clients - self.pool_size)
+        for seat in self.pool:
+            self.assertEqual(Passenger.objects.filter(seat=seat).count(), 1, seat.seat_number)
+        self.assertFalse(Seat.objects.filter(id__in=[seat.id for seat in self.pool], is_available=True).exists())
+
+
+@override_settings(QUERY_BUDGET_ACTION='raise')
+class FlightStatusTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        departure = timezone.now() + timedelta(days=3)
+        cls.flights = [make_flight(departure + timedelta(hours=i), 100 + i, economy=100) for i in range(3)]
+        cls.user = get_user_model().objects.create_user(username='traveller', password='secret',
+                                                        email='traveller@example.com')
+        cls.admin = get_user_model().objects.create_superuser(username='ops', password='secret')
+
+    def setUp(self):
+        cache.clear()
+
+    def book(self, flight, count, passengers=2):
+        seat_class = flight.seat_classes.get()
+        for _ in range(count):
+            passenger_data = [{'first_name': f'Pax{i}', 'last_name': 'Test'} for i in range(passengers)]
+            services.create_booking(self.user, flight, seat_class, passenger_data)
+
+    def test_cancelling_flights_cascades_to_bookings(self):
+        cancelled, delayed, untouched = self.flights
+        self.book(cancelled, 2)
+        services.confirm_booking(Booking.objects.filter(flight=cancelled).first())
+        self.book(delayed, 1)
+        self.book(untouched, 1)
+        self.client.force_login(self.admin)
+
+        for flight_ids, status in (([cancelled.id], 'cancelled'), ([delayed.id, untouched.id], 'delayed')):
+            with self.captureOnCommitCallbacks(execute=True):
+                response = self.client.post(reverse('flight-bulk-status'), {'flight_ids': flight_ids, 'status': status},
+                                            content_type='application/json')
+            self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json(), {'flights': 2, 'bookings_cancelled': 0, 'notifications': 2})
+
+        cancelled.refresh_from_db()
+        self.assertEqual(cancelled.status, 'cancelled')
+        self.assertEqual(cancelled.available_seats, 100)
+        self.assertEqual(cancelled.seat_classes.get().available_seats, 100)
+        self.assertFalse(Booking.objects.filter(flight=cancelled).exclude(status='cancelled').exists())
+        self.assertFalse(SeatHold.objects.filter(flight=cancelled).exists())
+        self.assertEqual(Booking.objects.filter(flight=delayed, status='pending').count(), 1)
+
+        self.assertEqual(notifications.deliver_batch(), {'sent': 4, 'skipped': 0, 'failed': 0})
+        self.assertEqual(len(mail.outbox), 4)
+        self.assertIn('has been cancelled', mail.outbox[0].body)
+        self.assertIn('Pax0 Test, Pax1 Test', mail.outbox[0].body)
+        self.assertFalse(Notification.objects.exclude(status='sent').exists())
+        self.assertFalse(notifications.deliver_batch())
+
+    @override_settings(NOTIFICATION_MAX_ATTEMPTS=2, NOTIFICATION_RETRY_DELAY=60)
+    def test_failed_notifications_back_off(self):
+        self.book(self.flights[0], 2)
+        services.change_flight_status([self.flights[0].id], 'delayed')
+        with mock.patch('django.core.mail.backends.locmem.EmailBackend.send_messages', side_effect=OSError('down')), \
+                self.assertLogs('bookings.notifications', 'WARNING'):
+            self.assertEqual(notifications.deliver_batch(batch_size=1), {'sent': 0, 'skipped': 0, 'failed': 1})
+            # The failure is not due again yet, so the next batch moves on to the other notification
+            self.assertEqual(notifications.deliver_batch(batch_size=1), {'sent': 0, 'skipped': 0, 'failed': 1})
+            self.assertFalse(notifications.deliver_batch())
+        retry = Notification.objects.filter(status='pending').order_by('id')
+        self.assertEqual([n.attempts for n in retry], [1, 1])
+        self.assertEqual(retry[0].last_error, 'down')
+        self.assertGreater(retry[0].next_attempt_at, timezone.now() + timedelta(seconds=50))
+
+        with mock.patch('django.utils.timezone.now', return_value=timezone.now() + timedelta(minutes=2)):
+            with mock.patch('django.core.mail.backends.locmem.EmailBackend.send_messages', side_effect=OSError('down')), \
+                    self.assertLogs('bookings.notifications', 'WARNING'):
+                self.assertEqual(notifications.deliver_batch(batch_size=1), {'sent': 0, 'skipped': 0, 'failed': 1})
+            self.assertEqual(notifications.deliver_batch(), {'sent': 1, 'skipped': 0, 'failed': 0})
+        self.assertEqual(Notification.objects.get(status='failed').attempts, 2)
+        self.assertEqual(len(mail.outbox), 1)
+
+    def test_query_count_does_not_grow_with_bookings(self):
+        def cancel(flight):
+            with CaptureQueriesContext(connection) as queries:
+                result = services.change_flight_status([flight.id], 'cancelled')
+            return result, len(queries)
+
+        self.book(self.flights[0], 1)
+        self.book(self.flights[1], 30, passengers=3)
+        few = cancel(self.flights[0])
+        many = cancel(self.flights[1])
+        self.assertEqual(many[0], {'flights': 1, 'bookings_cancelled': 30, 'notifications': 30})
+        self.assertEqual(few[1], many[1])
+        self.assertEqual(Passenger.objects.filter(booking__flight=self.flights[1]).count(), 90)
+        self.assertEqual(Notification.objects.filter(booking__flight=self.flights[1]).count(), 30)
+
+    def test_bulk_status_requires_staff(self):
+        self.client.force_login(self.user)
+        response = self.client.post(reverse('flight-bulk-status'), {'flight_ids': [self.flights[0].id],
+                                                                    'status': 'cancelled'},
+                                    content_type='application/json')
+        self.assertEqual(response.status_code, 403)
+        self.assertEqual(Flight.objects.filter(status='cancelled').count(), 0)
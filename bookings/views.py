@@ -4,9 +4,15 @@ from django.contrib import messages
 from django.http import JsonResponse
 from django.views.decorators.csrf import csrf_exempt
 from django.utils import timezone
+from django.db import transaction
+from django.db.models import Count
 from .models import Booking, Passenger, Payment, Baggage
+from flights import seatmap
+from flights.pagination import KeysetPaginator
 from flights.models import Flight, SeatClass, Seat
 from .forms import BookingForm, PassengerForm
+from . import services
+from flight_booking.instrumentation import query_budget
 import json
 import uuid
 
@@ -18,54 +24,18 @@ def create_booking(request, flight_id):
     if request.method == 'POST':
         form = BookingForm(request.POST, flight=flight)
         if form.is_valid():
-            booking = form.save(commit=False)
-            booking.user = request.user
-            booking.flight = flight
-            
-            # Get passengers data to calculate total
-            passengers_data_str = request.POST.get('passengers_data', '[]')
             try:
-                passengers_data = json.loads(passengers_data_str)
-            except json.JSONDecodeError:
-                passengers_data = []
-            
-            num_passengers = len(passengers_data) if passengers_data else 1  # Default to 1 passenger
-            
-            # Calculate total amount
-            seat_class = form.cleaned_data['seat_class']
-            base_price = flight.base_price
-            class_multiplier = getattr(seat_class, 'price_multiplier', 1.0) if seat_class else 1.0
-            total_amount = base_price * class_multiplier * num_passengers
-            
-            booking.total_amount = total_amount
-            booking.save()
-            
-            # Create passengers
-            if passengers_data:
-                for passenger_data in passengers_data:
-                    passenger = Passenger.objects.create(
-                        booking=booking,
-                        first_name=passenger_data.get('first_name', ''),
-                        last_name=passenger_data.get('last_name', ''),
-                        date_of_birth=passenger_data.get('date_of_birth', '1990-01-01'),
-                        gender=passenger_data.get('gender', 'M'),
-                        passport_number=passenger_data.get('passport_number', ''),
-                        nationality=passenger_data.get('nationality', '')
-                    )
-            else:
-                # Create a default passenger if no data provided
-                passenger = Passenger.objects.create(
-                    booking=booking,
-                    first_name=request.user.first_name or 'Guest',
-                    last_name=request.user.last_name or 'User',
-                    date_of_birth='1990-01-01',
-                    gender='M',
-                    passport_number='',
-                    nationality='Unknown'
+                booking = services.create_booking(
+                    request.user,
+                    flight,
+                    form.cleaned_data['seat_class'],
+                    request.POST.get('passengers_data', '[]')
                 )
-            
-            messages.success(request, f'Booking created successfully! Reference: {booking.booking_reference}')
-            return redirect('bookings:detail', booking_id=booking.id)
+            except (services.PassengerDataError, services.InventoryError) as e:
+                messages.error(request, str(e))
+            else:
+                messages.success(request, f'Booking created successfully! Reference: {booking.booking_reference}')
+                return redirect('bookings:detail', booking_id=booking.id)
         else:
             messages.error(request, 'Please correct the errors below.')
     else:
@@ -94,9 +64,14 @@ def booking_detail(request, booking_id):
     })
 
 @login_required
+@query_budget(4)
 def booking_list(request):
-    bookings = Booking.objects.filter(user=request.user).order_by('-created_at')
-    return render(request, 'bookings/list.html', {'bookings': bookings})
+    bookings = Booking.objects.filter(user=request.user).select_related(
+        'flight__airline', 'flight__departure_airport', 'flight__arrival_airport'
+    ).annotate(passenger_count=Count('passengers'))
+    paginator = KeysetPaginator(bookings, 10, ordering=('-created_at', '-id'), count_mode='off')
+    page_obj = paginator.page(after=request.GET.get('after'), before=request.GET.get('before'))
+    return render(request, 'bookings/list.html', {'bookings': page_obj, 'page_obj': page_obj})
 
 @login_required
 @csrf_exempt
@@ -107,23 +82,15 @@ def seat_selection(request, booking_id):
         data = json.loads(request.body)
         seat_assignments = data.get('seat_assignments', [])
         
-        for assignment in seat_assignments:
-            passenger_id = assignment['passenger_id']
-            seat_id = assignment['seat_id']
-            
-            passenger = get_object_or_404(Passenger, id=passenger_id, booking=booking)
-            seat = get_object_or_404(Seat, id=seat_id, flight=booking.flight, is_available=True)
-            
-            passenger.seat = seat
-            passenger.save()
-            
-            seat.is_available = False
-            seat.save()
+        try:
+            services.assign_seats(booking, seat_assignments)
+        except services.SeatAssignmentError as e:
+            return JsonResponse({'success': False, 'message': str(e)}, status=409)
         
         return JsonResponse({'success': True, 'message': 'Seats assigned successfully!'})
     
     # GET request - show seat map
-    seats = Seat.objects.filter(flight=booking.flight, seat_class=booking.seat_class)
+    seats = list(seatmap.iter_seats(booking.flight_id, booking.seat_class_id))
     passengers = booking.passengers.all()
     
     return render(request, 'bookings/seat_selection.html', {
@@ -139,17 +106,19 @@ def payment_view(request, booking_id):
     if request.method == 'POST':
         payment_method = request.POST.get('payment_method')
         
-        payment = Payment.objects.create(
-            booking=booking,
-            amount=booking.total_amount,
-            payment_method=payment_method,
-            transaction_id=str(uuid.uuid4()),
-            status='completed',  # In real app, integrate with payment gateway
-            processed_at=timezone.now()
-        )
-        
-        booking.status = 'confirmed'
-        booking.save()
+        with transaction.atomic():
+            if not services.confirm_booking(booking):
+                messages.error(request, 'This booking can no longer be paid for. Unpaid bookings are released when their seat hold expires.')
+                return redirect('bookings:detail', booking_id=booking.id)
+            
+            payment = Payment.objects.create(
+                booking=booking,
+                amount=booking.total_amount,
+                payment_method=payment_method,
+                transaction_id=str(uuid.uuid4()),
+                status='completed',  # In real app, integrate with payment gateway
+                processed_at=timezone.now()
+            )
         
         messages.success(request, 'Payment processed successfully! Your booking is confirmed.')
         return redirect('bookings:detail', booking_id=booking.id)
@@ -160,16 +129,7 @@ def payment_view(request, booking_id):
 def cancel_booking(request, booking_id):
     booking = get_object_or_404(Booking, id=booking_id, user=request.user)
     
-    if booking.status in ['pending', 'confirmed']:
-        booking.status = 'cancelled'
-        booking.save()
-        
-        # Free up seats
-        for passenger in booking.passengers.all():
-            if passenger.seat:
-                passenger.seat.is_available = True
-                passenger.seat.save()
-        
+    if services.cancel_and_release(booking):
         messages.success(request, 'Booking cancelled successfully!')
     else:
         messages.error(request, 'Cannot cancel this booking.')
@@ -0,0 +1,267 @@
+import logging
+import statistics
+import threading
+import time
+from collections import defaultdict, deque
+from contextvars import ContextVar
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.contrib.admin.views.decorators import staff_member_required
+from django.db import connections
+from django.db.backends.signals import connection_created
+from django.http import JsonResponse
+from django.template.backends.django import DjangoTemplates, Template as DjangoTemplate
+
+logger = logging.getLogger(__name__)
+
+_current = ContextVar('request_timings', default=None)
+
+
+class QueryBudgetExceeded(AssertionError):
+    pass
+
+
+def query_budget(max_queries):
+    """Declare the most SQL queries a view may issue per request, session and auth lookups included."""
+    def decorator(view_func):
+        view_func.query_budget = max_queries
+        return view_func
+    return decorator
+
+
+class RequestTimings:
+    __slots__ = ('queries', 'sql_time', 'template_time', 'template_depth', '_lock')
+
+    def __init__(self):
+        self.queries = 0
+        self.sql_time = 0.0
+        self.template_time = 0.0
+        self.template_depth = 0
+        # Async views run reads for one request on several threads at once
+        self._lock = threading.Lock()
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            elapsed = time.perf_counter() - start
+            with self._lock:
+                self.queries += 1
+                self.sql_time += elapsed
+
+
+def _record(execute, sql, params, many, context):
+    timings = _current.get()
+    if timings is None:
+        return execute(sql, params, many, context)
+    return timings(execute, sql, params, many, context)
+
+
+def install(connection):
+    """Count this connection's queries toward whichever request is running in the current context.
+
+    The wrapper stays on the connection, so queries issued from worker threads
+    (which inherit the request's context) are counted too. It goes first in
+    the list so execute_wrapper() blocks, which pop the last entry, leave it alone.
+    """
+    if _record not in connection.execute_wrappers:
+        connection.execute_wrappers.insert(0, _record)
+
+
+def _connection_created(sender, connection, **kwargs):
+    install(connection)
+
+
+connection_created.connect(_connection_created)
+
+
+class TimedTemplate(DjangoTemplate):
+    def render(self, context=None, request=None):
+        timings = _current.get()
+        if timings is None:
+            return super().render(context, request)
+        # A template rendered from inside another (render_to_string in a tag) is part of the outer one's time
+        timings.template_depth += 1
+        start = time.perf_counter()
+        try:
+            return super().render(context, request)
+        finally:
+            timings.template_depth -= 1
+            if not timings.template_depth:
+                timings.template_time += time.perf_counter() - start
+
+
+class TimedDjangoTemplates(DjangoTemplates):
+    """The Django template backend, timing each render toward the request in progress.
+
+    Set as the TEMPLATES backend; outside a request it renders exactly as
+    DjangoTemplates does. Includes and extends render inside their outermost
+    template, so one timer covers the whole page.
+    """
+
+    def from_string(self, template_code):
+        return TimedTemplate(super().from_string(template_code).template, self)
+
+    def get_template(self, template_name):
+        return TimedTemplate(super().get_template(template_name).template, self)
+
+
+class RequestStats:
+    """Rolling per-view samples of the last REQUEST_STATS_WINDOW requests, per process."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._samples = defaultdict(self._new_window)
+        self._budgets = {}
+
+    def _new_window(self):
+        return deque(maxlen=getattr(settings, 'REQUEST_STATS_WINDOW', 500))
+
+    def record(self, view_name, budget, total, timings):
+        with self._lock:
+            self._samples[view_name].append((total, timings.queries, timings.sql_time, timings.template_time))
+            self._budgets[view_name] = budget
+
+    def summary(self):
+        with self._lock:
+            samples = {view_name: list(window) for view_name, window in self._samples.items()}
+            budgets = dict(self._budgets)
+        result = {}
+        for view_name, rows in sorted(samples.items()):
+            totals = sorted(row[0] for row in rows)
+            queries = [row[1] for row in rows]
+            result[view_name] = {
+                'requests': len(rows),
+                'p50_ms': round(statistics.median(totals) * 1000, 2),
+                'p95_ms': round(totals[max(0, int(len(totals) * 0.95) - 1)] * 1000, 2),
+                'avg_queries': round(statistics.mean(queries), 2),
+                'max_queries': max(queries),
+                'avg_sql_ms': round(statistics.mean(row[2] for row in rows) * 1000, 2),
+                'avg_template_ms': round(statistics.mean(row[3] for row in rows) * 1000, 2),
+                'query_budget': budgets.get(view_name),
+            }
+        return result
+
+    def clear(self):
+        with self._lock:
+            self._samples.clear()
+            self._budgets.clear()
+
+
+stats = RequestStats()
+
+
+class InstrumentationMiddleware:
+    """Measure SQL count and time, template time and total time for every request.
+
+    The numbers go out in a Server-Timing header and into the rolling stats.
+    A request over its view's query_budget is logged, or raises
+    QueryBudgetExceeded when QUERY_BUDGET_ACTION is 'raise' (as in tests).
+    Keep it first in MIDDLEWARE so the session and auth queries are counted.
+    It runs in both modes, so under ASGI the middleware chain stays async.
+    A streamed body is read after the view returns, so its queries are counted
+    as it is sent: the header covers the view alone, while the stats and the
+    budget check wait for the last chunk and cover the whole response.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        for connection in connections.all():
+            install(connection)
+        timings = RequestTimings()
+        token = _current.set(timings)
+        request.query_budget = None
+        start = time.perf_counter()
+        try:
+            response = self.get_response(request)
+        finally:
+            _current.reset(token)
+        return self._finish(request, response, timings, start)
+
+    async def __acall__(self, request):
+        # The ORM runs on worker threads here; their connections pick up the wrapper as they connect
+        timings = RequestTimings()
+        token = _current.set(timings)
+        request.query_budget = None
+        start = time.perf_counter()
+        try:
+            response = await self.get_response(request)
+        finally:
+            _current.reset(token)
+        return self._finish(request, response, timings, start)
+
+    def _finish(self, request, response, timings, start):
+        total = time.perf_counter() - start
+        response['Server-Timing'] = ', '.join([
+            f'db;dur={timings.sql_time * 1000:.1f};desc="{timings.queries} queries"',
+            f'tpl;dur={timings.template_time * 1000:.1f}',
+            f'total;dur={total * 1000:.1f}',
+        ])
+        if not response.streaming:
+            self._check(request, timings, total)
+        elif response.is_async:
+            response.streaming_content = self._acounted(response.streaming_content, request, timings, start)
+        else:
+            response.streaming_content = self._counted(response.streaming_content, request, timings, start)
+        return response
+
+    def _counted(self, content, request, timings, start):
+        content = iter(content)
+        while True:
+            # Set per chunk: the server may send each one from a different context
+            token = _current.set(timings)
+            try:
+                chunk = next(content)
+            except StopIteration:
+                break
+            finally:
+                _current.reset(token)
+            yield chunk
+        self._check(request, timings, time.perf_counter() - start)
+
+    async def _acounted(self, content, request, timings, start):
+        content = aiter(content)
+        while True:
+            token = _current.set(timings)
+            try:
+                chunk = await anext(content)
+            except StopAsyncIteration:
+                break
+            finally:
+                _current.reset(token)
+            yield chunk
+        self._check(request, timings, time.perf_counter() - start)
+
+    def _check(self, request, timings, total):
+        match = request.resolver_match
+        view_name = match.view_name if match else 'unresolved'
+        stats.record(view_name, request.query_budget, total, timings)
+
+        if request.query_budget is not None and timings.queries > request.query_budget:
+            message = f'{view_name} issued {timings.queries} queries, over its budget of {request.query_budget}'
+            if getattr(settings, 'QUERY_BUDGET_ACTION', 'log') == 'raise':
+                raise QueryBudgetExceeded(message)
+            logger.warning(message)
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        # Class-based views (DRF viewsets included) declare it as a class attribute,
+        # and a viewset action may override it with @query_budget
+        view_class = getattr(view_func, 'cls', None) or getattr(view_func, 'view_class', None)
+        action = getattr(view_class, getattr(view_func, 'actions', {}).get(request.method.lower(), ''), None)
+        request.query_budget = getattr(
+            view_func, 'query_budget', getattr(action, 'query_budget', getattr(view_class, 'query_budget', None))
+        )
+
+
+@staff_member_required
+def request_stats(request):
+    return JsonResponse({'views': stats.summary()})
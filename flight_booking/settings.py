@@ -56,6 +56,7 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'flight_booking.instrumentation.InstrumentationMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -69,7 +70,8 @@ ROOT_URLCONF = 'flight_booking.urls'
 
 TEMPLATES = [
     {
-        'BACKEND': 'django.template.backends.django.DjangoTemplates',
+        # DjangoTemplates, timing renders for the instrumentation middleware
+        'BACKEND': 'flight_booking.instrumentation.TimedDjangoTemplates',
         'DIRS': [BASE_DIR / 'templates'],
         'APP_DIRS': True,
         'OPTIONS': {
@@ -170,3 +172,75 @@ AUTH_USER_MODEL = 'accounts.CustomUser'
 # https://docs.djangoproject.com/en/5.2/ref/settings/#default-auto-field
 
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
+
+# Seat holds
+# Pending bookings hold their seats for this long before being released
+SEAT_HOLD_MINUTES = 15
+
+# Caching
+# Local-memory by default; point 'default' (or PAGE_CACHE_ALIAS) at Redis or
+# Memcached in production so every worker shares one cache
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'flight-booking',
+    }
+}
+# Cache for page data, searches, seat maps and dashboard summaries
+PAGE_CACHE_ALIAS = 'default'
+# Seconds public page data (home, flight list, flight detail) stays cached
+PAGE_CACHE_TIMEOUT = 300
+# Search results carry seat availability, so they expire sooner
+SEARCH_CACHE_TIMEOUT = 60
+# Searches without both cities are streamed rather than cached; flights read
+# and priced per query while streaming
+SEARCH_STREAM_CHUNK_SIZE = 2000
+
+# Popular destinations
+# Extra score per confirmed booking on top of one point per scheduled
+# arriving flight; 0 ranks destinations by flights alone. Run
+# refresh_popular_destinations after changing it.
+POPULAR_DESTINATIONS_BOOKING_WEIGHT = 0
+
+# Largest group a single booking may contain
+MAX_PASSENGERS_PER_BOOKING = 50
+
+# Seconds a user's dashboard counters stay cached; 0 recomputes them on every visit
+DASHBOARD_SUMMARY_TIMEOUT = 300
+
+# Notifications
+# Times send_notifications tries to deliver a notification before marking it failed
+NOTIFICATION_MAX_ATTEMPTS = 5
+# Seconds before a failed notification is retried, doubling after every further failure
+NOTIFICATION_RETRY_DELAY = 60
+# Seconds a claimed notification is left to its worker before another may pick it up
+NOTIFICATION_CLAIM_TIMEOUT = 300
+
+# Booking references
+# Sequence values each process reserves at a time for booking references
+BOOKING_REFERENCE_BLOCK_SIZE = 100
+
+# Pagination
+# List pages seek by keyset; their totals are counted 'exact', 'approximate'
+# (capped at LIST_COUNT_LIMIT rows, shown as "1000+") or 'off'
+LIST_COUNT_MODE = 'exact'
+LIST_COUNT_LIMIT = 1000
+
+# Most round trips a single search returns
+ROUND_TRIP_MAX_RESULTS = 50
+
+# Connecting flights
+# Connection graphs cover this many days of departures each and are rebuilt
+# once older than CONNECTION_GRAPH_MAX_AGE seconds; each process keeps the
+# CONNECTION_GRAPH_CACHE_SIZE most recently searched ones
+CONNECTION_WINDOW_DAYS = 7
+CONNECTION_GRAPH_MAX_AGE = 300
+CONNECTION_GRAPH_CACHE_SIZE = 4
+CONNECTION_MAX_LAYOVER_MINUTES = 360
+
+# Request instrumentation
+# What to do when a view issues more queries than its @query_budget: 'log' a
+# warning, or 'raise' QueryBudgetExceeded (the test suite does)
+QUERY_BUDGET_ACTION = 'log'
+# Requests per view kept for the rolling stats at /stats/requests/
+REQUEST_STATS_WINDOW = 500
@@ -19,15 +19,18 @@ from django.urls import path, include
 from django.conf import settings
 from django.conf.urls.static import static
 from main_views import home, dashboard, contact
+from .instrumentation import request_stats
 
 urlpatterns = [
     path('admin/', admin.site.urls),
     path('', home, name='home'),
     path('dashboard/', dashboard, name='dashboard'),
     path('contact/', contact, name='contact'),
+    path('stats/requests/', request_stats, name='request_stats'),
     path('accounts/', include('accounts.urls')),
     path('flights/', include('flights.urls')),
     path('bookings/', include('bookings.urls')),
+    path('api/', include('flights.api_urls')),
 ]
 
 if settings.DEBUG:
@@ -1,9 +1,10 @@
 from django.contrib import admin
-from .models import Airport, Airline, Aircraft, Flight, SeatClass, Seat
+from bookings.services import change_flight_status
+from .models import Airport, Airline, Aircraft, DestinationPopularity, Flight, LowestFare, SeatClass, Seat
 
 @admin.register(Airport)
 class AirportAdmin(admin.ModelAdmin):
-    list_display = ('code', 'name', 'city', 'country')
+    list_display = ('code', 'name', 'city', 'country', 'min_connection_minutes')
     search_fields = ('code', 'name', 'city')
     list_filter = ('country',)
 
@@ -17,6 +18,18 @@ class AircraftAdmin(admin.ModelAdmin):
     list_display = ('manufacturer', 'model', 'capacity')
     search_fields = ('manufacturer', 'model')
 
+def status_action(status, label):
+    @admin.action(description=f'Mark selected flights as {label.lower()}')
+    def action(modeladmin, request, queryset):
+        result = change_flight_status(list(queryset.values_list('id', flat=True)), status)
+        modeladmin.message_user(
+            request,
+            f"{result['flights']} flights marked {label.lower()}; {result['bookings_cancelled']} bookings cancelled "
+            f"and {result['notifications']} notifications queued."
+        )
+    action.__name__ = f'mark_{status}'
+    return action
+
 @admin.register(Flight)
 class FlightAdmin(admin.ModelAdmin):
     list_display = ('flight_number', 'airline', 'departure_airport', 'arrival_airport', 
@@ -24,6 +37,8 @@ class FlightAdmin(admin.ModelAdmin):
     list_filter = ('status', 'airline', 'departure_airport', 'arrival_airport')
     search_fields = ('flight_number', 'airline__name')
     date_hierarchy = 'departure_time'
+    # One UPDATE for the whole selection, with bookings cascaded in bulk, instead of editing flights one by one
+    actions = [status_action(status, label) for status, label in Flight.FLIGHT_STATUS_CHOICES]
 
 @admin.register(SeatClass)
 class SeatClassAdmin(admin.ModelAdmin):
@@ -35,3 +50,15 @@ class SeatAdmin(admin.ModelAdmin):
     list_display = ('flight', 'seat_number', 'seat_class', 'is_available', 'is_window', 'is_aisle')
     list_filter = ('seat_class', 'is_available', 'is_window', 'is_aisle')
     search_fields = ('flight__flight_number', 'seat_number')
+
+@admin.register(DestinationPopularity)
+class DestinationPopularityAdmin(admin.ModelAdmin):
+    list_display = ('airport', 'flight_count', 'booking_count', 'score', 'updated_at')
+    ordering = ('-score',)
+
+@admin.register(LowestFare)
+class LowestFareAdmin(admin.ModelAdmin):
+    list_display = ('departure_airport', 'arrival_airport', 'date', 'class_type', 'fare', 'flight', 'updated_at')
+    list_filter = ('class_type', 'departure_airport', 'arrival_airport')
+    date_hierarchy = 'date'
+    raw_id_fields = ('flight',)
@@ -0,0 +1,95 @@
+import bisect
+import threading
+from .models import Airport
+
+
+class AirportResolver:
+    """In-process index of airports by IATA code, city and name.
+
+    Airports change rarely, so the table is loaded once and rebuilt lazily after
+    an Airport save/delete signal calls invalidate().
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._index = None
+
+    def invalidate(self):
+        with self._lock:
+            self._index = None
+
+    def _load(self):
+        index = self._index
+        if index is not None:
+            return index
+        with self._lock:
+            if self._index is None:
+                airports = list(Airport.objects.values('id', 'code', 'name', 'city', 'country').order_by('city', 'code'))
+                by_code = {airport['code'].lower(): airport for airport in airports}
+                # Sorted (key, id) pairs so prefix lookups are a bisect instead of a scan
+                keys = sorted(
+                    [(airport['city'].lower(), airport['id']) for airport in airports] +
+                    [(airport['name'].lower(), airport['id']) for airport in airports]
+                )
+                self._index = {
+                    'airports': airports,
+                    'by_id': {airport['id']: airport for airport in airports},
+                    'by_code': by_code,
+                    'keys': keys,
+                    'key_strings': [key for key, _ in keys],
+                }
+            return self._index
+
+    def _prefix_ids(self, index, prefix):
+        key_strings = index['key_strings']
+        start = bisect.bisect_left(key_strings, prefix)
+        ids = []
+        for position in range(start, len(key_strings)):
+            if not key_strings[position].startswith(prefix):
+                break
+            ids.append(index['keys'][position][1])
+        return ids
+
+    def resolve(self, term):
+        """Return the set of airport ids matching a typed city, code or prefix.
+
+        An empty term returns None, meaning "no airport filter".
+        """
+        term = (term or '').strip().lower()
+        if not term:
+            return None
+        index = self._load()
+
+        ids = set()
+        airport = index['by_code'].get(term)
+        if airport:
+            ids.add(airport['id'])
+        ids.update(self._prefix_ids(index, term))
+        if not ids:
+            # Fall back to substring matching so "york" still finds "New York"
+            ids = {
+                airport['id'] for airport in index['airports']
+                if term in airport['city'].lower() or term in airport['name'].lower()
+            }
+        return ids
+
+    def suggest(self, term, limit=10):
+        ids = self.resolve(term)
+        index = self._load()
+        if ids is None:
+            airports = index['airports']
+        else:
+            airports = [airport for airport in index['airports'] if airport['id'] in ids]
+        return [
+            {'code': airport['code'], 'name': airport['name'], 'city': airport['city'], 'country': airport['country']}
+            for airport in airports[:limit]
+        ]
+
+    def cities(self):
+        return sorted({airport['city'] for airport in self._load()['airports']})
+
+    def get(self, airport_id):
+        return self._load()['by_id'].get(airport_id)
+
+
+resolver = AirportResolver()
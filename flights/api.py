@@ -0,0 +1,91 @@
+import hashlib
+from django.db.models import F, Prefetch
+from django.utils.cache import get_conditional_response
+from rest_framework import viewsets
+from rest_framework.decorators import action
+from rest_framework.pagination import CursorPagination
+from rest_framework.permissions import IsAdminUser
+from rest_framework.response import Response
+from bookings.holds import expired_hold_seats
+from bookings.services import change_flight_status
+from flight_booking import instrumentation
+from . import fares, search
+from .models import Flight
+from .serializers import FlightSerializer, FlightStatusUpdateSerializer, SeatClassSerializer
+
+
+class FlightCursorPagination(CursorPagination):
+    # Keyset on (departure_time, id) stays fast however deep the client pages
+    ordering = ('departure_time', 'id')
+    page_size = 20
+    page_size_query_param = 'page_size'
+    max_page_size = 100
+
+
+class ConditionalResponseMixin:
+    """Send an ETag for every GET and answer If-None-Match with 304 Not Modified."""
+
+    def finalize_response(self, request, response, *args, **kwargs):
+        response = super().finalize_response(request, response, *args, **kwargs)
+        if request.method != 'GET' or response.status_code != 200:
+            return response
+        response.render()
+        etag = '"%s"' % hashlib.md5(response.content).hexdigest()
+        response['ETag'] = etag
+        return get_conditional_response(request, etag=etag, response=response)
+
+
+class FlightViewSet(ConditionalResponseMixin, viewsets.ReadOnlyModelViewSet):
+    serializer_class = FlightSerializer
+    pagination_class = FlightCursorPagination
+    # Read by flight_booking.instrumentation; flights and seat classes, plus a session lookup
+    query_budget = 3
+
+    def get_passengers(self):
+        passengers = self.request.query_params.get('passengers', '')
+        return int(passengers) if passengers.isdigit() else 1
+
+    def get_queryset(self):
+        params = self.request.query_params
+        passengers = self.get_passengers()
+        flights = Flight.objects.all()
+        if self.action == 'list':
+            flights = flights.filter(status=params.get('status', 'scheduled'))
+            flights = search.filter_route(flights, params.get('departure_city', ''), params.get('arrival_city', ''))
+            day = search.parse_date(params.get('departure_date'))
+            if day:
+                flights = search.filter_departure_date(flights, day)
+        flights = flights.annotate(free_seats=F('available_seats') + expired_hold_seats('flight'))
+        if self.action == 'list':
+            # Only the listing hides full flights; a flight's own endpoints always find it
+            flights = flights.filter(free_seats__gte=passengers)
+        return flights.select_related(
+            'airline', 'aircraft', 'departure_airport', 'arrival_airport'
+        ).prefetch_related(
+            Prefetch('seat_classes', queryset=search.seat_class_queryset(passengers), to_attr='matching_classes')
+        )
+
+    def paginate_queryset(self, queryset):
+        page = super().paginate_queryset(queryset)
+        fares.price_flights(page, self.get_passengers())
+        return page
+
+    def get_object(self):
+        flight = super().get_object()
+        fares.price_flights([flight], self.get_passengers())
+        return flight
+
+    @action(detail=True, url_path='seat-classes')
+    def seat_classes(self, request, pk=None):
+        flight = self.get_object()
+        serializer = SeatClassSerializer(flight.matching_classes, many=True)
+        return Response(serializer.data)
+
+    @action(detail=False, methods=['post'], url_path='bulk-status', permission_classes=[IsAdminUser])
+    @instrumentation.query_budget(25)
+    def bulk_status(self, request):
+        """Set the status of up to 1000 flights at once; their bookings are cancelled or notified to match."""
+        serializer = FlightStatusUpdateSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        result = change_flight_status(serializer.validated_data['flight_ids'], serializer.validated_data['status'])
+        return Response(result)
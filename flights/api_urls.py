@@ -0,0 +1,7 @@
+from rest_framework.routers import DefaultRouter
+from . import api
+
+router = DefaultRouter()
+router.register('flights', api.FlightViewSet, basename='flight')
+
+urlpatterns = router.urls
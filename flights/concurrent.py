@@ -0,0 +1,26 @@
+from asgiref.sync import sync_to_async
+from django.db import close_old_connections
+
+
+def _run(func, args, kwargs):
+    # Worker threads live outside the request cycle, so they tidy their own
+    # connections the way request_started/request_finished do for a request
+    close_old_connections()
+    try:
+        return func(*args, **kwargs)
+    finally:
+        close_old_connections()
+
+
+async def read(func, *args, **kwargs):
+    """Run a blocking read on a worker thread with its own database connection.
+
+    Django's async ORM methods all hop onto one shared thread, so gathering
+    several of them still runs the queries one after another. Reads started
+    through here really overlap, so an async view can gather independent ones
+    and wait for the slowest instead of the sum. Only use it for reads: each
+    call may be on a different connection, outside any transaction of the caller.
+    With CONN_MAX_AGE at 0 every read opens a fresh connection, so set it when
+    serving these views.
+    """
+    return await sync_to_async(_run, thread_sensitive=False)(func, args, kwargs)
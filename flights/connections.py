@@ -0,0 +1,263 @@
+import heapq
+import threading
+import time
+from bisect import bisect_left
+from collections import defaultdict
+from datetime import datetime, timedelta
+from django.conf import settings
+from django.db.models import F, Prefetch
+from django.utils import timezone
+from bookings.holds import expired_hold_seats
+from . import fares
+from .airports import resolver
+from .models import Airport, Flight
+from .search import parse_date, seat_class_queryset, serialize_flight
+
+# Departures are (departure_ts, arrival_ts, arrival_airport_id, price_cents, seats, flight_id)
+DEPARTURE, ARRIVAL, DESTINATION, PRICE, SEATS, FLIGHT = range(6)
+
+
+def _setting(name, default):
+    return getattr(settings, name, default)
+
+
+class ConnectionGraph:
+    """Time-expanded graph of the scheduled flights departing in [start, end).
+
+    Every airport keeps its departures sorted by time, so the onward flights
+    reachable after a layover are one bisect away. Departures are also indexed
+    by route, which keeps the final leg of an itinerary to a single range read.
+    Each flight's place in both indexes is kept by id, so patching one flight
+    touches only the two lists it sits in.
+    """
+
+    def __init__(self, start, end):
+        self.start = start
+        self.end = end
+        self.built_at = time.monotonic()
+        self.departures = defaultdict(list)
+        self.routes = defaultdict(list)
+        # flight_id -> (origin, destination, departure_ts)
+        self.located = {}
+        self.min_connection = {}
+
+    @classmethod
+    def load(cls, start, end):
+        graph = cls(start, end)
+        # Saving an airport drops every graph, so airports added later are never missing here
+        graph.min_connection = {
+            airport_id: minutes * 60
+            for airport_id, minutes in Airport.objects.values_list('id', 'min_connection_minutes')
+        }
+        rows = Flight.objects.filter(
+            status='scheduled', departure_time__gte=start, departure_time__lt=end
+        ).order_by('departure_time').values_list(
+            'departure_airport_id', 'departure_time', 'arrival_time', 'arrival_airport_id',
+            'base_price', 'available_seats', 'id'
+        )
+        for origin, departure, arrival, destination, price, seats, flight_id in rows.iterator(chunk_size=5000):
+            edge = (int(departure.timestamp()), int(arrival.timestamp()), destination, int(price * 100), seats, flight_id)
+            # Rows arrive in departure order, so appending keeps both indexes sorted
+            graph.departures[origin].append(edge)
+            graph.routes[origin, destination].append(edge)
+            graph.located[flight_id] = (origin, destination, edge[DEPARTURE])
+        return graph
+
+    def covers(self, moment):
+        return self.start <= moment < self.end
+
+    def add(self, origin, edge):
+        for edges in (self.departures[origin], self.routes[origin, edge[DESTINATION]]):
+            edges.insert(bisect_left(edges, edge[DEPARTURE], key=lambda e: e[DEPARTURE]), edge)
+        self.located[edge[FLIGHT]] = (origin, edge[DESTINATION], edge[DEPARTURE])
+
+    def remove(self, flight_id):
+        located = self.located.pop(flight_id, None)
+        if located is None:
+            return
+        origin, destination, departure = located
+        for edges in (self.departures[origin], self.routes[origin, destination]):
+            # Bisect to the flight's departure time, then step past any other flights leaving then
+            position = bisect_left(edges, departure, key=lambda e: e[DEPARTURE])
+            while edges[position][FLIGHT] != flight_id:
+                position += 1
+            del edges[position]
+
+    def _reachable(self, destinations, legs):
+        # reach[n] holds the airports that can get to a destination in at most n
+        # more legs, ignoring times, so dead-end branches are never expanded
+        inbound = defaultdict(set)
+        for (origin, destination), edges in self.routes.items():
+            if edges:
+                inbound[destination].add(origin)
+        reach = [set(destinations)]
+        for _ in range(legs - 1):
+            previous = reach[-1]
+            reach.append(previous | {origin for airport in previous for origin in inbound[airport]})
+        return reach
+
+    def _window(self, edges, earliest, latest):
+        position = bisect_left(edges, earliest, key=lambda e: e[DEPARTURE])
+        while position < len(edges) and edges[position][DEPARTURE] <= latest:
+            yield edges[position]
+            position += 1
+
+    def search(self, origins, destinations, day_start, day_end, passengers=1, max_legs=3, limit=10,
+               sort='arrival', max_layover=None):
+        """Return up to `limit` itineraries as lists of flight ids, best first.
+
+        Labels are expanded best-first by arrival time (or total fare when
+        `sort` is 'price'), and each airport is expanded at most `limit` times
+        per leg count, which bounds the work however dense the schedule is.
+        """
+        if max_layover is None:
+            max_layover = _setting('CONNECTION_MAX_LAYOVER_MINUTES', 360) * 60
+        destinations = set(destinations)
+        reach = self._reachable(destinations, max_legs)
+        by_price = sort == 'price'
+        heap = []
+        counter = 0
+
+        def push(edge, path, airports, cost):
+            nonlocal counter
+            cost += edge[PRICE]
+            key = (cost, edge[ARRIVAL]) if by_price else (edge[ARRIVAL], cost)
+            counter += 1
+            heapq.heappush(heap, (key, counter, edge[ARRIVAL], edge[DESTINATION], path + (edge[FLIGHT],),
+                                  airports + (edge[DESTINATION],), cost))
+
+        for origin in set(origins):
+            for edge in self._window(self.departures.get(origin, ()), day_start, day_end - 1):
+                if edge[SEATS] >= passengers and edge[DESTINATION] in reach[max_legs - 1]:
+                    push(edge, (), (origin,), 0)
+
+        results = []
+        expanded = defaultdict(int)
+        while heap and len(results) < limit:
+            _, _, arrival, airport, path, airports, cost = heapq.heappop(heap)
+            if airport in destinations:
+                results.append(path)
+                continue
+            remaining = max_legs - len(path)
+            if remaining <= 0 or expanded[airport, len(path)] >= limit:
+                continue
+            expanded[airport, len(path)] += 1
+
+            earliest = arrival + self.min_connection[airport]
+            latest = arrival + max_layover
+            if remaining == 1:
+                candidates = (edge for destination in destinations
+                              for edge in self._window(self.routes.get((airport, destination), ()), earliest, latest))
+            else:
+                candidates = self._window(self.departures.get(airport, ()), earliest, latest)
+            for edge in candidates:
+                if (edge[SEATS] >= passengers and edge[DESTINATION] in reach[remaining - 1]
+                        and edge[DESTINATION] not in airports):
+                    push(edge, path, airports, cost)
+        return results
+
+
+class GraphCache:
+    """Per-process graphs, one per window of CONNECTION_WINDOW_DAYS.
+
+    Only the CONNECTION_GRAPH_CACHE_SIZE most recently searched windows are
+    kept, so a process that has served searches far into the schedule does
+    not hold a graph for every week it has seen. Flight changes made in this process are patched in as they happen; changes
+    made elsewhere, and seat counts that move through bulk UPDATEs, are picked
+    up when a graph is rebuilt after CONNECTION_GRAPH_MAX_AGE seconds.
+    """
+
+    # Extra days loaded past a window so itineraries starting on its last day can finish
+    SPILLOVER_DAYS = 3
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._graphs = {}
+
+    def _window_start(self, day):
+        days = _setting('CONNECTION_WINDOW_DAYS', 7)
+        return day - timedelta(days=day.toordinal() % days)
+
+    def get(self, day):
+        first_day = self._window_start(day)
+        with self._lock:
+            # Popping and reinserting keeps the dict in least recently used order
+            graph = self._graphs.pop(first_day, None)
+            if graph is None or time.monotonic() - graph.built_at > _setting('CONNECTION_GRAPH_MAX_AGE', 300):
+                start = timezone.make_aware(datetime.combine(first_day, datetime.min.time()))
+                days = _setting('CONNECTION_WINDOW_DAYS', 7) + self.SPILLOVER_DAYS
+                graph = ConnectionGraph.load(start, start + timedelta(days=days))
+            self._graphs[first_day] = graph
+            while len(self._graphs) > _setting('CONNECTION_GRAPH_CACHE_SIZE', 4):
+                del self._graphs[next(iter(self._graphs))]
+            return graph
+
+    def update_flight(self, flight):
+        with self._lock:
+            for graph in self._graphs.values():
+                graph.remove(flight.id)
+                if flight.status == 'scheduled' and graph.covers(flight.departure_time):
+                    graph.add(flight.departure_airport_id, (
+                        int(flight.departure_time.timestamp()), int(flight.arrival_time.timestamp()),
+                        flight.arrival_airport_id, int(flight.base_price * 100), flight.available_seats, flight.id
+                    ))
+
+    def remove_flight(self, flight_id):
+        with self._lock:
+            for graph in self._graphs.values():
+                graph.remove(flight_id)
+
+    def invalidate(self):
+        with self._lock:
+            self._graphs.clear()
+
+
+graphs = GraphCache()
+
+
+def _lowest_price(flight):
+    return min((seat_class.price for seat_class in flight.matching_classes), default=None)
+
+
+def search(departure_city, arrival_city, departure_date, passengers=1, max_legs=3, limit=10, sort='arrival'):
+    """Return ranked JSON-ready itineraries of up to `max_legs` flights."""
+    day = parse_date(departure_date)
+    origins = resolver.resolve(departure_city)
+    destinations = resolver.resolve(arrival_city)
+    if day is None or not origins or not destinations:
+        return []
+
+    day_start = timezone.make_aware(datetime.combine(day, datetime.min.time()))
+    paths = graphs.get(day).search(
+        origins, destinations, int(day_start.timestamp()), int((day_start + timedelta(days=1)).timestamp()),
+        passengers=passengers, max_legs=max_legs, limit=limit, sort=sort
+    )
+
+    # The graph can lag behind seat sales, so availability is confirmed against
+    # the database in one batch and itineraries with a sold-out leg are dropped
+    flights = Flight.objects.filter(
+        id__in={flight_id for path in paths for flight_id in path}, status='scheduled'
+    ).annotate(
+        free_seats=F('available_seats') + expired_hold_seats('flight')
+    ).filter(free_seats__gte=passengers).select_related(
+        'airline', 'departure_airport', 'arrival_airport', 'aircraft'
+    ).prefetch_related(
+        Prefetch('seat_classes', queryset=seat_class_queryset(passengers), to_attr='matching_classes')
+    )
+    flights = {flight.id: flight for flight in flights}
+    fares.price_flights(flights.values(), passengers)
+
+    itineraries = []
+    for path in paths:
+        legs = [flights.get(flight_id) for flight_id in path]
+        if None in legs or any(not leg.matching_classes for leg in legs):
+            continue
+        itineraries.append({
+            'stops': len(legs) - 1,
+            'departure_time': legs[0].departure_time.strftime('%Y-%m-%d %H:%M'),
+            'arrival_time': legs[-1].arrival_time.strftime('%Y-%m-%d %H:%M'),
+            'duration': str(legs[-1].arrival_time - legs[0].departure_time),
+            'price': float(sum(_lowest_price(leg) for leg in legs)),
+            'legs': [serialize_flight(leg) for leg in legs]
+        })
+    return itineraries
@@ -0,0 +1,179 @@
+from collections import defaultdict
+from datetime import timedelta
+from itertools import islice
+from django.db import connection, transaction
+from django.db.models import Min
+from django.utils import timezone
+from . import fares
+from .airports import resolver
+from .models import Flight, LowestFare, SeatClass
+from .search import day_range, parse_date
+
+MAX_CALENDAR_DAYS = 62
+
+
+def _cheapest(rows, cheapest=None):
+    """Map (departure, arrival, date, class_type) to (fare cents, flight_id) for the cheapest row of each.
+
+    `rows` are (departure_airport_id, arrival_airport_id, departure_time, class_type,
+    flight_id, base_price, price_multiplier) for classes that still have seats.
+    Pass the result back in as `cheapest` to fold in a further chunk of rows.
+    """
+    cheapest = {} if cheapest is None else cheapest
+    rows = list(rows)
+    if not rows:
+        return cheapest
+    cents = fares.price([row[5] for row in rows], [row[6] for row in rows]).tolist()
+    for row, fare in zip(rows, cents):
+        key = (row[0], row[1], timezone.localtime(row[2]).date(), row[3])
+        if key not in cheapest or fare < cheapest[key][0]:
+            cheapest[key] = (fare, row[4])
+    return cheapest
+
+
+def _available_classes():
+    return SeatClass.objects.filter(flight__status='scheduled', available_seats__gt=0).values_list(
+        'flight__departure_airport_id', 'flight__arrival_airport_id', 'flight__departure_time',
+        'class_type', 'flight_id', 'flight__base_price', 'price_multiplier'
+    )
+
+
+def _save(cheapest):
+    unique_fields = (
+        ['departure_airport', 'arrival_airport', 'date', 'class_type']
+        if connection.features.supports_update_conflicts_with_target else None
+    )
+    LowestFare.objects.bulk_create(
+        [
+            LowestFare(departure_airport_id=departure, arrival_airport_id=arrival, date=day,
+                       class_type=class_type, fare=fares.to_decimal(fare), flight_id=flight_id)
+            for (departure, arrival, day, class_type), (fare, flight_id) in cheapest.items()
+        ],
+        update_conflicts=True,
+        unique_fields=unique_fields,
+        update_fields=['fare', 'flight', 'updated_at'],
+        batch_size=1000
+    )
+
+
+def refresh_route_day(departure_airport_id, arrival_airport_id, day):
+    """Recompute the calendar rows for one route and departure day."""
+    start, end = day_range(day)
+    cheapest = _cheapest(_available_classes().filter(
+        flight__departure_airport_id=departure_airport_id,
+        flight__arrival_airport_id=arrival_airport_id,
+        flight__departure_time__gte=start,
+        flight__departure_time__lt=end
+    ))
+    with transaction.atomic():
+        LowestFare.objects.filter(
+            departure_airport_id=departure_airport_id, arrival_airport_id=arrival_airport_id, date=day
+        ).exclude(class_type__in=[key[3] for key in cheapest]).delete()
+        _save(cheapest)
+
+
+def refresh_route_days(route_days):
+    """Recompute the calendar rows for many (departure_airport_id, arrival_airport_id, day) at once.
+
+    Each route is read once, from its first day to its last, so an import
+    that touches a route on every day of a season costs one read for it
+    rather than one per day. Returns the number of route-days refreshed.
+    """
+    days_by_route = defaultdict(set)
+    for departure_airport_id, arrival_airport_id, day in route_days:
+        days_by_route[departure_airport_id, arrival_airport_id].add(day)
+    for (departure_airport_id, arrival_airport_id), days in days_by_route.items():
+        start, _ = day_range(min(days))
+        _, end = day_range(max(days))
+        rows = _available_classes().filter(
+            flight__departure_airport_id=departure_airport_id,
+            flight__arrival_airport_id=arrival_airport_id,
+            flight__departure_time__gte=start,
+            flight__departure_time__lt=end
+        ).iterator(chunk_size=5000)
+        cheapest = {}
+        while chunk := list(islice(rows, 5000)):
+            _cheapest(chunk, cheapest)
+        cheapest = {key: value for key, value in cheapest.items() if key[2] in days}
+        with transaction.atomic():
+            stale = [
+                pk for pk, day, class_type in LowestFare.objects.filter(
+                    departure_airport_id=departure_airport_id, arrival_airport_id=arrival_airport_id, date__in=days
+                ).values_list('id', 'date', 'class_type')
+                if (departure_airport_id, arrival_airport_id, day, class_type) not in cheapest
+            ]
+            LowestFare.objects.filter(id__in=stale).delete()
+            _save(cheapest)
+    return sum(len(days) for days in days_by_route.values())
+
+
+def refresh_flight(flight_id):
+    route = Flight.objects.filter(id=flight_id).values_list(
+        'departure_airport_id', 'arrival_airport_id', 'departure_time'
+    ).first()
+    if route:
+        refresh_route_day(route[0], route[1], timezone.localtime(route[2]).date())
+
+
+def schedule_refresh(departure_airport_id, arrival_airport_id, departure_time):
+    day = timezone.localtime(departure_time).date()
+    transaction.on_commit(lambda: refresh_route_day(departure_airport_id, arrival_airport_id, day))
+
+
+def inventory_changed(changes):
+    """Refresh the days whose classes just sold out or just got seats back.
+
+    `changes` maps seat class ids to the seats just released, or 0 after a
+    reservation. Only a class that now has exactly that many seats crossed
+    zero, so most bookings cost this one indexed read and nothing else.
+    """
+    if not changes:
+        return
+    crossed = {
+        flight_id
+        for seat_class_id, flight_id, seats in SeatClass.objects.filter(id__in=list(changes)).values_list(
+            'id', 'flight_id', 'available_seats'
+        )
+        if seats == changes[seat_class_id]
+    }
+    for flight_id in crossed:
+        transaction.on_commit(lambda pk=flight_id: refresh_flight(pk))
+
+
+def rebuild():
+    """Recompute the whole calendar for flights departing from today on."""
+    start, _ = day_range(timezone.localdate())
+    rows = _available_classes().filter(flight__departure_time__gte=start).iterator(chunk_size=5000)
+    # Priced a chunk at a time, so memory follows the number of route-days rather than of flights
+    cheapest = {}
+    while chunk := list(islice(rows, 5000)):
+        _cheapest(chunk, cheapest)
+    with transaction.atomic():
+        LowestFare.objects.all().delete()
+        _save(cheapest)
+    return len(cheapest)
+
+
+def calendar(departure_city, arrival_city, start_date, days, class_type=None):
+    """Return the lowest fare for every day in [start_date, start_date + days) in one grouped read."""
+    start_date = parse_date(start_date)
+    departure_ids = resolver.resolve(departure_city)
+    arrival_ids = resolver.resolve(arrival_city)
+    if start_date is None or not departure_ids or not arrival_ids:
+        return []
+    days = max(1, min(int(days), MAX_CALENDAR_DAYS))
+    end_date = start_date + timedelta(days=days)
+
+    fares_by_day = LowestFare.objects.filter(
+        departure_airport_id__in=departure_ids,
+        arrival_airport_id__in=arrival_ids,
+        date__gte=start_date,
+        date__lt=end_date
+    )
+    if class_type:
+        fares_by_day = fares_by_day.filter(class_type=class_type)
+    lowest = dict(fares_by_day.order_by().values('date').annotate(lowest=Min('fare')).values_list('date', 'lowest'))
+    return [
+        {'date': day.isoformat(), 'lowest_fare': float(lowest[day]) if day in lowest else None}
+        for day in (start_date + timedelta(days=offset) for offset in range(days))
+    ]
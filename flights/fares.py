@@ -0,0 +1,81 @@
+from decimal import Decimal, ROUND_HALF_UP
+import numpy as np
+
+# Money is handled as integer cents and multipliers as integer hundredths, so
+# every step is exact int64 arithmetic; Decimals only appear at the boundary
+CENTS = Decimal('0.01')
+
+
+def _to_decimal_input(value):
+    # str() first so floats convert as written (1.1, not 1.100000000000000088...)
+    return value if isinstance(value, Decimal) else Decimal(str(value))
+
+
+def _scaled(values):
+    """Convert Decimals (or anything Decimal accepts) to an int64 array of hundredths.
+
+    Database amounts have two decimal places, which float64 holds closely
+    enough for rint to land on the exact cent; anything that doesn't land on a
+    cent is rounded half up through Decimal instead.
+    """
+    if isinstance(values, np.ndarray):
+        values = values.tolist()
+    if not isinstance(values, (list, tuple)):
+        values = [values]
+    floats = np.fromiter(map(float, values), dtype=np.float64, count=len(values))
+    hundredths = np.rint(floats * 100)
+    inexact = (hundredths / 100 != floats) | (np.abs(floats) >= 1e12)
+    scaled = hundredths.astype(np.int64)
+    for i in np.flatnonzero(inexact).tolist():
+        scaled[i] = int(_to_decimal_input(values[i]).scaleb(2).to_integral_value(ROUND_HALF_UP))
+    return scaled
+
+
+def to_decimal(cents):
+    return Decimal(int(cents)).scaleb(-2)
+
+
+def price_cents(base_cents, multipliers, passengers=1, baggage_cents=0):
+    """Total fare in cents for each combination; arguments broadcast against each other.
+
+    `multipliers` are in hundredths (150 for 1.5x). The per-seat fare is rounded
+    half up to the cent before it is multiplied by the passenger count, so a
+    booking always costs exactly what search showed per seat times its size.
+    """
+    unit = np.asarray(base_cents, dtype=np.int64) * np.asarray(multipliers, dtype=np.int64)
+    unit = (unit + 50) // 100
+    return unit * np.asarray(passengers, dtype=np.int64) + np.asarray(baggage_cents, dtype=np.int64)
+
+
+def price(base_prices, multipliers, passengers=1, baggage_fees=0):
+    """Decimal-in, cents-out wrapper around price_cents."""
+    return price_cents(_scaled(base_prices), _scaled(multipliers), passengers, _scaled(baggage_fees))
+
+
+def seat_price(base_price, multiplier):
+    return to_decimal(price(base_price, multiplier)[0])
+
+
+def price_seat_classes(seat_classes, passengers=1):
+    """Set `price` (per seat) and `total_price` (for `passengers`) on every class in one pass.
+
+    Classes from flights.search.seat_class_queryset carry the flight's base price
+    as an annotation; others fall back to their flight.
+    """
+    seat_classes = list(seat_classes)
+    if not seat_classes:
+        return
+    base_prices = [seat_class.base_price if hasattr(seat_class, 'base_price') else seat_class.flight.base_price
+                   for seat_class in seat_classes]
+    unit = price(base_prices, [seat_class.price_multiplier for seat_class in seat_classes])
+    for seat_class, cents in zip(seat_classes, unit.tolist()):
+        seat_class.price = to_decimal(cents)
+        seat_class.total_price = to_decimal(cents * passengers)
+
+
+def price_flights(flights, passengers=1):
+    price_seat_classes((seat_class for flight in flights for seat_class in flight.matching_classes), passengers)
+
+
+def booking_total(flight, seat_class, passengers, baggage_fees=()):
+    return to_decimal(price(flight.base_price, seat_class.price_multiplier, passengers, sum(baggage_fees, Decimal(0)))[0])
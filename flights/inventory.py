@@ -0,0 +1,50 @@
+from decimal import Decimal
+from .models import Seat, SeatClass
+
+SEAT_CLASSES = [
+    # class_type, price_multiplier, share of flight seats, baggage_allowance
+    ('economy', Decimal('1.0'), 0.7, 23),
+    ('premium_economy', Decimal('1.5'), 0.2, 32),
+    ('business', Decimal('3.0'), 0.08, 32),
+    ('first', Decimal('5.0'), 0.02, 32),
+]
+
+
+def build_seat_classes(flight_id, seats):
+    """Unsaved seat classes splitting `seats` by the SEAT_CLASSES shares; classes too small for one seat are left out."""
+    seat_classes = []
+    for class_type, multiplier, share, baggage in SEAT_CLASSES:
+        class_seats = int(seats * share)
+        if class_seats > 0:
+            seat_classes.append(SeatClass(
+                flight_id=flight_id,
+                class_type=class_type,
+                price_multiplier=multiplier,
+                available_seats=class_seats,
+                baggage_allowance=baggage
+            ))
+    return seat_classes
+
+
+def seat_layout(class_type, seats):
+    """(seat_number, is_window, is_aisle) for `seats` seats six abreast, numbered per class (E1A, E1B, ...)."""
+    layout = []
+    for seat_counter in range(seats):
+        row = (seat_counter // 6) + 1
+        seat_letter = chr(65 + (seat_counter % 6))  # A, B, C, D, E, F
+        layout.append((f"{class_type[0].upper()}{row}{seat_letter}", seat_letter in ['A', 'F'], seat_letter in ['C', 'D']))
+    return layout
+
+
+def build_seats(seat_class):
+    """Unsaved seats for a saved seat class."""
+    return [
+        Seat(
+            flight_id=seat_class.flight_id,
+            seat_number=seat_number,
+            seat_class_id=seat_class.id,
+            is_window=is_window,
+            is_aisle=is_aisle
+        )
+        for seat_number, is_window, is_aisle in seat_layout(seat_class.class_type, seat_class.available_seats)
+    ]
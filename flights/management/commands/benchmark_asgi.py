@@ -0,0 +1,190 @@
+from django.core.asgi import get_asgi_application
+from django.core.management.base import BaseCommand, CommandError
+from django.core.wsgi import get_wsgi_application
+from django.db import connections
+from django.db.backends.signals import connection_created
+from django.test import override_settings
+from django.urls import reverse
+from django.utils import timezone
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlencode
+from flights.models import Flight
+import asyncio
+import io
+import json
+import random
+import statistics
+import sys
+import threading
+import time
+
+# An unmasked CSRF secret sent as both cookie and header, so POSTs pass CsrfViewMiddleware
+CSRF_TOKEN = 'benchmarkbenchmarkbenchmarkbench'
+
+ENDPOINTS = {
+    # The sync list renders HTML rather than JSON, so that comparison also includes template time
+    'search': ('flights:search', 'flights:async_search'),
+    'list': ('flights:list', 'flights:async_list'),
+}
+
+
+class Command(BaseCommand):
+    help = 'Compare search and list throughput under WSGI and ASGI with injected database latency'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--endpoint', choices=sorted(ENDPOINTS), default='search')
+        parser.add_argument('--latency-ms', type=float, default=5, help='Delay added to every SQL query')
+        parser.add_argument('--requests', type=int, default=400, help='Timed requests per mode')
+        parser.add_argument('--threads', type=int, default=8, help='WSGI worker threads')
+        parser.add_argument('--executor-threads', type=int, default=32,
+                            help='Thread pool the async views run their blocking reads on')
+        parser.add_argument('--concurrency', type=int, default=64, help='Requests in flight at once under ASGI')
+        parser.add_argument('--conn-max-age', type=int,
+                            help='Override CONN_MAX_AGE for the run; async reads reconnect per read without it')
+        parser.add_argument('--seed', type=int, default=1)
+
+    def handle(self, *args, **options):
+        rng = random.Random(options['seed'])
+        flights = list(Flight.objects.filter(
+            status='scheduled', departure_time__gte=timezone.now()
+        ).values_list('departure_airport__city', 'arrival_airport__city', 'departure_time')[:2000])
+        if not flights:
+            raise CommandError('No upcoming flights; run populate_sample_data first')
+        requests = [self._request(options['endpoint'], rng.choice(flights)) for _ in range(options['requests'])]
+        sync_name, async_name = ENDPOINTS[options['endpoint']]
+
+        latency = options['latency_ms'] / 1000
+
+        def slow_query(execute, sql, params, many, context):
+            time.sleep(latency)
+            return execute(sql, params, many, context)
+
+        def add_latency(sender, connection, **kwargs):
+            if slow_query not in connection.execute_wrappers:
+                connection.execute_wrappers.append(slow_query)
+
+        if options['conn_max_age'] is not None:
+            # Connections read their settings dict when they connect, so this reaches every thread
+            for alias in connections:
+                connections.settings[alias]['CONN_MAX_AGE'] = options['conn_max_age']
+        connection_created.connect(add_latency)
+        for connection in connections.all():
+            add_latency(None, connection)
+        self.stdout.write(
+            f'{options["requests"]} {options["endpoint"]} requests per mode, {options["latency_ms"]:g} ms per query, '
+            f'{options["threads"]} WSGI threads, {options["concurrency"]} in flight and '
+            f'{options["executor_threads"]} read threads under ASGI'
+        )
+        self.stdout.write(f'{"mode":<20}{"req/s":>9}{"p50 ms":>9}{"p95 ms":>9}{"errors":>8}')
+        try:
+            # Cached pages would hide the database entirely
+            with override_settings(SEARCH_CACHE_TIMEOUT=0, PAGE_CACHE_TIMEOUT=0):
+                for label, run in (
+                    ('WSGI, sync view', lambda: self._run_wsgi(reverse(sync_name), requests, options)),
+                    ('ASGI, sync view', lambda: self._run_asgi(reverse(sync_name), requests, options)),
+                    ('ASGI, async view', lambda: self._run_asgi(reverse(async_name), requests, options)),
+                ):
+                    elapsed, results = run()
+                    latencies = sorted(seconds * 1000 for seconds, _ in results)
+                    errors = sum(status != 200 for _, status in results)
+                    self.stdout.write(
+                        f'{label:<20}{len(results) / elapsed:>9.1f}{statistics.median(latencies):>9.1f}'
+                        f'{latencies[int(len(latencies) * 0.95) - 1]:>9.1f}{errors:>8}'
+                    )
+        finally:
+            connection_created.disconnect(add_latency)
+            for connection in connections.all():
+                if slow_query in connection.execute_wrappers:
+                    connection.execute_wrappers.remove(slow_query)
+
+    def _request(self, endpoint, flight):
+        departure_city, arrival_city, departure_time = flight
+        departure_date = str(timezone.localtime(departure_time).date())
+        if endpoint == 'search':
+            body = json.dumps({'departure_city': departure_city, 'arrival_city': arrival_city,
+                               'departure_date': departure_date}).encode()
+            return 'POST', '', body
+        return 'GET', urlencode({'departure_city': departure_city}), b''
+
+    def _run_wsgi(self, path, requests, options):
+        application = get_wsgi_application()
+        worker = threading.local()
+
+        def call(request):
+            method, query, body = request
+            environ = {
+                'REQUEST_METHOD': method, 'PATH_INFO': path, 'QUERY_STRING': query, 'SCRIPT_NAME': '',
+                'SERVER_NAME': 'localhost', 'SERVER_PORT': '80', 'SERVER_PROTOCOL': 'HTTP/1.1',
+                'HTTP_HOST': 'localhost', 'HTTP_COOKIE': f'csrftoken={CSRF_TOKEN}', 'HTTP_X_CSRFTOKEN': CSRF_TOKEN,
+                'CONTENT_TYPE': 'application/json', 'CONTENT_LENGTH': str(len(body)),
+                'wsgi.input': io.BytesIO(body), 'wsgi.errors': sys.stderr, 'wsgi.url_scheme': 'http',
+                'wsgi.version': (1, 0), 'wsgi.multithread': True, 'wsgi.multiprocess': False, 'wsgi.run_once': False,
+            }
+            worker.status = None
+
+            def start_response(status, headers, exc_info=None):
+                worker.status = int(status.split()[0])
+
+            began = time.perf_counter()
+            response = application(environ, start_response)
+            try:
+                for _ in response:
+                    pass
+            finally:
+                # Fires request_finished, which closes the connection as a WSGI server would
+                response.close()
+            return time.perf_counter() - began, worker.status
+
+        with ThreadPoolExecutor(options['threads']) as pool:
+            list(pool.map(call, requests[:options['executor_threads']]))
+            started = time.perf_counter()
+            results = list(pool.map(call, requests))
+            return time.perf_counter() - started, results
+
+    def _run_asgi(self, path, requests, options):
+        application = get_asgi_application()
+
+        async def call(request):
+            method, query, body = request
+            scope = {
+                'type': 'http', 'asgi': {'version': '3.0'}, 'http_version': '1.1', 'method': method,
+                'scheme': 'http', 'path': path, 'raw_path': path.encode(), 'query_string': query.encode(),
+                'root_path': '', 'client': ('127.0.0.1', 0), 'server': ('localhost', 80),
+                'headers': [
+                    (b'host', b'localhost'), (b'content-type', b'application/json'),
+                    (b'content-length', str(len(body)).encode()),
+                    (b'cookie', f'csrftoken={CSRF_TOKEN}'.encode()), (b'x-csrftoken', CSRF_TOKEN.encode()),
+                ],
+            }
+            messages = [{'type': 'http.request', 'body': body, 'more_body': False}]
+            status = []
+
+            async def receive():
+                if messages:
+                    return messages.pop()
+                # The client never disconnects; Django cancels this wait once the response is sent
+                await asyncio.Event().wait()
+
+            async def send(message):
+                if message['type'] == 'http.response.start':
+                    status.append(message['status'])
+
+            began = time.perf_counter()
+            await application(scope, receive, send)
+            return time.perf_counter() - began, status[0] if status else None
+
+        async def run():
+            asyncio.get_running_loop().set_default_executor(ThreadPoolExecutor(options['executor_threads']))
+            queue = list(reversed(requests))
+            results = []
+
+            async def client():
+                while queue:
+                    results.append(await call(queue.pop()))
+
+            await asyncio.gather(*(call(request) for request in requests[:options['executor_threads']]))
+            started = time.perf_counter()
+            await asyncio.gather(*(client() for _ in range(options['concurrency'])))
+            return time.perf_counter() - started, results
+
+        return asyncio.run(run())
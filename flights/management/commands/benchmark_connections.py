@@ -0,0 +1,84 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.utils import timezone
+from datetime import datetime, timedelta
+from decimal import Decimal
+from flights.models import Airport, Airline, Aircraft, Flight
+from flights.connections import ConnectionGraph
+import random
+import statistics
+import time
+
+class Command(BaseCommand):
+    help = 'Benchmark connecting-flight search over a large synthetic schedule'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--flights', type=int, default=100000, help='Flights in the synthetic schedule')
+        parser.add_argument('--airports', type=int, default=60, help='Airports in the synthetic network')
+        parser.add_argument('--days', type=int, default=7, help='Days the schedule is spread over')
+        parser.add_argument('--queries', type=int, default=200, help='Random searches to time')
+        parser.add_argument('--max-legs', type=int, default=3)
+        parser.add_argument('--budget-ms', type=float, default=100, help='Fail if p95 search time exceeds this')
+        parser.add_argument('--seed', type=int, default=1)
+
+    def handle(self, *args, **options):
+        rng = random.Random(options['seed'])
+        start = timezone.make_aware(datetime.combine(timezone.now().date() + timedelta(days=365), datetime.min.time()))
+
+        # Everything is seeded inside a transaction that is rolled back at the end
+        with transaction.atomic():
+            airports = self._seed(rng, start, options)
+
+            started = time.perf_counter()
+            graph = ConnectionGraph.load(start, start + timedelta(days=options['days'] + 3))
+            self.stdout.write(f'Built graph of {options["flights"]} flights in {time.perf_counter() - started:.2f}s')
+
+            for sort in ('arrival', 'price'):
+                timings = []
+                found = 0
+                for _ in range(options['queries']):
+                    origin, destination = rng.sample(airports, 2)
+                    day_start = start + timedelta(days=rng.randrange(options['days']))
+                    began = time.perf_counter()
+                    paths = graph.search([origin], [destination], int(day_start.timestamp()),
+                                         int((day_start + timedelta(days=1)).timestamp()),
+                                         max_legs=options['max_legs'], sort=sort)
+                    timings.append((time.perf_counter() - began) * 1000)
+                    found += len(paths)
+                timings.sort()
+                p95 = timings[int(len(timings) * 0.95) - 1]
+                self.stdout.write(
+                    f'sort={sort:<7} median {statistics.median(timings):6.1f} ms, p95 {p95:6.1f} ms, '
+                    f'max {timings[-1]:6.1f} ms, {found / len(timings):.1f} itineraries per query'
+                )
+                if p95 > options['budget_ms']:
+                    transaction.set_rollback(True)
+                    raise CommandError(f'p95 of {p95:.1f} ms is over the {options["budget_ms"]} ms budget')
+
+            transaction.set_rollback(True)
+
+    def _seed(self, rng, start, options):
+        airports = Airport.objects.bulk_create([
+            Airport(code=f'Z{i:02d}', name=f'Benchmark Airport {i}', city=f'Benchmark City {i}',
+                    country='Nowhere', timezone='UTC', min_connection_minutes=rng.choice([30, 45, 60, 90]))
+            for i in range(options['airports'])
+        ])
+        if not all(airport.pk for airport in airports):
+            airports = list(Airport.objects.filter(code__in=[airport.code for airport in airports]))
+        airline = Airline.objects.create(code='ZZ', name='Benchmark Air')
+        aircraft = Aircraft.objects.create(manufacturer='Benchmark', model='B1', capacity=200)
+
+        flights = []
+        minutes = options['days'] * 24 * 60
+        for i in range(options['flights']):
+            origin, destination = rng.sample(airports, 2)
+            departure_time = start + timedelta(minutes=rng.randrange(minutes))
+            duration = timedelta(minutes=rng.randint(60, 720))
+            flights.append(Flight(
+                flight_number=str(i), airline=airline, aircraft=aircraft,
+                departure_airport=origin, arrival_airport=destination,
+                departure_time=departure_time, arrival_time=departure_time + duration, duration=duration,
+                base_price=Decimal(rng.randint(50, 1500)), available_seats=rng.randint(0, 200)
+            ))
+        Flight.objects.bulk_create(flights, batch_size=5000)
+        return [airport.id for airport in airports]
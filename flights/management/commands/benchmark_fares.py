@@ -0,0 +1,55 @@
+from django.core.management.base import BaseCommand, CommandError
+from decimal import Decimal, ROUND_HALF_UP
+from flights import fares
+import numpy as np
+import time
+
+class Command(BaseCommand):
+    help = 'Benchmark batch fare pricing and check it matches Decimal arithmetic exactly'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--combinations', type=int, default=1_000_000, help='Flight/class combinations to price')
+        parser.add_argument('--check', type=int, default=100_000, help='Combinations compared against plain Decimal')
+        parser.add_argument('--seed', type=int, default=1)
+
+    def handle(self, *args, **options):
+        rng = np.random.default_rng(options['seed'])
+        size = options['combinations']
+        base_cents = rng.integers(5_000, 500_000, size)
+        multipliers = rng.choice([100, 125, 150, 175, 300, 500], size)
+        passengers = rng.integers(1, 10, size)
+        baggage_cents = rng.choice([0, 0, 0, 2_500, 5_000], size)
+
+        start = time.perf_counter()
+        totals = fares.price_cents(base_cents, multipliers, passengers, baggage_cents)
+        elapsed = time.perf_counter() - start
+        self.stdout.write(f'Priced {size} combinations from cents in {elapsed * 1000:.1f} ms '
+                          f'({size / elapsed / 1e6:.1f}M/s)')
+
+        # The same prices as they come out of the database, converted at the boundary
+        base_prices = [Decimal(int(cents)).scaleb(-2) for cents in base_cents.tolist()]
+        multiplier_values = [Decimal(int(value)).scaleb(-2) for value in multipliers.tolist()]
+        baggage_fees = [Decimal(int(cents)).scaleb(-2) for cents in baggage_cents.tolist()]
+        start = time.perf_counter()
+        from_decimals = fares.price(base_prices, multiplier_values, passengers, baggage_fees)
+        elapsed = time.perf_counter() - start
+        self.stdout.write(f'Priced {size} combinations from Decimals in {elapsed * 1000:.1f} ms '
+                          f'({size / elapsed / 1e6:.1f}M/s)')
+        if not np.array_equal(totals, from_decimals):
+            raise CommandError('Decimal and cent inputs priced differently')
+
+        checked = min(options['check'], size)
+        start = time.perf_counter()
+        expected = [
+            (base_prices[i] * multiplier_values[i]).quantize(fares.CENTS, ROUND_HALF_UP) * int(passengers[i])
+            + baggage_fees[i]
+            for i in range(checked)
+        ]
+        elapsed = time.perf_counter() - start
+        self.stdout.write(f'Plain Decimal loop over {checked} combinations took {elapsed * 1000:.1f} ms '
+                          f'({checked / elapsed / 1e6:.2f}M/s)')
+
+        mismatches = sum(1 for i in range(checked) if fares.to_decimal(totals[i]) != expected[i])
+        if mismatches:
+            raise CommandError(f'{mismatches} of {checked} fares differ from Decimal arithmetic')
+        self.stdout.write(self.style.SUCCESS(f'All {checked} checked fares match Decimal arithmetic to the cent'))
@@ -0,0 +1,81 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from datetime import datetime, timedelta
+from decimal import Decimal
+from flights.models import Airport, Airline, Aircraft, Flight, SeatClass
+from flights import search
+from flights.airports import resolver
+import time
+
+class Command(BaseCommand):
+    help = 'Benchmark flight search and check the query count stays flat as results grow'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sizes', type=str, default='10,100,1000,10000',
+                            help='Comma separated numbers of matching flights to benchmark')
+
+    def handle(self, *args, **options):
+        sizes = [int(size) for size in options['sizes'].split(',')]
+        date = timezone.now().date() + timedelta(days=365)
+
+        # Everything is seeded inside a transaction that is rolled back at the end
+        with transaction.atomic():
+            departure = Airport.objects.create(code='BQ1', name='Benchmark Origin', city='Benchmarkville',
+                                               country='Nowhere', timezone='UTC')
+            arrival = Airport.objects.create(code='BQ2', name='Benchmark Destination', city='Benchtown',
+                                             country='Nowhere', timezone='UTC')
+            airline = Airline.objects.create(code='BQ', name='Benchmark Air')
+            aircraft = Aircraft.objects.create(manufacturer='Benchmark', model='B1', capacity=200)
+            # The airport index loads once per process; warm it so its query doesn't land on the first size
+            resolver.resolve(departure.city)
+
+            created = 0
+            query_counts = []
+            for size in sizes:
+                self._seed(created, size, date, departure, arrival, airline, aircraft)
+                created = size
+
+                start = time.perf_counter()
+                with CaptureQueriesContext(connection) as queries:
+                    results = search.search(departure.city, arrival.city, date, 1)
+                elapsed = time.perf_counter() - start
+
+                query_counts.append(len(queries))
+                self.stdout.write(f'{len(results):>7} flights: {len(queries)} queries, {elapsed * 1000:.1f} ms')
+
+            transaction.set_rollback(True)
+
+        if len(set(query_counts)) != 1:
+            raise CommandError(f'Query count grows with result size: {query_counts}')
+        self.stdout.write(self.style.SUCCESS(f'Query count is flat at {query_counts[0]}'))
+
+    def _seed(self, start, end, date, departure, arrival, airline, aircraft):
+        base_time = timezone.make_aware(datetime.combine(date, datetime.min.time()))
+        flights = []
+        for i in range(start, end):
+            departure_time = base_time + timedelta(seconds=i)
+            flights.append(Flight(
+                flight_number=str(i),
+                airline=airline,
+                aircraft=aircraft,
+                departure_airport=departure,
+                arrival_airport=arrival,
+                departure_time=departure_time,
+                arrival_time=departure_time + timedelta(hours=3),
+                duration=timedelta(hours=3),
+                base_price=Decimal('300'),
+                available_seats=200
+            ))
+        flights = Flight.objects.bulk_create(flights, batch_size=1000)
+        if not all(flight.pk for flight in flights):
+            flights = Flight.objects.filter(departure_airport=departure, flight_number__in=[str(i) for i in range(start, end)])
+
+        seat_classes = []
+        for flight in flights:
+            seat_classes.append(SeatClass(flight=flight, class_type='economy', price_multiplier=Decimal('1.00'),
+                                          available_seats=180, baggage_allowance=23))
+            seat_classes.append(SeatClass(flight=flight, class_type='business', price_multiplier=Decimal('3.00'),
+                                          available_seats=20, baggage_allowance=32))
+        SeatClass.objects.bulk_create(seat_classes, batch_size=1000)
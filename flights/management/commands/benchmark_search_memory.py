@@ -0,0 +1,86 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.http import JsonResponse
+from django.utils import timezone
+from datetime import datetime, timedelta
+from decimal import Decimal
+from flights.models import Airport, Airline, Aircraft, Flight, SeatClass
+from flights import search
+from flights.streaming import StreamingJsonResponse
+import random
+import time
+import tracemalloc
+
+class Command(BaseCommand):
+    help = 'Compare peak memory of a buffered and a streamed search matching a large number of flights'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--flights', type=int, default=100000, help='Flights matching the search')
+        parser.add_argument('--chunk-size', type=int, default=None,
+                            help='Flights per query when streaming (default SEARCH_STREAM_CHUNK_SIZE)')
+        parser.add_argument('--seed', type=int, default=1)
+
+    def handle(self, *args, **options):
+        rng = random.Random(options['seed'])
+        day = timezone.now().date() + timedelta(days=400)
+
+        # Everything is seeded inside a transaction that is rolled back at the end
+        with transaction.atomic():
+            started = time.perf_counter()
+            self._seed(rng, day, options['flights'])
+            self.stdout.write(f'Seeded {options["flights"]} flights in {time.perf_counter() - started:.1f}s')
+
+            # An empty city matches every airport, so this is the broadest possible search
+            buffered_size, buffered = self._measure(
+                lambda: [JsonResponse({'flights': search.search('', '', day)}).content]
+            )
+            streamed_size, streamed = self._measure(
+                lambda: StreamingJsonResponse({'flights': search.iter_search('', '', day,
+                                                                             chunk_size=options['chunk_size'])})
+            )
+            for label, size, (elapsed, peak) in (('buffered', buffered_size, buffered),
+                                                 ('streamed', streamed_size, streamed)):
+                self.stdout.write(f'{label:<9} peak {peak / 2 ** 20:8.1f} MiB, {elapsed:6.2f}s, '
+                                  f'{size / 2 ** 20:.1f} MiB of JSON')
+            transaction.set_rollback(True)
+
+    def _measure(self, respond):
+        tracemalloc.start()
+        started = time.perf_counter()
+        size = sum(len(chunk) for chunk in respond())
+        elapsed = time.perf_counter() - started
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        return size, (elapsed, peak)
+
+    def _seed(self, rng, day, count):
+        origin = Airport.objects.create(code='YMA', name='Memory Origin', city='Memory Origin', country='Nowhere',
+                                        timezone='UTC')
+        destination = Airport.objects.create(code='YMB', name='Memory Destination', city='Memory Destination',
+                                             country='Nowhere', timezone='UTC')
+        airline = Airline.objects.create(code='YM', name='Memory Air')
+        aircraft = Aircraft.objects.create(manufacturer='Benchmark', model='M1', capacity=200)
+        start = timezone.make_aware(datetime.combine(day, datetime.min.time()))
+
+        flights = []
+        for i in range(count):
+            departure_time = start + timedelta(seconds=rng.randrange(86400))
+            flights.append(Flight(
+                flight_number=str(i), airline=airline, aircraft=aircraft,
+                departure_airport=origin, arrival_airport=destination,
+                departure_time=departure_time, arrival_time=departure_time + timedelta(hours=2),
+                duration=timedelta(hours=2), base_price=Decimal(rng.randint(50, 1500)), available_seats=200
+            ))
+        Flight.objects.bulk_create(flights, batch_size=5000)
+        # bulk_create does not return ids on every backend
+        flight_ids = Flight.objects.filter(airline=airline).values_list('id', flat=True)
+        SeatClass.objects.bulk_create(
+            (
+                SeatClass(flight_id=flight_id, class_type=class_type, price_multiplier=multiplier,
+                          available_seats=seats, baggage_allowance=23)
+                for flight_id in flight_ids.iterator(chunk_size=5000)
+                for class_type, multiplier, seats in (('economy', Decimal('1.00'), 180),
+                                                      ('business', Decimal('3.00'), 20))
+            ),
+            batch_size=5000
+        )
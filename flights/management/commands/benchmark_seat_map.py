@@ -0,0 +1,57 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models import Count
+from django.template import Context, Template
+from flights.models import Flight, Seat
+from flights import seatmap
+import json
+import time
+import tracemalloc
+
+SEAT_TEMPLATE = Template(
+    '{% for seat in seats %}<button data-id="{{ seat.id }}" class="{% if seat.is_window %}window{% endif %}'
+    '{% if seat.is_aisle %} aisle{% endif %}"{% if not seat.is_available %} disabled{% endif %}>'
+    '{{ seat.seat_number }}</button>{% endfor %}'
+)
+
+class Command(BaseCommand):
+    help = 'Compare seat selection rendering from the Seat queryset against the cached seat map'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--flight', type=int, help='Flight id (default: the flight with the most seats)')
+        parser.add_argument('--repeat', type=int, default=50, help='Renders per path')
+
+    def handle(self, *args, **options):
+        if options['flight']:
+            flight = Flight.objects.filter(id=options['flight']).first()
+        else:
+            flight = Flight.objects.annotate(n=Count('seats')).order_by('-n').first()
+        if flight is None:
+            raise CommandError('No flights found; run populate_sample_data first')
+
+        seatmap.invalidate(flight.id, layout=True)
+        seatmap.get_seat_map(flight.id)  # warm the cache once, as a live site would be
+
+        def queryset_path():
+            seats = list(Seat.objects.filter(flight=flight))
+            return SEAT_TEMPLATE.render(Context({'seats': seats}))
+
+        def seat_map_path():
+            seats = list(seatmap.iter_seats(flight.id))
+            return SEAT_TEMPLATE.render(Context({'seats': seats}))
+
+        seat_count = len(seatmap.get_layout(flight.id))
+        payload = len(json.dumps(seatmap.get_seat_map(flight.id)))
+        self.stdout.write(f'Flight {flight.id}: {seat_count} seats, seat-map JSON is {payload} bytes')
+
+        for name, path in [('queryset', queryset_path), ('seat map', seat_map_path)]:
+            start = time.perf_counter()
+            for _ in range(options['repeat']):
+                path()
+            elapsed = (time.perf_counter() - start) / options['repeat']
+
+            tracemalloc.start()
+            path()
+            _, peak = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+
+            self.stdout.write(f'{name:>10}: {elapsed * 1000:.2f} ms per render, {peak / 1024:.0f} KiB peak')
@@ -0,0 +1,41 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+from flights.models import Flight
+from flights import plans, search
+
+class Command(BaseCommand):
+    help = 'EXPLAIN the flight search queries and fail if the Flight table is fully scanned'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--from', dest='departure', type=str, help='Departure city or airport code')
+        parser.add_argument('--to', dest='arrival', type=str, help='Arrival city or airport code')
+        parser.add_argument('--date', type=str, help='Departure date (YYYY-MM-DD)')
+
+    def handle(self, *args, **options):
+        sample = Flight.objects.select_related('departure_airport', 'arrival_airport').order_by('departure_time').first()
+        if sample is None and not all([options['departure'], options['arrival'], options['date']]):
+            raise CommandError('No flights found; pass --from, --to and --date or populate the database first')
+
+        departure = options['departure'] or sample.departure_airport.code
+        arrival = options['arrival'] or sample.arrival_airport.code
+        day = search.parse_date(options['date']) if options['date'] else timezone.localdate(sample.departure_time)
+
+        queries = {
+            'search': search.search_queryset(departure, arrival, day, 1),
+            'list': search.filter_departure_date(
+                search.filter_route(Flight.objects.filter(status='scheduled'), departure, arrival), day
+            ),
+        }
+
+        failures = []
+        for name, queryset in queries.items():
+            # Strip the prefetch so only the Flight query itself is explained
+            plan = plans.explain(queryset.prefetch_related(None))
+            self.stdout.write(f'--- {name} ---\n{plan}')
+            if plans.is_full_scan(plan, Flight):
+                failures.append(name)
+
+        if failures:
+            raise CommandError(f'Full table scan on {Flight._meta.db_table} in: {", ".join(failures)}')
+        self.stdout.write(self.style.SUCCESS('All search plans use an index'))
+
@@ -0,0 +1,377 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.utils import timezone
+from datetime import date, datetime, time as clock, timedelta, timezone as fixed_offset
+from decimal import Decimal, InvalidOperation
+from zoneinfo import ZoneInfo
+from flights.models import Airport, Airline, Aircraft, Flight, SeatClass, Seat
+from flights import fare_calendar, page_cache
+from flights.inventory import build_seat_classes, seat_layout
+from flights.popularity import refresh_all
+import csv
+import functools
+import gzip
+import time
+
+try:
+    import resource
+except ImportError:  # Not available on Windows
+    resource = None
+
+CSV_COLUMNS = ['airline', 'flight_number', 'departure_airport', 'arrival_airport', 'departure_time',
+               'arrival_time', 'aircraft', 'base_price']
+
+# Updated when a row matches an existing flight; available_seats and status
+# belong to bookings and operations, so an import never resets them
+UPDATE_FIELDS = ['airline', 'aircraft', 'departure_airport', 'arrival_airport', 'arrival_time', 'duration',
+                 'base_price']
+
+# Every flight of an aircraft type has the same layout
+_layout = functools.cache(seat_layout)
+
+# Rejected rows shown in the report; the rest are only counted
+SHOWN_ERRORS = 10
+
+
+def _columns(line, first, last):
+    """Text in 1-based, inclusive columns, the way SSIM layouts are specified."""
+    return line[first - 1:last].strip()
+
+
+def _utc_offset(text):
+    sign = -1 if text[0] == '-' else 1
+    return fixed_offset(sign * timedelta(hours=int(text[1:3]), minutes=int(text[3:5])))
+
+
+def _time_of_day(text):
+    return clock(int(text[:2]), int(text[2:4]))
+
+
+def read_csv(handle):
+    """Yield (line number, fields) for each row of a CSV file with a CSV_COLUMNS header."""
+    reader = csv.DictReader(handle)
+    missing = set(CSV_COLUMNS) - set(reader.fieldnames or [])
+    if missing:
+        raise CommandError(f'CSV header is missing {", ".join(sorted(missing))}')
+    for row in reader:
+        yield reader.line_num, row
+
+
+def read_ssim(handle):
+    """Yield (line number, fields) for every flight of an SSIM-style file.
+
+    Only type 3 (flight leg) records are read, using the standard SSIM
+    columns for the fields a Flight needs:
+
+        3-5 airline, 6-9 flight number, 15-21 and 22-28 first and last day
+        (DDMMMYY), 29-35 days of operation (1 = Monday, blank = not operated),
+        37-39 departure airport, 40-43 departure time (HHMM), 48-52 its UTC
+        offset (+HHMM), 55-57 arrival airport, 62-65 arrival time, 66-70 its
+        UTC offset, 73-75 aircraft.
+
+    A record expands to one flight per operated day of its period, generated
+    lazily so a long period costs no memory. An arrival time earlier than the
+    departure lands on the following day. SSIM carries no fares, so
+    base_price is left for the caller to fill in.
+    """
+    for line_number, line in enumerate(handle, 1):
+        if not line.startswith('3'):
+            continue
+        try:
+            flight_number = _columns(line, 6, 9).lstrip('0') or '0'
+            first_day = datetime.strptime(_columns(line, 15, 21), '%d%b%y').date()
+            last_day = datetime.strptime(_columns(line, 22, 28), '%d%b%y').date()
+            weekdays = {int(day) - 1 for day in _columns(line, 29, 35) if day.isdigit()}
+            departure_clock, departure_offset = _time_of_day(_columns(line, 40, 43)), _utc_offset(_columns(line, 48, 52))
+            arrival_clock, arrival_offset = _time_of_day(_columns(line, 62, 65)), _utc_offset(_columns(line, 66, 70))
+        except (ValueError, IndexError) as exc:
+            yield line_number, {'error': f'unreadable flight leg record ({exc})'}
+            continue
+        fields = {
+            'airline': _columns(line, 3, 5),
+            'flight_number': flight_number,
+            'departure_airport': _columns(line, 37, 39),
+            'arrival_airport': _columns(line, 55, 57),
+            'aircraft': _columns(line, 73, 75),
+        }
+        for ordinal in range(first_day.toordinal(), last_day.toordinal() + 1):
+            day = date.fromordinal(ordinal)
+            if day.weekday() not in weekdays:
+                continue
+            departure_time = datetime.combine(day, departure_clock, departure_offset)
+            arrival_time = datetime.combine(day, arrival_clock, arrival_offset)
+            while arrival_time <= departure_time:
+                arrival_time += timedelta(days=1)
+            yield line_number, dict(fields, departure_time=departure_time, arrival_time=arrival_time)
+
+
+class Command(BaseCommand):
+    help = ('Import flights from a CSV or SSIM-style schedule file, upserting on flight number and departure time '
+            'and generating seat inventory for new flights from the aircraft capacity')
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='Schedule file; .gz files are decompressed on the fly')
+        parser.add_argument('--format', choices=['csv', 'ssim'], default=None,
+                            help='File format (default: csv for .csv files, ssim otherwise)')
+        parser.add_argument('--base-price', type=Decimal, default=None,
+                            help='Base price for rows without one (required for SSIM files)')
+        parser.add_argument('--aircraft-alias', action='append', default=[], metavar='CODE=MODEL',
+                            help='Treat aircraft CODE in the file as MODEL, e.g. 320=A320 for SSIM type codes; repeatable')
+        parser.add_argument('--batch-size', type=int, default=1000, help='Flights per upsert and transaction')
+        parser.add_argument('--seat-batch-size', type=int, default=10000, help='Seats per bulk INSERT')
+        parser.add_argument('--max-errors', type=int, default=1000,
+                            help='Stop after this many rejected rows; batches already imported are kept')
+        parser.add_argument('--progress-every', type=int, default=100000, help='Report progress every N rows')
+
+    def handle(self, *args, **options):
+        path = options['path']
+        file_format = options['format'] or ('csv' if path.removesuffix('.gz').endswith('.csv') else 'ssim')
+        self.base_price = options['base_price']
+        self.batch_size = options['batch_size']
+        self.seat_batch_size = options['seat_batch_size']
+        if file_format == 'ssim' and self.base_price is None:
+            raise CommandError('SSIM files carry no fares; pass --base-price')
+
+        # Reference data is small, so every code is resolved from memory
+        self.airlines = dict(Airline.objects.values_list('code', 'id'))
+        self.airports = {code: (pk, ZoneInfo(tz)) for pk, code, tz in Airport.objects.values_list('id', 'code', 'timezone')}
+        self.aircraft = {}
+        self.capacities = {}
+        self.bookable_seats = {}
+        for aircraft in Aircraft.objects.all():
+            self.aircraft.setdefault(aircraft.model.upper(), aircraft.id)
+            self.aircraft.setdefault(f'{aircraft.manufacturer} {aircraft.model}'.upper(), aircraft.id)
+            self.capacities[aircraft.id] = aircraft.capacity
+            # Class shares round down, so a flight sells the sum of its classes rather than the full capacity
+            self.bookable_seats[aircraft.id] = sum(
+                seat_class.available_seats for seat_class in build_seat_classes(None, aircraft.capacity)
+            )
+        for alias in options['aircraft_alias']:
+            code, _, model = alias.partition('=')
+            if model.strip().upper() not in self.aircraft:
+                raise CommandError(f'--aircraft-alias {alias}: no aircraft model {model!r}')
+            self.aircraft[code.strip().upper()] = self.aircraft[model.strip().upper()]
+
+        counts = {'rows': 0, 'rejected': 0, 'flights': 0, 'stocked': 0, 'seat_classes': 0, 'seats': 0}
+        # What the derived tables need refreshing for once the file is in
+        self.route_days = set()
+        self.added = False
+        self.updated_flights = set()
+        errors = []
+        batch = {}
+        started = time.perf_counter()
+        opener = gzip.open if path.endswith('.gz') else open
+        with opener(path, 'rt', newline='', encoding='utf-8') as handle:
+            rows = read_csv(handle) if file_format == 'csv' else read_ssim(handle)
+            for line_number, fields in rows:
+                counts['rows'] += 1
+                try:
+                    flight = self.build_flight(fields)
+                except ValueError as exc:
+                    counts['rejected'] += 1
+                    if len(errors) < SHOWN_ERRORS:
+                        errors.append(f'line {line_number}: {exc}')
+                    if counts['rejected'] > options['max_errors']:
+                        self.report_errors(errors, counts)
+                        raise CommandError(f'More than {options["max_errors"]} rows rejected; stopping')
+                else:
+                    # A later row for the same flight wins, as it would across batches
+                    batch[(flight.flight_number, flight.departure_time)] = flight
+                    if len(batch) >= self.batch_size:
+                        self.import_batch(batch, counts)
+                        batch = {}
+                if counts['rows'] % options['progress_every'] == 0:
+                    elapsed = time.perf_counter() - started
+                    self.stdout.write(f'{counts["rows"]} rows ({counts["rows"] / elapsed:.0f} rows/second)')
+        if batch:
+            self.import_batch(batch, counts)
+        elapsed = time.perf_counter() - started
+
+        # bulk_create skips signals, so refresh the derived tables here. Connection graphs
+        # live in each web process and pick the flights up within CONNECTION_GRAPH_MAX_AGE.
+        refresh_all()
+        fare_calendar.refresh_route_days(self.route_days)
+        if self.added or self.updated_flights is None:
+            # Any list page may now include a new flight
+            page_cache.invalidate_all()
+        else:
+            page_cache.invalidate_flights(*self.updated_flights)
+
+        self.report_errors(errors, counts)
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Imported {counts['flights']} flights; {counts['stocked']} new ones got "
+                f"{counts['seat_classes']} seat classes and {counts['seats']} seats"
+            )
+        )
+        summary = f"Read {counts['rows']} rows in {elapsed:.2f}s ({counts['rows'] / max(elapsed, 1e-9):.0f} rows/second)"
+        if resource is not None:
+            # ru_maxrss is in KiB on Linux
+            summary += f", peak memory {resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024:.0f} MiB"
+        self.stdout.write(summary)
+
+    def report_errors(self, errors, counts):
+        if not counts['rejected']:
+            return
+        self.stderr.write(f"{counts['rejected']} rows rejected:")
+        for error in errors:
+            self.stderr.write(f'  {error}')
+        if counts['rejected'] > len(errors):
+            self.stderr.write(f"  ... and {counts['rejected'] - len(errors)} more")
+
+    def build_flight(self, fields):
+        """An unsaved Flight from one row, raising ValueError with a readable reason when it cannot be imported."""
+        if 'error' in fields:
+            raise ValueError(fields['error'])
+        values = {name: fields.get(name) for name in CSV_COLUMNS}
+        if not values['flight_number']:
+            raise ValueError('missing flight number')
+        try:
+            airline_id = self.airlines[values['airline'].strip().upper()]
+        except (KeyError, AttributeError):
+            raise ValueError(f"unknown airline {values['airline']!r}")
+        try:
+            departure_airport_id, departure_zone = self.airports[values['departure_airport'].strip().upper()]
+            arrival_airport_id, arrival_zone = self.airports[values['arrival_airport'].strip().upper()]
+        except (KeyError, AttributeError):
+            raise ValueError(f"unknown airport {values['departure_airport']!r} or {values['arrival_airport']!r}")
+        if departure_airport_id == arrival_airport_id:
+            raise ValueError('departure and arrival airports are the same')
+        try:
+            aircraft_id = self.aircraft[values['aircraft'].strip().upper()]
+        except (KeyError, AttributeError):
+            raise ValueError(f"unknown aircraft {values['aircraft']!r}")
+
+        # Times without a UTC offset are local to their airport
+        departure_time = self.parse_time(values['departure_time'], departure_zone)
+        arrival_time = self.parse_time(values['arrival_time'], arrival_zone)
+        if arrival_time <= departure_time:
+            raise ValueError('arrival is not after departure')
+
+        if values['base_price']:
+            try:
+                base_price = Decimal(values['base_price'])
+            except InvalidOperation:
+                raise ValueError(f"invalid base price {values['base_price']!r}")
+        elif self.base_price is not None:
+            base_price = self.base_price
+        else:
+            raise ValueError('missing base price')
+
+        return Flight(
+            flight_number=values['flight_number'].strip(),
+            airline_id=airline_id,
+            aircraft_id=aircraft_id,
+            departure_airport_id=departure_airport_id,
+            arrival_airport_id=arrival_airport_id,
+            departure_time=departure_time,
+            arrival_time=arrival_time,
+            duration=arrival_time - departure_time,
+            base_price=base_price,
+            available_seats=self.bookable_seats[aircraft_id]
+        )
+
+    def parse_time(self, value, zone):
+        if isinstance(value, datetime):
+            return value
+        try:
+            moment = datetime.fromisoformat(value.strip())
+        except (ValueError, AttributeError):
+            raise ValueError(f'invalid date and time {value!r}')
+        return moment.replace(tzinfo=zone) if moment.tzinfo is None else moment
+
+    def import_batch(self, batch, counts):
+        flights = list(batch.values())
+        departure_times = [flight.departure_time for flight in flights]
+        # A time range rather than a second IN list: the index is probed once per
+        # flight number instead of once per flight number and departure time pair
+        matching = Flight.objects.filter(
+            flight_number__in={flight.flight_number for flight in flights},
+            departure_time__range=(min(departure_times), max(departure_times))
+        )
+        with transaction.atomic():
+            # An updated flight may move to another route, whose calendar day changes too
+            existing = {
+                (flight_number, departure_time): (pk, departure_airport_id, arrival_airport_id)
+                for pk, flight_number, departure_time, departure_airport_id, arrival_airport_id in matching.values_list(
+                    'id', 'flight_number', 'departure_time', 'departure_airport_id', 'arrival_airport_id'
+                )
+                if (flight_number, departure_time) in batch
+            }
+            unique_fields = (
+                ['flight_number', 'departure_time']
+                if connection.features.supports_update_conflicts_with_target else None
+            )
+            Flight.objects.bulk_create(
+                flights,
+                update_conflicts=True,
+                unique_fields=unique_fields,
+                update_fields=UPDATE_FIELDS
+            )
+            # Upserts do not say which rows were inserted or return their pks on every
+            # backend, so read the ids back and stock the flights that have no inventory
+            flight_ids = {
+                (flight_number, departure_time): pk
+                for pk, flight_number, departure_time in matching.values_list('id', 'flight_number', 'departure_time')
+                if (flight_number, departure_time) in batch
+            }
+            stocked = set(
+                SeatClass.objects.filter(flight_id__in=flight_ids.values()).values_list('flight_id', flat=True)
+            )
+            capacities = {
+                flight_ids[key]: self.capacities[flight.aircraft_id]
+                for key, flight in batch.items()
+                if flight_ids[key] not in stocked
+            }
+            SeatClass.objects.bulk_create(
+                [
+                    seat_class
+                    for flight_id, capacity in capacities.items()
+                    for seat_class in build_seat_classes(flight_id, capacity)
+                ],
+                batch_size=self.seat_batch_size
+            )
+            seat_classes = SeatClass.objects.filter(flight_id__in=capacities).only(
+                'id', 'flight_id', 'class_type', 'available_seats'
+            )
+            # A batch of wide-body flights holds hundreds of thousands of seats, so they are inserted as
+            # they are generated, as plain rows: building a model instance per seat and compiling it into
+            # the INSERT takes the ORM about ten times longer than the database takes to store it
+            seats = []
+            for seat_class in seat_classes.iterator(chunk_size=self.seat_batch_size):
+                counts['seat_classes'] += 1
+                seats.extend(
+                    (seat_class.flight_id, seat_number, seat_class.id, True, is_window, is_aisle)
+                    for seat_number, is_window, is_aisle in _layout(seat_class.class_type, seat_class.available_seats)
+                )
+                if len(seats) >= self.seat_batch_size:
+                    self.insert_seats(seats)
+                    counts['seats'] += len(seats)
+                    seats = []
+            if seats:
+                self.insert_seats(seats)
+                counts['seats'] += len(seats)
+        counts['flights'] += len(flights)
+        counts['stocked'] += len(capacities)
+        for flight in flights:
+            day = timezone.localtime(flight.departure_time).date()
+            self.route_days.add((flight.departure_airport_id, flight.arrival_airport_id, day))
+        for (_, departure_time), (_, departure_airport_id, arrival_airport_id) in existing.items():
+            self.route_days.add((departure_airport_id, arrival_airport_id, timezone.localtime(departure_time).date()))
+        self.added = self.added or len(existing) < len(flights)
+        if self.updated_flights is not None:
+            self.updated_flights.update(pk for pk, _, _ in existing.values())
+            if len(self.updated_flights) > self.batch_size:
+                # Past a batch of them, dropping every page is cheaper than bumping each flight
+                self.updated_flights = None
+
+    def insert_seats(self, rows):
+        quote = connection.ops.quote_name
+        columns = [Seat._meta.get_field(name).column
+                   for name in ('flight', 'seat_number', 'seat_class', 'is_available', 'is_window', 'is_aisle')]
+        with connection.cursor() as cursor:
+            cursor.executemany(
+                f'INSERT INTO {quote(Seat._meta.db_table)} ({", ".join(map(quote, columns))}) '
+                f'VALUES ({", ".join(["%s"] * len(columns))})',
+                rows
+            )
@@ -1,16 +1,50 @@
 from django.core.management.base import BaseCommand
+from django.db import transaction
 from django.utils import timezone
 from datetime import datetime, timedelta
 from decimal import Decimal
 from flights.models import Airport, Airline, Aircraft, Flight, SeatClass, Seat
+from flights import fare_calendar
+from flights.inventory import build_seat_classes, build_seats
+from flights.popularity import refresh_all
 import random
+import time
 
 class Command(BaseCommand):
     help = 'Populate the database with sample flight data'
 
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, default=30, help='Number of days to generate flights for')
+        parser.add_argument('--flights-per-day', type=int, default=None,
+                            help='Flights per day (default: random between 5 and 15)')
+        parser.add_argument('--scale', type=int, default=1, help='Multiply the number of flights per day')
+        parser.add_argument('--seed', type=int, default=None, help='Random seed for reproducible data')
+        parser.add_argument('--batch-size', type=int, default=5000, help='Rows per bulk INSERT')
+
     def handle(self, *args, **options):
+        self.rng = random.Random(options['seed'])
+        self.batch_size = options['batch_size']
         self.stdout.write('Creating sample data...')
-        
+
+        started = time.perf_counter()
+        with transaction.atomic():
+            self.create_reference_data()
+            counts = self.create_flights(options['days'], options['flights_per_day'], options['scale'])
+            # bulk_create skips signals, so rebuild the derived tables in one pass each
+            refresh_all()
+            fare_calendar.rebuild()
+        elapsed = time.perf_counter() - started
+
+        total_rows = sum(counts.values())
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Successfully created sample data with {counts['flights']} flights, "
+                f"{counts['seat_classes']} seat classes and {counts['seats']} seats"
+            )
+        )
+        self.stdout.write(f'Inserted {total_rows} rows in {elapsed:.2f}s ({total_rows / max(elapsed, 1e-9):.0f} rows/second)')
+
+    def create_reference_data(self):
         # Create Airports
         airports_data = [
             {'code': 'NYC', 'name': 'John F. Kennedy International Airport', 'city': 'New York', 'country': 'USA', 'timezone': 'America/New_York'},
@@ -22,7 +56,7 @@ class Command(BaseCommand):
             {'code': 'NRT', 'name': 'Narita International Airport', 'city': 'Tokyo', 'country': 'Japan', 'timezone': 'Asia/Tokyo'},
             {'code': 'CDG', 'name': 'Charles de Gaulle Airport', 'city': 'Paris', 'country': 'France', 'timezone': 'Europe/Paris'},
         ]
-        
+
         for airport_data in airports_data:
             airport, created = Airport.objects.get_or_create(
                 code=airport_data['code'],
@@ -42,7 +76,7 @@ class Command(BaseCommand):
             {'code': 'QF', 'name': 'Qantas'},
             {'code': 'AF', 'name': 'Air France'},
         ]
-        
+
         for airline_data in airlines_data:
             airline, created = Airline.objects.get_or_create(
                 code=airline_data['code'],
@@ -59,7 +93,7 @@ class Command(BaseCommand):
             {'manufacturer': 'Airbus', 'model': 'A380', 'capacity': 550},
             {'manufacturer': 'Boeing', 'model': '787-9', 'capacity': 290},
         ]
-        
+
         for aircraft_info in aircraft_data:
             aircraft, created = Aircraft.objects.get_or_create(
                 manufacturer=aircraft_info['manufacturer'],
@@ -69,75 +103,94 @@ class Command(BaseCommand):
             if created:
                 self.stdout.write(f'Created aircraft: {aircraft.manufacturer} {aircraft.model}')
 
-        # Create Flights
+    def create_flights(self, days, flights_per_day, scale):
         airports = list(Airport.objects.all())
         airlines = list(Airline.objects.all())
         aircrafts = list(Aircraft.objects.all())
-        
-        # Generate flights for the next 30 days
-        for day in range(30):
-            date = timezone.now().date() + timedelta(days=day)
-            
-            for _ in range(random.randint(5, 15)):  # 5-15 flights per day
-                departure_airport = random.choice(airports)
-                arrival_airport = random.choice([a for a in airports if a != departure_airport])
-                
+        today = timezone.now().date()
+        counts = {'flights': 0, 'seat_classes': 0, 'seats': 0}
+
+        # (flight_number, departure_time) is unique, so skip pairs that already exist
+        window_start = timezone.make_aware(datetime.combine(today, datetime.min.time()))
+        used_keys = set(Flight.objects.filter(
+            departure_time__gte=window_start,
+            departure_time__lt=window_start + timedelta(days=days)
+        ).values_list('flight_number', 'departure_time'))
+
+        pending = []
+        for day in range(days):
+            date = today + timedelta(days=day)
+            count = flights_per_day if flights_per_day is not None else self.rng.randint(5, 15)
+
+            for _ in range(count * scale):
+                departure_airport = self.rng.choice(airports)
+                arrival_airport = self.rng.choice([a for a in airports if a != departure_airport])
+
                 # Random departure time
-                hour = random.randint(6, 22)
-                minute = random.choice([0, 15, 30, 45])
-                departure_time = timezone.make_aware(
-                    datetime.combine(date, datetime.min.time().replace(hour=hour, minute=minute))
-                )
-                
+                while True:
+                    hour = self.rng.randint(6, 22)
+                    minute = self.rng.choice([0, 15, 30, 45])
+                    departure_time = timezone.make_aware(
+                        datetime.combine(date, datetime.min.time().replace(hour=hour, minute=minute))
+                    )
+                    flight_number = str(self.rng.randint(100, 9999))
+                    if (flight_number, departure_time) not in used_keys:
+                        used_keys.add((flight_number, departure_time))
+                        break
+
                 # Flight duration (2-12 hours)
-                duration_hours = random.randint(2, 12)
-                duration = timedelta(hours=duration_hours, minutes=random.randint(0, 59))
-                arrival_time = departure_time + duration
-                
-                flight = Flight.objects.create(
-                    flight_number=str(random.randint(100, 9999)),
-                    airline=random.choice(airlines),
-                    aircraft=random.choice(aircrafts),
+                duration = timedelta(hours=self.rng.randint(2, 12), minutes=self.rng.randint(0, 59))
+
+                pending.append(Flight(
+                    flight_number=flight_number,
+                    airline=self.rng.choice(airlines),
+                    aircraft=self.rng.choice(aircrafts),
                     departure_airport=departure_airport,
                     arrival_airport=arrival_airport,
                     departure_time=departure_time,
-                    arrival_time=arrival_time,
+                    arrival_time=departure_time + duration,
                     duration=duration,
-                    base_price=Decimal(str(random.randint(200, 1500))),
-                    available_seats=random.randint(50, 200)
-                )
-                
-                # Create seat classes
-                seat_classes_data = [
-                    {'class_type': 'economy', 'price_multiplier': Decimal('1.0'), 'available_seats': int(flight.available_seats * 0.7), 'baggage_allowance': 23},
-                    {'class_type': 'premium_economy', 'price_multiplier': Decimal('1.5'), 'available_seats': int(flight.available_seats * 0.2), 'baggage_allowance': 32},
-                    {'class_type': 'business', 'price_multiplier': Decimal('3.0'), 'available_seats': int(flight.available_seats * 0.08), 'baggage_allowance': 32},
-                    {'class_type': 'first', 'price_multiplier': Decimal('5.0'), 'available_seats': int(flight.available_seats * 0.02), 'baggage_allowance': 32},
-                ]
-                
-                for class_data in seat_classes_data:
-                    if class_data['available_seats'] > 0:
-                        seat_class = SeatClass.objects.create(
-                            flight=flight,
-                            **class_data
-                        )
-                        
-                        # Create seats for this class
-                        seat_counter = 0
-                        for i in range(class_data['available_seats']):
-                            row = (seat_counter // 6) + 1
-                            seat_letter = chr(65 + (seat_counter % 6))  # A, B, C, D, E, F
-                            seat_number = f"{class_data['class_type'][0].upper()}{row}{seat_letter}"
-                            
-                            Seat.objects.create(
-                                flight=flight,
-                                seat_number=seat_number,
-                                seat_class=seat_class,
-                                is_window=(seat_letter in ['A', 'F']),
-                                is_aisle=(seat_letter in ['C', 'D'])
-                            )
-                            seat_counter += 1
+                    base_price=Decimal(str(self.rng.randint(200, 1500))),
+                    available_seats=self.rng.randint(50, 200)
+                ))
+                # Flush in chunks so memory stays bounded at any scale
+                if len(pending) * 200 >= self.batch_size:
+                    self.insert_flights(pending, counts)
+                    pending = []
 
-        self.stdout.write(
-            self.style.SUCCESS(f'Successfully created sample data with {Flight.objects.count()} flights')
+        if pending:
+            self.insert_flights(pending, counts)
+        return counts
+
+    def insert_flights(self, flights, counts):
+        flights = self.bulk_create_with_pks(
+            Flight, flights,
+            lambda objs: Flight.objects.filter(
+                departure_time__in={f.departure_time for f in objs},
+                flight_number__in={f.flight_number for f in objs}
+            ),
+            lambda f: (f.flight_number, f.departure_time)
         )
+        counts['flights'] += len(flights)
+
+        seat_classes = [
+            seat_class for flight in flights for seat_class in build_seat_classes(flight.id, flight.available_seats)
+        ]
+        seat_classes = self.bulk_create_with_pks(
+            SeatClass, seat_classes,
+            lambda objs: SeatClass.objects.filter(flight__in={sc.flight_id for sc in objs}),
+            lambda sc: (sc.flight_id, sc.class_type)
+        )
+        counts['seat_classes'] += len(seat_classes)
+
+        seats = [seat for seat_class in seat_classes for seat in build_seats(seat_class)]
+        Seat.objects.bulk_create(seats, batch_size=self.batch_size)
+        counts['seats'] += len(seats)
+
+    def bulk_create_with_pks(self, model, objs, lookup, key):
+        created = model.objects.bulk_create(objs, batch_size=self.batch_size)
+        if all(obj.pk for obj in created):
+            return created
+        # Backends without INSERT ... RETURNING (MySQL) leave pks unset; read them back by natural key
+        wanted = {key(obj): obj for obj in objs}
+        return [obj for obj in lookup(objs) if key(obj) in wanted]
@@ -0,0 +1,9 @@
+from django.core.management.base import BaseCommand
+from flights.fare_calendar import rebuild
+
+class Command(BaseCommand):
+    help = 'Rebuild the lowest-fare calendar from scheduled flights with seats left'
+
+    def handle(self, *args, **options):
+        count = rebuild()
+        self.stdout.write(self.style.SUCCESS(f'Stored lowest fares for {count} route/day/class combinations'))
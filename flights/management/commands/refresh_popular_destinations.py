@@ -0,0 +1,9 @@
+from django.core.management.base import BaseCommand
+from flights.popularity import refresh_all
+
+class Command(BaseCommand):
+    help = 'Rebuild the destination popularity table from flights and confirmed bookings (run from cron)'
+
+    def handle(self, *args, **options):
+        count = refresh_all()
+        self.stdout.write(self.style.SUCCESS(f'Refreshed popularity for {count} airports'))
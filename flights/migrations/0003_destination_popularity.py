@@ -0,0 +1,28 @@
+# Generated by Django 5.2.18 on 2026-10-18 15:15
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('flights', '0002_flight_search_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DestinationPopularity',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('flight_count', models.IntegerField(default=0)),
+                ('booking_count', models.IntegerField(default=0)),
+                ('score', models.IntegerField(db_index=True, default=0)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('airport', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='popularity', to='flights.airport')),
+            ],
+            options={
+                'verbose_name_plural': 'destination popularity',
+            },
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-18 15:23
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('flights', '0003_destination_popularity'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='airport',
+            name='min_connection_minutes',
+            field=models.PositiveSmallIntegerField(default=60),
+        ),
+    ]
@@ -0,0 +1,30 @@
+# Generated by Django 5.2.18 on 2026-10-18 15:27
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('flights', '0004_airport_min_connection_minutes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='LowestFare',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField()),
+                ('class_type', models.CharField(choices=[('economy', 'Economy'), ('premium_economy', 'Premium Economy'), ('business', 'Business'), ('first', 'First Class')], max_length=20)),
+                ('fare', models.DecimalField(decimal_places=2, max_digits=12)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('arrival_airport', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='flights.airport')),
+                ('departure_airport', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='flights.airport')),
+                ('flight', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='flights.flight')),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('departure_airport', 'arrival_airport', 'date', 'class_type'), name='lowest_fare_route_date_class')],
+            },
+        ),
+    ]
@@ -0,0 +1,49 @@
+from django.conf import settings
+from django.db import migrations
+from django.db.models import Count
+
+# flights.popularity.BOOKED_STATUSES, copied so the migration doesn't change if the module does
+BOOKED_STATUSES = ['confirmed', 'completed']
+
+
+def backfill(apps, schema_editor):
+    """popularity.refresh_all() against the historical models, so existing airports rank from the start."""
+    Airport = apps.get_model('flights', 'Airport')
+    Flight = apps.get_model('flights', 'Flight')
+    DestinationPopularity = apps.get_model('flights', 'DestinationPopularity')
+    Booking = apps.get_model('bookings', 'Booking')
+
+    flight_counts = dict(
+        Flight.objects.exclude(status='cancelled').order_by().values('arrival_airport').annotate(
+            n=Count('id')
+        ).values_list('arrival_airport', 'n')
+    )
+    booking_counts = dict(
+        Booking.objects.filter(status__in=BOOKED_STATUSES).order_by().values('flight__arrival_airport').annotate(
+            n=Count('id')
+        ).values_list('flight__arrival_airport', 'n')
+    )
+    weight = getattr(settings, 'POPULAR_DESTINATIONS_BOOKING_WEIGHT', 0)
+    # Rows made by adjust() before this ran hold single deltas, not totals
+    DestinationPopularity.objects.all().delete()
+    DestinationPopularity.objects.bulk_create([
+        DestinationPopularity(
+            airport_id=airport_id,
+            flight_count=flight_counts.get(airport_id, 0),
+            booking_count=booking_counts.get(airport_id, 0),
+            score=flight_counts.get(airport_id, 0) + booking_counts.get(airport_id, 0) * weight
+        )
+        for airport_id in Airport.objects.values_list('id', flat=True)
+    ], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('flights', '0005_lowest_fare'),
+        ('bookings', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.RunPython(backfill, migrations.RunPython.noop),
+    ]
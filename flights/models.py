@@ -7,6 +7,7 @@ class Airport(models.Model):
     city = models.CharField(max_length=100)
     country = models.CharField(max_length=100)
     timezone = models.CharField(max_length=50)
+    min_connection_minutes = models.PositiveSmallIntegerField(default=60)
     
     def __str__(self):
         return f"{self.code} - {self.name}"
@@ -51,10 +52,35 @@ class Flight(models.Model):
     
     class Meta:
         unique_together = ['flight_number', 'departure_time']
+        indexes = [
+            models.Index(fields=['departure_airport', 'arrival_airport', 'status', 'departure_time'],
+                         name='flight_route_search_idx'),
+            models.Index(fields=['status', 'departure_time'], name='flight_status_departure_idx'),
+        ]
+    
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Remember what was loaded so signal handlers can tell what changed
+        instance._loaded_values = dict(zip(field_names, values))
+        return instance
     
     def __str__(self):
         return f"{self.airline.code}{self.flight_number} - {self.departure_airport.code} to {self.arrival_airport.code}"
 
+class DestinationPopularity(models.Model):
+    airport = models.OneToOneField(Airport, related_name='popularity', on_delete=models.CASCADE)
+    flight_count = models.IntegerField(default=0)
+    booking_count = models.IntegerField(default=0)
+    score = models.IntegerField(default=0, db_index=True)
+    updated_at = models.DateTimeField(auto_now=True)
+    
+    class Meta:
+        verbose_name_plural = 'destination popularity'
+    
+    def __str__(self):
+        return f"{self.airport.code} - {self.score}"
+
 class SeatClass(models.Model):
     CLASS_TYPES = [
         ('economy', 'Economy'),
@@ -73,11 +99,32 @@ class SeatClass(models.Model):
         unique_together = ['flight', 'class_type']
     
     def get_price(self):
-        return self.flight.base_price * self.price_multiplier
+        from .fares import seat_price
+        return seat_price(self.flight.base_price, self.price_multiplier)
     
     def __str__(self):
         return f"{self.flight} - {self.class_type}"
 
+class LowestFare(models.Model):
+    """Cheapest available fare per route, departure day and class, kept current by flights.fare_calendar."""
+    departure_airport = models.ForeignKey(Airport, related_name='+', on_delete=models.CASCADE)
+    arrival_airport = models.ForeignKey(Airport, related_name='+', on_delete=models.CASCADE)
+    date = models.DateField()
+    class_type = models.CharField(max_length=20, choices=SeatClass.CLASS_TYPES)
+    fare = models.DecimalField(max_digits=12, decimal_places=2)
+    flight = models.ForeignKey(Flight, related_name='+', on_delete=models.CASCADE)
+    updated_at = models.DateTimeField(auto_now=True)
+    
+    class Meta:
+        constraints = [
+            # Also the index calendar reads use: route equality, then a date range
+            models.UniqueConstraint(fields=['departure_airport', 'arrival_airport', 'date', 'class_type'],
+                                    name='lowest_fare_route_date_class'),
+        ]
+    
+    def __str__(self):
+        return f"{self.departure_airport_id}-{self.arrival_airport_id} {self.date} {self.class_type}: {self.fare}"
+
 class Seat(models.Model):
     flight = models.ForeignKey(Flight, related_name='seats', on_delete=models.CASCADE)
     seat_number = models.CharField(max_length=5)
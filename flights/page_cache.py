@@ -0,0 +1,146 @@
+import hashlib
+from urllib.parse import urlencode
+from django.conf import settings
+from django.core.cache import caches
+from django.db import transaction
+from . import concurrent
+
+GENERATION_KEY = 'pages:generation'
+FLIGHT_VERSION_KEY = 'pages:flight:{}'
+STATS_KEY = 'pages:stats:{}:{}'
+STATS_VIEWS_KEY = 'pages:stats:views'
+MISSING = object()
+# Searched for by name, so 'Paris' and ' paris' are the same page
+CASE_INSENSITIVE_PARAMS = {'departure_city', 'arrival_city'}
+
+
+def get_cache():
+    return caches[getattr(settings, 'PAGE_CACHE_ALIAS', 'default')]
+
+
+def normalize_params(params):
+    # Ordering and empty values must not split the cache, nor case and whitespace
+    # in the city fields; everything else, keyset cursors above all, is kept exactly
+    normalized = {}
+    for key, value in params.items():
+        value = str(value)
+        if key in CASE_INSENSITIVE_PARAMS:
+            value = value.strip().lower()
+        if value:
+            normalized[key] = value
+    return urlencode(sorted(normalized.items()))
+
+
+def _generation(cache):
+    return cache.get_or_set(GENERATION_KEY, 1, None)
+
+
+def make_key(view_name, params=None):
+    cache = get_cache()
+    digest = hashlib.md5(normalize_params(params or {}).encode()).hexdigest()
+    return f'pages:{_generation(cache)}:{view_name}:{digest}'
+
+
+def _count(cache, view_name, outcome):
+    key = STATS_KEY.format(view_name, outcome)
+    if not cache.add(key, 1, None):
+        try:
+            cache.incr(key)
+        except ValueError:
+            cache.set(key, 1, None)
+    views = cache.get(STATS_VIEWS_KEY, set())
+    if view_name not in views:
+        cache.set(STATS_VIEWS_KEY, views | {view_name}, None)
+
+
+def _lookup(view_name, params, is_fresh=None):
+    cache = get_cache()
+    key = make_key(view_name, params)
+    value = cache.get(key, MISSING)
+    if value is not MISSING and is_fresh is not None and not is_fresh(value):
+        value = MISSING
+    _count(cache, view_name, 'misses' if value is MISSING else 'hits')
+    return key, value
+
+
+def _store(key, value, timeout):
+    if timeout is None:
+        timeout = getattr(settings, 'PAGE_CACHE_TIMEOUT', 300)
+    get_cache().set(key, value, timeout)
+
+
+def get_or_build(view_name, params, builder, timeout=None, is_fresh=None):
+    """Return the cached value for a view and its normalized params, building it on a miss.
+
+    A cached value that `is_fresh(value)` rejects counts as a miss and is rebuilt.
+    """
+    key, value = _lookup(view_name, params, is_fresh)
+    if value is MISSING:
+        value = builder()
+        _store(key, value, timeout)
+    return value
+
+
+async def aget_or_build(view_name, params, builder, timeout=None, is_fresh=None):
+    """get_or_build for async views, where `builder` returns an awaitable."""
+    key, value = await concurrent.read(_lookup, view_name, params, is_fresh)
+    if value is MISSING:
+        value = await builder()
+        await concurrent.read(_store, key, value, timeout)
+    return value
+
+
+def invalidate_all():
+    """Drop every cached page by moving to a new key generation."""
+    cache = get_cache()
+    try:
+        cache.incr(GENERATION_KEY)
+    except ValueError:
+        cache.set(GENERATION_KEY, 2, None)
+
+
+def flight_versions(flight_ids):
+    """Seat inventory version of each flight, 0 until invalidate_flights() first bumps it."""
+    keys = {FLIGHT_VERSION_KEY.format(flight_id): flight_id for flight_id in flight_ids}
+    found = get_cache().get_many(keys) if keys else {}
+    return {flight_id: found.get(key, 0) for key, flight_id in keys.items()}
+
+
+def invalidate_flights(*flight_ids):
+    """Bump the inventory version of these flights once the current transaction commits.
+
+    Seat counts change through bulk UPDATEs, which send no signals, and far
+    too often to drop every page with invalidate_all(). Pages that show seat
+    counts key or check their entries on flight_versions() instead, so only
+    the pages of the flights that changed are rebuilt.
+    """
+    flight_ids = set(flight_ids)
+    if not flight_ids:
+        return
+
+    def bump():
+        cache = get_cache()
+        for flight_id in flight_ids:
+            key = FLIGHT_VERSION_KEY.format(flight_id)
+            if not cache.add(key, 1, None):
+                try:
+                    cache.incr(key)
+                except ValueError:
+                    cache.set(key, 1, None)
+
+    transaction.on_commit(bump)
+
+
+def stats():
+    cache = get_cache()
+    result = {}
+    for view_name in sorted(cache.get(STATS_VIEWS_KEY, set())):
+        hits = cache.get(STATS_KEY.format(view_name, 'hits'), 0)
+        misses = cache.get(STATS_KEY.format(view_name, 'misses'), 0)
+        total = hits + misses
+        result[view_name] = {
+            'hits': hits,
+            'misses': misses,
+            'hit_rate': round(hits / total, 3) if total else None,
+        }
+    return result
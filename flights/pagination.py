@@ -0,0 +1,138 @@
+import asyncio
+import base64
+import json
+from django.conf import settings
+from django.db.models import Q
+from . import concurrent
+
+
+class KeysetPage:
+    """One page of a KeysetPaginator. Holds no queryset, so it can be cached as is."""
+
+    def __init__(self, object_list, next_cursor=None, previous_cursor=None, count=None, count_is_capped=False):
+        self.object_list = object_list
+        self.next_cursor = next_cursor
+        self.previous_cursor = previous_cursor
+        self.count = count
+        self.count_is_capped = count_is_capped
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def has_next(self):
+        return self.next_cursor is not None
+
+    def has_previous(self):
+        return self.previous_cursor is not None
+
+    def has_other_pages(self):
+        return self.has_next() or self.has_previous()
+
+
+class KeysetPaginator:
+    """Paginate by seeking past the last row seen instead of using OFFSET.
+
+    `ordering` must end in a unique field so every row has a distinct position.
+    Each page is one indexed range query however deep the client goes. The total
+    is counted exactly ('exact'), capped at `count_limit` rows ('approximate'),
+    or skipped ('off'); `count_mode` defaults to the LIST_COUNT_MODE setting.
+    """
+
+    def __init__(self, queryset, per_page, ordering=('departure_time', 'id'), count_mode=None, count_limit=None):
+        self.queryset = queryset
+        self.per_page = per_page
+        self.ordering = ordering
+        self.count_mode = count_mode if count_mode is not None else getattr(settings, 'LIST_COUNT_MODE', 'exact')
+        self.count_limit = count_limit or getattr(settings, 'LIST_COUNT_LIMIT', 1000)
+        self.count_is_capped = False
+        self._count = None
+
+    @property
+    def count(self):
+        if self._count is None and self.count_mode != 'off':
+            if self.count_mode == 'approximate':
+                # Counting a bounded slice stops the scan after count_limit + 1 rows
+                count = self.queryset.order_by()[:self.count_limit + 1].count()
+                self.count_is_capped = count > self.count_limit
+                self._count = min(count, self.count_limit)
+            else:
+                self._count = self.queryset.count()
+        return self._count
+
+    def _fields(self):
+        return [(name.lstrip('-'), name.startswith('-')) for name in self.ordering]
+
+    def encode_cursor(self, obj):
+        values = []
+        for name, _ in self._fields():
+            value = getattr(obj, name)
+            values.append(value.isoformat() if hasattr(value, 'isoformat') else value)
+        return base64.urlsafe_b64encode(json.dumps(values).encode()).decode().rstrip('=')
+
+    def decode_cursor(self, cursor):
+        """Return the field values stored in a cursor, or None if it is malformed."""
+        try:
+            values = json.loads(base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)))
+            fields = self._fields()
+            if len(values) != len(fields):
+                return None
+            opts = self.queryset.model._meta
+            return [opts.get_field(name).to_python(value) for (name, _), value in zip(fields, values)]
+        except (ValueError, TypeError, AttributeError):
+            return None
+
+    def _seek(self, values, backwards):
+        # (a, b) > (x, y) expands to a > x OR (a = x AND b > y), which the
+        # composite indexes can serve as a range scan
+        condition = Q()
+        equal = {}
+        for (name, descending), value in zip(self._fields(), values):
+            lookup = 'lt' if descending != backwards else 'gt'
+            condition |= Q(**equal, **{f'{name}__{lookup}': value})
+            equal[name] = value
+        return condition
+
+    def _page_queryset(self, after, before):
+        backwards = False
+        queryset = self.queryset.order_by(*self.ordering)
+        values = self.decode_cursor(after) if after else None
+        if values is None and before:
+            values = self.decode_cursor(before)
+            backwards = values is not None
+        if values is not None:
+            queryset = queryset.filter(self._seek(values, backwards))
+        if backwards:
+            queryset = queryset.reverse()
+        return queryset[:self.per_page + 1], values, backwards
+
+    def _build_page(self, rows, values, backwards):
+        more = len(rows) > self.per_page
+        rows = rows[:self.per_page]
+        if backwards:
+            rows.reverse()
+            has_next, has_previous = True, more
+        else:
+            has_next, has_previous = more, values is not None
+        return KeysetPage(
+            rows,
+            next_cursor=self.encode_cursor(rows[-1]) if has_next and rows else None,
+            previous_cursor=self.encode_cursor(rows[0]) if has_previous and rows else None,
+            count=self.count,
+            count_is_capped=self.count_is_capped,
+        )
+
+    def page(self, after=None, before=None):
+        queryset, values, backwards = self._page_queryset(after, before)
+        return self._build_page(list(queryset), values, backwards)
+
+    async def apage(self, after=None, before=None):
+        """page() for async views: the rows and the count are read side by side."""
+        queryset, values, backwards = self._page_queryset(after, before)
+        rows, _ = await asyncio.gather(
+            concurrent.read(list, queryset),
+            concurrent.read(lambda: self.count)
+        )
+        return self._build_page(rows, values, backwards)
@@ -0,0 +1,32 @@
+import json
+import re
+from django.db import connection
+
+
+def explain(queryset):
+    """The database's plan for `queryset`, as JSON text on MySQL so it can be walked."""
+    if connection.vendor == 'mysql':
+        return queryset.explain(format='json')
+    return queryset.explain()
+
+
+def is_full_scan(plan, model):
+    """Whether `plan` reads every row of `model`'s table instead of going through an index."""
+    table = model._meta.db_table
+    if connection.vendor == 'mysql':
+        return _mysql_full_scan(json.loads(plan), table)
+    if connection.vendor == 'postgresql':
+        return f'Seq Scan on {table}' in plan
+    if connection.vendor == 'sqlite':
+        return re.search(rf'SCAN {table}\b(?! USING)', plan) is not None
+    return False
+
+
+def _mysql_full_scan(node, table):
+    if isinstance(node, dict):
+        if node.get('table_name') == table and node.get('access_type') == 'ALL':
+            return True
+        return any(_mysql_full_scan(value, table) for value in node.values())
+    if isinstance(node, list):
+        return any(_mysql_full_scan(value, table) for value in node)
+    return False
@@ -0,0 +1,77 @@
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import Count, F
+from .models import Airport, DestinationPopularity, Flight
+
+BOOKED_STATUSES = ['confirmed', 'completed']
+
+
+def booking_weight():
+    return getattr(settings, 'POPULAR_DESTINATIONS_BOOKING_WEIGHT', 0)
+
+
+def adjust(airport_id, flights=0, bookings=0):
+    """Apply a delta to one airport's counters with F() expressions."""
+    if not airport_id or not (flights or bookings):
+        return
+    score = flights + bookings * booking_weight()
+    updates = {
+        'flight_count': F('flight_count') + flights,
+        'booking_count': F('booking_count') + bookings,
+        'score': F('score') + score,
+    }
+    if DestinationPopularity.objects.filter(airport_id=airport_id).update(**updates):
+        return
+    _, created = DestinationPopularity.objects.get_or_create(
+        airport_id=airport_id,
+        defaults={'flight_count': flights, 'booking_count': bookings, 'score': score}
+    )
+    if not created:
+        DestinationPopularity.objects.filter(airport_id=airport_id).update(**updates)
+
+
+def adjust_for_flight(flight_id, bookings):
+    airport_id = Flight.objects.filter(id=flight_id).values_list('arrival_airport_id', flat=True).first()
+    adjust(airport_id, bookings=bookings)
+
+
+def popular_destinations(limit=6):
+    # Single indexed read; airports with no row yet simply don't rank
+    return Airport.objects.filter(popularity__isnull=False).annotate(
+        flight_count=F('popularity__flight_count')
+    ).order_by('-popularity__score', 'code')[:limit]
+
+
+def refresh_all():
+    """Rebuild every airport's counters from Flight and Booking in a few grouped queries."""
+    from bookings.models import Booking
+
+    flight_counts = dict(
+        Flight.objects.exclude(status='cancelled').order_by().values('arrival_airport').annotate(
+            n=Count('id')
+        ).values_list('arrival_airport', 'n')
+    )
+    booking_counts = dict(
+        Booking.objects.filter(status__in=BOOKED_STATUSES).order_by().values('flight__arrival_airport').annotate(
+            n=Count('id')
+        ).values_list('flight__arrival_airport', 'n')
+    )
+    weight = booking_weight()
+    rows = [
+        DestinationPopularity(
+            airport_id=airport_id,
+            flight_count=flight_counts.get(airport_id, 0),
+            booking_count=booking_counts.get(airport_id, 0),
+            score=flight_counts.get(airport_id, 0) + booking_counts.get(airport_id, 0) * weight
+        )
+        for airport_id in Airport.objects.values_list('id', flat=True)
+    ]
+    unique_fields = ['airport'] if connection.features.supports_update_conflicts_with_target else None
+    with transaction.atomic():
+        DestinationPopularity.objects.bulk_create(
+            rows,
+            update_conflicts=True,
+            unique_fields=unique_fields,
+            update_fields=['flight_count', 'booking_count', 'score', 'updated_at']
+        )
+    return len(rows)
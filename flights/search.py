@@ -0,0 +1,280 @@
+from django.conf import settings
+from django.db.models import F, Prefetch, Q
+from django.utils import timezone
+from datetime import date, datetime, timedelta
+import asyncio
+import heapq
+from collections import defaultdict
+from bookings.holds import expired_hold_seats
+from . import concurrent, fares
+from .airports import resolver
+from .models import Airport, Flight, SeatClass
+from .pagination import KeysetPaginator
+
+
+def seat_class_queryset(passengers=1):
+    # The base price comes along so fares.price_flights never touches class.flight;
+    # seats held by expired bookings count as free even before they are swept
+    return SeatClass.objects.annotate(
+        base_price=F('flight__base_price'),
+        free_seats=F('available_seats') + expired_hold_seats('seat_class')
+    ).filter(
+        free_seats__gte=passengers
+    ).order_by('id')
+
+
+def parse_date(value):
+    if isinstance(value, datetime):
+        return value.date()
+    if isinstance(value, date):
+        return value
+    try:
+        return datetime.strptime(value, '%Y-%m-%d').date()
+    except (TypeError, ValueError):
+        return None
+
+
+def day_range(day):
+    # Half-open [start, end) range so the departure_time index can be used;
+    # departure_time__date wraps the column in a function and forces a scan
+    start = timezone.make_aware(datetime.combine(day, datetime.min.time()))
+    return start, start + timedelta(days=1)
+
+
+def filter_departure_date(flights, day, prefix=''):
+    start, end = day_range(day)
+    return flights.filter(**{f'{prefix}departure_time__gte': start, f'{prefix}departure_time__lt': end})
+
+
+def filter_route(flights, departure_city='', arrival_city=''):
+    # Resolve typed cities/codes to airport ids in-process so the Flight
+    # query is an indexed IN lookup instead of a LIKE scan over Airport
+    return filter_airports(flights, resolver.resolve(departure_city), resolver.resolve(arrival_city))
+
+
+def filter_airports(flights, departure_ids, arrival_ids, prefix=''):
+    # None means "no filter" on that side, as resolver.resolve returns for an empty term;
+    # `prefix` applies the same filter to a related model, e.g. 'flight__' for seat classes
+    if departure_ids is not None:
+        flights = flights.filter(**{f'{prefix}departure_airport_id__in': departure_ids})
+    if arrival_ids is not None:
+        flights = flights.filter(**{f'{prefix}arrival_airport_id__in': arrival_ids})
+    return flights
+
+
+def with_availability(flights, passengers=1):
+    # Seat counts, related rows and bookable classes for a set of flights in two queries
+    return flights.annotate(
+        free_seats=F('available_seats') + expired_hold_seats('flight')
+    ).filter(free_seats__gte=passengers).select_related(
+        'airline', 'departure_airport', 'arrival_airport', 'aircraft'
+    ).prefetch_related(
+        Prefetch('seat_classes', queryset=seat_class_queryset(passengers), to_attr='matching_classes')
+    )
+
+
+def search_queryset(departure_city, arrival_city, departure_date, passengers=1):
+    day = parse_date(departure_date)
+    if day is None:
+        return Flight.objects.none()
+    flights = filter_departure_date(Flight.objects.filter(status='scheduled'), day)
+    return with_availability(filter_route(flights, departure_city, arrival_city), passengers)
+
+
+def serialize_seat_class(seat_class):
+    return {
+        'type': seat_class.class_type,
+        'price': float(seat_class.price),
+        'total_price': float(seat_class.total_price),
+        'available_seats': seat_class.free_seats,
+        'baggage_allowance': seat_class.baggage_allowance
+    }
+
+
+def serialize_flight(flight):
+    return {
+        'id': flight.id,
+        'flight_number': f"{flight.airline.code}{flight.flight_number}",
+        'airline': flight.airline.name,
+        'departure_airport': f"{flight.departure_airport.code} - {flight.departure_airport.name}",
+        'arrival_airport': f"{flight.arrival_airport.code} - {flight.arrival_airport.name}",
+        'departure_time': flight.departure_time.strftime('%Y-%m-%d %H:%M'),
+        'arrival_time': flight.arrival_time.strftime('%Y-%m-%d %H:%M'),
+        'duration': str(flight.duration),
+        'available_seats': flight.free_seats,
+        'seat_classes': [serialize_seat_class(seat_class) for seat_class in flight.matching_classes]
+    }
+
+
+def search(departure_city, arrival_city, departure_date, passengers=1):
+    """Return the JSON-ready flight list for a search in a constant number of queries."""
+    flights = list(search_queryset(departure_city, arrival_city, departure_date, passengers))
+    fares.price_flights(flights, passengers)
+    return [serialize_flight(flight) for flight in flights]
+
+
+def iter_search(departure_city, arrival_city, departure_date, passengers=1, chunk_size=None):
+    """Yield search() results one flight at a time, in departure order, for streaming.
+
+    Flights are read and priced SEARCH_STREAM_CHUNK_SIZE at a time, each chunk
+    a keyset seek past the last, so memory stays flat however many match.
+    QuerySet.iterator() would not do here: the MySQL driver buffers the whole
+    result set client-side, and the seat classes need prefetching per chunk anyway.
+    """
+    chunk_size = chunk_size or getattr(settings, 'SEARCH_STREAM_CHUNK_SIZE', 2000)
+    paginator = KeysetPaginator(search_queryset(departure_city, arrival_city, departure_date, passengers),
+                                chunk_size, count_mode='off')
+    page = paginator.page()
+    while True:
+        fares.price_flights(page.object_list, passengers)
+        for flight in page:
+            yield serialize_flight(flight)
+            # Prefetched classes point back at their flight; breaking that cycle frees
+            # each chunk once it is sent instead of at the next full garbage collection
+            del flight.matching_classes
+        if not page.has_next():
+            return
+        page = paginator.page(after=page.next_cursor)
+
+
+async def aiter_search(departure_city, arrival_city, departure_date, passengers=1, chunk_size=None):
+    """iter_search() for async views: each chunk is read on a worker thread, so the event loop never waits on it."""
+    chunk_size = chunk_size or getattr(settings, 'SEARCH_STREAM_CHUNK_SIZE', 2000)
+    # Resolving the cities only reads the database while the airport index is cold
+    queryset = await concurrent.read(search_queryset, departure_city, arrival_city, departure_date, passengers)
+    paginator = KeysetPaginator(queryset, chunk_size, count_mode='off')
+    page = await concurrent.read(paginator.page)
+    while True:
+        fares.price_flights(page.object_list, passengers)
+        for flight in page:
+            yield serialize_flight(flight)
+            del flight.matching_classes
+        if not page.has_next():
+            return
+        page = await concurrent.read(paginator.page, after=page.next_cursor)
+
+
+async def asearch(departure_city, arrival_city, departure_date, passengers=1):
+    """search() for async views: the flights, their seat classes and their airports are read side by side."""
+    day = parse_date(departure_date)
+    if day is None:
+        return []
+    # Resolving the cities only reads the database while the airport index is cold
+    departure_ids, arrival_ids = await concurrent.read(
+        lambda: (resolver.resolve(departure_city), resolver.resolve(arrival_city))
+    )
+    flights = filter_airports(
+        filter_departure_date(Flight.objects.filter(status='scheduled'), day), departure_ids, arrival_ids
+    ).annotate(
+        free_seats=F('available_seats') + expired_hold_seats('flight')
+    ).filter(free_seats__gte=passengers)
+    # The same route and day conditions keep this independent of the flight read;
+    # classes of flights that fail the seat check there are simply not used
+    seat_classes = filter_airports(
+        filter_departure_date(seat_class_queryset(passengers).filter(flight__status='scheduled'), day, 'flight__'),
+        departure_ids, arrival_ids, 'flight__'
+    )
+    airports = Airport.objects.all()
+    if departure_ids is not None and arrival_ids is not None:
+        airports = airports.filter(id__in=departure_ids | arrival_ids)
+
+    flights, seat_classes, airports = await asyncio.gather(
+        concurrent.read(list, flights.select_related('airline')),
+        concurrent.read(list, seat_classes),
+        concurrent.read(airports.in_bulk)
+    )
+    classes_by_flight = defaultdict(list)
+    for seat_class in seat_classes:
+        classes_by_flight[seat_class.flight_id].append(seat_class)
+    for flight in flights:
+        flight.departure_airport = airports[flight.departure_airport_id]
+        flight.arrival_airport = airports[flight.arrival_airport_id]
+        flight.matching_classes = classes_by_flight[flight.id]
+    fares.price_flights(flights, passengers)
+    return [serialize_flight(flight) for flight in flights]
+
+
+def round_trip_queryset(departure_city, arrival_city, departure_date, return_date, passengers=1):
+    """Outbound and inbound candidates together: one flight query plus one seat class query."""
+    out_day, back_day = parse_date(departure_date), parse_date(return_date)
+    origin_ids, destination_ids = resolver.resolve(departure_city), resolver.resolve(arrival_city)
+    if out_day is None or back_day is None or back_day < out_day or not origin_ids or not destination_ids:
+        return Flight.objects.none()
+    out_start, out_end = day_range(out_day)
+    back_start, back_end = day_range(back_day)
+    flights = Flight.objects.filter(status='scheduled').filter(
+        Q(departure_airport_id__in=origin_ids, arrival_airport_id__in=destination_ids,
+          departure_time__gte=out_start, departure_time__lt=out_end)
+        | Q(departure_airport_id__in=destination_ids, arrival_airport_id__in=origin_ids,
+            departure_time__gte=back_start, departure_time__lt=back_end)
+    )
+    return with_availability(flights, passengers)
+
+
+def lowest_total_price(flight):
+    return min(seat_class.total_price for seat_class in flight.matching_classes)
+
+
+ROUND_TRIP_SORTS = {
+    'price': lowest_total_price,
+    'duration': lambda flight: flight.duration,
+}
+
+
+def pair_round_trips(outbound, inbound, key):
+    """Yield (outbound, inbound) pairs in increasing key(outbound) + key(inbound).
+
+    Both lists are sorted once and pairs are generated best-first from a heap,
+    so taking n pairs costs O(n log n) whatever the size of the full product.
+    """
+    outbound = sorted(outbound, key=key)
+    inbound = sorted(inbound, key=key)
+    if not outbound or not inbound:
+        return
+    heap = [(key(outbound[0]) + key(inbound[0]), 0, 0)]
+    seen = {(0, 0)}
+    while heap:
+        _, i, j = heapq.heappop(heap)
+        yield outbound[i], inbound[j]
+        for next_i, next_j in ((i + 1, j), (i, j + 1)):
+            if next_i < len(outbound) and next_j < len(inbound) and (next_i, next_j) not in seen:
+                seen.add((next_i, next_j))
+                heapq.heappush(heap, (key(outbound[next_i]) + key(inbound[next_j]), next_i, next_j))
+
+
+def round_trip(departure_city, arrival_city, departure_date, return_date, passengers=1, sort='price',
+               max_results=None):
+    """Return the best `max_results` JSON-ready round trips, ranked by total price or duration."""
+    limit = getattr(settings, 'ROUND_TRIP_MAX_RESULTS', 50)
+    max_results = min(max_results or limit, limit)
+    flights = [
+        flight for flight in round_trip_queryset(departure_city, arrival_city, departure_date, return_date, passengers)
+        if flight.matching_classes
+    ]
+    fares.price_flights(flights, passengers)
+
+    origin_ids = set(resolver.resolve(departure_city) or ())
+    out_day = parse_date(departure_date)
+    outbound, inbound = [], []
+    for flight in flights:
+        is_outbound = flight.departure_airport_id in origin_ids and timezone.localtime(flight.departure_time).date() == out_day
+        (outbound if is_outbound else inbound).append(flight)
+
+    serialized = {}
+    trips = []
+    for out_flight, back_flight in pair_round_trips(outbound, inbound, ROUND_TRIP_SORTS.get(sort, lowest_total_price)):
+        # Same-day returns must leave after the outbound lands
+        if back_flight.departure_time < out_flight.arrival_time:
+            continue
+        for flight in (out_flight, back_flight):
+            if flight.id not in serialized:
+                serialized[flight.id] = serialize_flight(flight)
+        trips.append({
+            'outbound': serialized[out_flight.id],
+            'inbound': serialized[back_flight.id],
+            'total_price': float(lowest_total_price(out_flight) + lowest_total_price(back_flight)),
+            'total_duration': str(out_flight.duration + back_flight.duration)
+        })
+        if len(trips) >= max_results:
+            break
+    return trips
@@ -0,0 +1,170 @@
+import base64
+import re
+from django.db import transaction
+from django.db.models import BooleanField, ExpressionWrapper, Min
+from django.utils import timezone
+from . import page_cache
+from .models import Seat
+
+LAYOUT_KEY = 'seatmap:layout:{}'
+AVAILABILITY_KEY = 'seatmap:availability:{}'
+LOCK_KEY = 'seatmap:lock:{}'
+LAYOUT_TIMEOUT = 24 * 60 * 60
+AVAILABILITY_TIMEOUT = 60 * 60
+
+WINDOW = 1
+AISLE = 2
+
+SEAT_NUMBER_RE = re.compile(r'^([A-Z]?)(\d+)([A-Z])$')
+
+
+def _parse_seat_number(seat_number):
+    match = SEAT_NUMBER_RE.match(seat_number)
+    if not match:
+        return 0, ''
+    return int(match.group(2)), match.group(3)
+
+
+def get_layout(flight_id):
+    """Static seat layout for a flight, ordered by seat id.
+
+    Each seat is a compact list [id, seat_number, seat_class_id, row, column, flags];
+    the position in this list is the seat's bit in the availability bitset.
+    """
+    cache = page_cache.get_cache()
+    key = LAYOUT_KEY.format(flight_id)
+    layout = cache.get(key)
+    if layout is None:
+        layout = []
+        for seat_id, seat_number, seat_class_id, is_window, is_aisle in Seat.objects.filter(
+            flight_id=flight_id
+        ).order_by('id').values_list('id', 'seat_number', 'seat_class_id', 'is_window', 'is_aisle'):
+            row, column = _parse_seat_number(seat_number)
+            flags = (WINDOW if is_window else 0) | (AISLE if is_aisle else 0)
+            layout.append([seat_id, seat_number, seat_class_id, row, column, flags])
+        cache.set(key, layout, LAYOUT_TIMEOUT)
+    return layout
+
+
+def _build_availability(flight_id, layout):
+    # Imported here because bookings depends on flights, not the other way round
+    from bookings.holds import seat_is_free
+    from bookings.models import SeatHold
+
+    free_ids = set(Seat.objects.filter(flight_id=flight_id).annotate(
+        is_free=ExpressionWrapper(seat_is_free(), output_field=BooleanField())
+    ).filter(is_free=True).values_list('id', flat=True))
+    bits = bytearray((len(layout) + 7) // 8)
+    for position, seat in enumerate(layout):
+        if seat[0] in free_ids:
+            bits[position // 8] |= 1 << (position % 8)
+
+    # The bitset goes stale the moment the next pending hold expires
+    next_expiry = SeatHold.objects.filter(
+        flight_id=flight_id, expires_at__gt=timezone.now(), booking__status='pending'
+    ).aggregate(next_expiry=Min('expires_at'))['next_expiry']
+    return {'bits': bytes(bits), 'valid_until': next_expiry}
+
+
+def get_availability(flight_id, layout=None):
+    cache = page_cache.get_cache()
+    key = AVAILABILITY_KEY.format(flight_id)
+    availability = cache.get(key)
+    if availability is None or (availability['valid_until'] and availability['valid_until'] <= timezone.now()):
+        availability = _build_availability(flight_id, layout or get_layout(flight_id))
+        cache.set(key, availability, AVAILABILITY_TIMEOUT)
+    return availability['bits']
+
+
+def is_free(bits, position):
+    return bool(bits[position // 8] & (1 << (position % 8)))
+
+
+def get_seat_map(flight_id, seat_class_id=None):
+    """Return the JSON-ready seat map: the layout plus a base64 availability bitset."""
+    layout = get_layout(flight_id)
+    bits = get_availability(flight_id, layout)
+    if seat_class_id is not None:
+        positions = [i for i, seat in enumerate(layout) if seat[2] == seat_class_id]
+        layout = [layout[i] for i in positions]
+        subset = bytearray((len(positions) + 7) // 8)
+        for new, old in enumerate(positions):
+            if is_free(bits, old):
+                subset[new // 8] |= 1 << (new % 8)
+        bits = bytes(subset)
+    return {
+        'flight': flight_id,
+        'fields': ['id', 'seat_number', 'seat_class', 'row', 'column', 'flags'],
+        'seats': layout,
+        'available': base64.b64encode(bits).decode('ascii'),
+    }
+
+
+def iter_seats(flight_id, seat_class_id=None):
+    """Yield seat dicts from the cached map, for templates that expect seat objects."""
+    layout = get_layout(flight_id)
+    bits = get_availability(flight_id, layout)
+    for position, (seat_id, seat_number, seat_class, row, column, flags) in enumerate(layout):
+        if seat_class_id is not None and seat_class != seat_class_id:
+            continue
+        yield {
+            'id': seat_id,
+            'seat_number': seat_number,
+            'row': row,
+            'column': column,
+            'is_window': bool(flags & WINDOW),
+            'is_aisle': bool(flags & AISLE),
+            'is_available': is_free(bits, position),
+        }
+
+
+def _patch(flight_id, seat_ids, available):
+    cache = page_cache.get_cache()
+    key = AVAILABILITY_KEY.format(flight_id)
+    lock = LOCK_KEY.format(flight_id)
+    # Read-modify-write under a short cache lock; if it is contended, drop the
+    # bitset and let the next read rebuild it rather than risk a lost update
+    if not cache.add(lock, 1, 5):
+        cache.delete(key)
+        return
+    try:
+        availability = cache.get(key)
+        layout = cache.get(LAYOUT_KEY.format(flight_id))
+        if availability is None or layout is None:
+            cache.delete(key)
+            return
+        positions = {seat[0]: i for i, seat in enumerate(layout)}
+        bits = bytearray(availability['bits'])
+        for seat_id in seat_ids:
+            position = positions.get(seat_id)
+            if position is None:
+                cache.delete(key)
+                return
+            if available:
+                bits[position // 8] |= 1 << (position % 8)
+            else:
+                bits[position // 8] &= ~(1 << (position % 8)) & 0xFF
+        availability['bits'] = bytes(bits)
+        if not available:
+            # A newly taken seat belongs to a hold that expires within the hold window
+            from bookings.holds import hold_expiry
+            expiry = hold_expiry()
+            if availability['valid_until'] is None or expiry < availability['valid_until']:
+                availability['valid_until'] = expiry
+        cache.set(key, availability, AVAILABILITY_TIMEOUT)
+    finally:
+        cache.delete(lock)
+
+
+def mark_seats(flight_id, seat_ids, available):
+    """Patch the cached bitset once the surrounding transaction commits."""
+    seat_ids = list(seat_ids)
+    if seat_ids:
+        transaction.on_commit(lambda: _patch(flight_id, seat_ids, available))
+
+
+def invalidate(flight_id, layout=False):
+    cache = page_cache.get_cache()
+    cache.delete(AVAILABILITY_KEY.format(flight_id))
+    if layout:
+        cache.delete(LAYOUT_KEY.format(flight_id))
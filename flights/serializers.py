@@ -0,0 +1,52 @@
+from rest_framework import serializers
+from .models import Flight, SeatClass
+
+
+class FieldSelectionMixin:
+    """Let clients trim the payload with ?fields=a,b,c."""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        request = self.context.get('request')
+        fields = request.query_params.get('fields') if request else None
+        if fields:
+            wanted = {field.strip() for field in fields.split(',') if field.strip()}
+            for name in set(self.fields) - wanted:
+                self.fields.pop(name)
+
+
+class SeatClassSerializer(serializers.ModelSerializer):
+    # Set in one batch by flights.fares.price_flights, so no per-row flight lookup
+    price = serializers.DecimalField(max_digits=12, decimal_places=2, read_only=True)
+    total_price = serializers.DecimalField(max_digits=14, decimal_places=2, read_only=True)
+    available_seats = serializers.IntegerField(source='free_seats', read_only=True)
+
+    class Meta:
+        model = SeatClass
+        fields = ['id', 'class_type', 'price', 'total_price', 'price_multiplier', 'available_seats', 'baggage_allowance']
+
+
+class FlightSerializer(FieldSelectionMixin, serializers.ModelSerializer):
+    airline = serializers.CharField(source='airline.name', read_only=True)
+    airline_code = serializers.CharField(source='airline.code', read_only=True)
+    departure_airport = serializers.CharField(source='departure_airport.code', read_only=True)
+    departure_city = serializers.CharField(source='departure_airport.city', read_only=True)
+    arrival_airport = serializers.CharField(source='arrival_airport.code', read_only=True)
+    arrival_city = serializers.CharField(source='arrival_airport.city', read_only=True)
+    aircraft = serializers.CharField(source='aircraft.model', read_only=True)
+    available_seats = serializers.IntegerField(source='free_seats', read_only=True)
+    seat_classes = SeatClassSerializer(source='matching_classes', many=True, read_only=True)
+
+    class Meta:
+        model = Flight
+        fields = [
+            'id', 'flight_number', 'airline', 'airline_code', 'aircraft',
+            'departure_airport', 'departure_city', 'arrival_airport', 'arrival_city',
+            'departure_time', 'arrival_time', 'duration', 'base_price', 'status',
+            'available_seats', 'seat_classes',
+        ]
+
+
+class FlightStatusUpdateSerializer(serializers.Serializer):
+    flight_ids = serializers.ListField(child=serializers.IntegerField(min_value=1), allow_empty=False, max_length=1000)
+    status = serializers.ChoiceField(choices=Flight.FLIGHT_STATUS_CHOICES)
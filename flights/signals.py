@@ -0,0 +1,90 @@
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from . import connections, fare_calendar, page_cache, popularity, seatmap
+from .airports import resolver
+from .models import Airport, Flight, Seat, SeatClass
+
+
+@receiver([post_save, post_delete], sender=Airport)
+def invalidate_airport_resolver(sender, **kwargs):
+    resolver.invalidate()
+    # Minimum connection times live on the airport
+    connections.graphs.invalidate()
+
+
+@receiver([post_save, post_delete], sender=Seat)
+def invalidate_seat_map(sender, instance, **kwargs):
+    seatmap.invalidate(instance.flight_id, layout=True)
+
+
+@receiver([post_save, post_delete], sender=Flight)
+@receiver([post_save, post_delete], sender=SeatClass)
+@receiver([post_save, post_delete], sender=Airport)
+def invalidate_page_cache(sender, **kwargs):
+    page_cache.invalidate_all()
+
+
+def _route(values):
+    return (values.get('departure_airport_id'), values.get('arrival_airport_id'), values.get('departure_time'))
+
+
+def _counted_arrival(status, arrival_airport_id):
+    # Cancelled flights don't count towards a destination's popularity
+    return None if status == 'cancelled' else arrival_airport_id
+
+
+def _refresh_fare_calendar(instance, loaded):
+    current = (instance.departure_airport_id, instance.arrival_airport_id, instance.departure_time)
+    previous = _route(loaded or {})
+    if all(previous) and previous != current:
+        fare_calendar.schedule_refresh(*previous)
+    fare_calendar.schedule_refresh(*current)
+
+
+def _update_popularity(instance, created, loaded):
+    if created:
+        before = None
+    elif loaded is None:
+        return
+    else:
+        before = _counted_arrival(loaded.get('status'), loaded.get('arrival_airport_id'))
+    after = _counted_arrival(instance.status, instance.arrival_airport_id)
+    if before != after:
+        popularity.adjust(before, flights=-1)
+        popularity.adjust(after, flights=1)
+
+
+@receiver(post_save, sender=Flight)
+def flight_saved(sender, instance, created, **kwargs):
+    # One receiver, so every handler sees the values from before this save however
+    # receivers are ordered; they then become the baseline for the next save
+    loaded = getattr(instance, '_loaded_values', None)
+    _refresh_fare_calendar(instance, loaded)
+    _update_popularity(instance, created, loaded)
+    instance._loaded_values = {field.attname: getattr(instance, field.attname) for field in instance._meta.concrete_fields}
+
+
+@receiver(post_delete, sender=Flight)
+def refresh_fare_calendar_on_delete(sender, instance, **kwargs):
+    fare_calendar.schedule_refresh(instance.departure_airport_id, instance.arrival_airport_id, instance.departure_time)
+
+
+@receiver([post_save, post_delete], sender=SeatClass)
+def refresh_fare_calendar_for_class(sender, instance, **kwargs):
+    transaction.on_commit(lambda: fare_calendar.refresh_flight(instance.flight_id))
+
+
+@receiver(post_delete, sender=Flight)
+def update_popularity_on_delete(sender, instance, **kwargs):
+    popularity.adjust(_counted_arrival(instance.status, instance.arrival_airport_id), flights=-1)
+
+
+@receiver(post_save, sender=Flight)
+def update_connection_graph(sender, instance, **kwargs):
+    connections.graphs.update_flight(instance)
+
+
+@receiver(post_delete, sender=Flight)
+def remove_from_connection_graph(sender, instance, **kwargs):
+    connections.graphs.remove_flight(instance.id)
@@ -0,0 +1,91 @@
+from collections.abc import AsyncIterator, Iterator
+from django.core.serializers.json import DjangoJSONEncoder
+from django.http import StreamingHttpResponse
+
+# Bytes gathered before a piece is handed to the server; one write per flight would be far slower
+BUFFER_SIZE = 64 * 1024
+
+_encoder = DjangoJSONEncoder()
+
+
+def _pieces(data):
+    if isinstance(data, dict):
+        yield '{'
+        for position, (key, value) in enumerate(data.items()):
+            yield f'{"," if position else ""}{_encoder.encode(str(key))}:'
+            yield from _pieces(value)
+        yield '}'
+    elif isinstance(data, Iterator):
+        yield '['
+        for position, item in enumerate(data):
+            yield f'{"," if position else ""}{_encoder.encode(item)}'
+        yield ']'
+    else:
+        yield _encoder.encode(data)
+
+
+def stream_json(data):
+    """Encode `data` as JSON text in pieces, writing iterators (generators) as arrays item by item.
+
+    Only one item of each iterator is held at a time, so a generator of a
+    million rows encodes in the memory of one row plus the output buffer.
+    """
+    buffer = []
+    size = 0
+    for piece in _pieces(data):
+        buffer.append(piece)
+        size += len(piece)
+        if size >= BUFFER_SIZE:
+            yield ''.join(buffer).encode()
+            buffer = []
+            size = 0
+    if buffer:
+        yield ''.join(buffer).encode()
+
+
+async def _apieces(data):
+    if isinstance(data, dict):
+        yield '{'
+        for position, (key, value) in enumerate(data.items()):
+            yield f'{"," if position else ""}{_encoder.encode(str(key))}:'
+            async for piece in _apieces(value):
+                yield piece
+        yield '}'
+    elif isinstance(data, AsyncIterator):
+        yield '['
+        position = 0
+        async for item in data:
+            yield f'{"," if position else ""}{_encoder.encode(item)}'
+            position += 1
+        yield ']'
+    else:
+        for piece in _pieces(data):
+            yield piece
+
+
+async def astream_json(data):
+    """stream_json() for async views, whose data may also contain async generators."""
+    buffer = []
+    size = 0
+    async for piece in _apieces(data):
+        buffer.append(piece)
+        size += len(piece)
+        if size >= BUFFER_SIZE:
+            yield ''.join(buffer).encode()
+            buffer = []
+            size = 0
+    if buffer:
+        yield ''.join(buffer).encode()
+
+
+class StreamingJsonResponse(StreamingHttpResponse):
+    """JsonResponse counterpart whose data may contain generators, streamed as they are consumed.
+
+    Pass `asynchronous=True` from async views. Under ASGI, Django reads a plain
+    iterator into a list before sending it, so those views need async generators
+    and the async encoder to really stream.
+    """
+
+    def __init__(self, data, asynchronous=False, **kwargs):
+        kwargs.setdefault('content_type', 'application/json')
+        super().__init__(astream_json(data) if asynchronous else stream_json(data), **kwargs)
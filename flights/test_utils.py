@@ -0,0 +1,39 @@
+"""Schedule fixtures shared by the flights and bookings tests."""
+from datetime import timedelta
+from decimal import Decimal
+from .models import Aircraft, Airline, Airport, Flight, SeatClass
+
+
+def make_airports():
+    """The two test airports, TSA in the city of Origin and TSB in Destination."""
+    origin, _ = Airport.objects.get_or_create(code='TSA', defaults={
+        'name': 'Test Origin', 'city': 'Origin', 'country': 'Test', 'timezone': 'UTC'
+    })
+    destination, _ = Airport.objects.get_or_create(code='TSB', defaults={
+        'name': 'Test Destination', 'city': 'Destination', 'country': 'Test', 'timezone': 'UTC'
+    })
+    return origin, destination
+
+
+def make_flight(departure, number=100, origin=None, destination=None, base_price='100.00', economy=None, **fields):
+    """A two-hour Test Air flight, TSA to TSB unless other airports are given.
+
+    With `economy` it also gets an economy class of that many seats, kept as
+    `flight.economy`.
+    """
+    if origin is None or destination is None:
+        test_origin, test_destination = make_airports()
+        origin, destination = origin or test_origin, destination or test_destination
+    airline, _ = Airline.objects.get_or_create(code='TS', defaults={'name': 'Test Air'})
+    aircraft, _ = Aircraft.objects.get_or_create(manufacturer='Test', model='T1', defaults={'capacity': 100})
+    fields.setdefault('available_seats', 100)
+    flight = Flight.objects.create(
+        flight_number=str(number), airline=airline, aircraft=aircraft,
+        departure_airport=origin, arrival_airport=destination, departure_time=departure,
+        arrival_time=departure + timedelta(hours=2), duration=timedelta(hours=2), base_price=Decimal(base_price),
+        **fields
+    )
+    if economy is not None:
+        flight.economy = SeatClass.objects.create(flight=flight, class_type='economy', available_seats=economy,
+                                                  baggage_allowance=23)
+    return flight
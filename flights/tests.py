@@ -1,3 +1,569 @@
-from django.test import TestCase
+import csv
+import io
+import json
+import os
+import tempfile
+from asgiref.sync import async_to_sync
+from datetime import date, datetime, timedelta
+from decimal import Decimal
+from unittest import mock
+from django.core.cache import cache, caches
+from django.core.management import CommandError, call_command
+from django.http import HttpResponse
+from django.test import RequestFactory, SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+from flight_booking.instrumentation import InstrumentationMiddleware, QueryBudgetExceeded, query_budget, stats
+from .models import Aircraft, Airline, Airport, DestinationPopularity, Flight, LowestFare, Seat, SeatClass
+from bookings.services import change_flight_status, release_inventory, reserve_inventory
+from . import fare_calendar, fares, page_cache, plans, search, seatmap
+from .management.commands import import_schedule
+from .pagination import KeysetPaginator
+from .connections import FLIGHT, ConnectionGraph, GraphCache
+from .test_utils import make_airports, make_flight
+from .airports import resolver
 
-# Create your tests here.
+
+@override_settings(QUERY_BUDGET_ACTION='raise')
+class QueryBudgetTests(TestCase):
+    """Every budgeted view stays within its declared query count as the schedule grows."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.origin, cls.destination = make_airports()
+        cls.day = timezone.localdate() + timedelta(days=2)
+        start = timezone.make_aware(datetime.combine(cls.day, datetime.min.time()))
+        for i in range(30):
+            for origin, destination, departure in ((cls.origin, cls.destination, start + timedelta(minutes=20 * i)),
+                                                   (cls.destination, cls.origin, start + timedelta(days=2, minutes=20 * i))):
+                flight = make_flight(departure, 100 + i, origin, destination, base_price=200 + i, economy=80)
+                SeatClass.objects.create(flight=flight, class_type='business', price_multiplier=Decimal('3.00'),
+                                         available_seats=20, baggage_allowance=32)
+        cls.flight = flight
+
+    def setUp(self):
+        cache.clear()
+        resolver.invalidate()
+
+    def test_public_views_stay_within_budget(self):
+        urls = [
+            reverse('home'),
+            reverse('flights:list'),
+            reverse('flights:list') + '?departure_city=Origin',
+            reverse('flights:seat_map', args=[self.flight.id]),
+            reverse('flights:airport_suggest') + '?q=tes',
+            reverse('flights:fare_calendar') + f'?departure_city=TSA&arrival_city=TSB&start={self.day}&days=30',
+            reverse('flight-list'),
+            reverse('flight-detail', args=[self.flight.id]),
+        ]
+        for url in urls:
+            with self.subTest(url=url):
+                response = self.client.get(url)
+                self.assertEqual(response.status_code, 200)
+                self.assertIn('db;dur=', response['Server-Timing'])
+
+    def test_template_time_is_recorded(self):
+        stats.clear()
+        response = self.client.get(reverse('home'))
+        self.assertNotIn('tpl;dur=0.0,', response['Server-Timing'])
+        self.assertGreater(stats.summary()['home']['avg_template_ms'], 0)
+        self.assertEqual(response.templates[0].name, 'home.html')
+
+    def test_search_stays_within_budget(self):
+        response = self.client.post(reverse('flights:search'), json.dumps({
+            'departure_city': 'Origin', 'arrival_city': 'Destination', 'departure_date': str(self.day),
+            'return_date': str(self.day + timedelta(days=2)), 'max_legs': 3, 'flexible_days': 3,
+        }), content_type='application/json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.json()['flights']), 30)
+
+    def test_list_cursors_are_cached_exactly(self):
+        page = self.client.get(reverse('flights:list')).context['page_obj']
+        cursor = page.next_cursor
+        # A mangled cursor falls back to the first page, which must not be cached for the real one
+        mangled = self.client.get(reverse('flights:list'), {'after': cursor.lower()}).context['page_obj']
+        self.assertEqual([flight.id for flight in mangled], [flight.id for flight in page])
+        following = self.client.get(reverse('flights:list'), {'after': cursor}).context['page_obj']
+        self.assertNotIn(page.object_list[-1].id, [flight.id for flight in following])
+        self.assertGreater(following.object_list[0].departure_time, page.object_list[-1].departure_time)
+
+    def test_api_finds_sold_out_flights(self):
+        Flight.objects.filter(id=self.flight.id).update(available_seats=0)
+        SeatClass.objects.filter(flight=self.flight).update(available_seats=0)
+        for url in (reverse('flight-detail', args=[self.flight.id]),
+                    reverse('flight-seat-classes', args=[self.flight.id])):
+            with self.subTest(url=url):
+                self.assertEqual(self.client.get(url).status_code, 200)
+        response = self.client.get(reverse('flight-detail', args=[self.flight.id]), {'passengers': 500})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['available_seats'], 0)
+        listed = self.client.get(reverse('flight-list'), {
+            'departure_city': 'Destination', 'departure_date': str(self.day + timedelta(days=2)), 'page_size': 50
+        }).json()['results']
+        self.assertEqual(len(listed), 29)
+        self.assertNotIn(self.flight.id, [flight['id'] for flight in listed])
+
+    def test_search_ignores_malformed_numbers(self):
+        for url in (reverse('flights:search'), reverse('flights:async_search')):
+            with self.subTest(url=url):
+                response = self.client.post(url, json.dumps({
+                    'departure_city': 'Origin', 'arrival_city': 'Destination', 'departure_date': str(self.day),
+                    'return_date': str(self.day + timedelta(days=2)), 'passengers': 'two', 'max_results': None,
+                    'max_legs': '-2', 'flexible_days': 1.5,
+                }), content_type='application/json')
+                self.assertEqual(response.status_code, 200)
+                self.assertEqual(len(response.json()['flights']), 30)
+
+    def broad_search(self):
+        return self.client.post(reverse('flights:search'), json.dumps({
+            'departure_city': 'Origin', 'departure_date': str(self.day),
+        }), content_type='application/json')
+
+    def test_streamed_queries_count_toward_the_budget(self):
+        stats.clear()
+        response = self.broad_search()
+        self.assertTrue(response.streaming)
+        self.assertEqual(len(json.loads(response.getvalue())['flights']), 30)
+        # The header only covers the view, which reads nothing before the body is sent;
+        # the airport index, the flights and their classes are read while streaming
+        self.assertIn('desc="0 queries"', response['Server-Timing'])
+        self.assertEqual(stats.summary()['flights:search']['max_queries'], 3)
+
+    @override_settings(SEARCH_STREAM_CHUNK_SIZE=2)
+    def test_streaming_over_budget_fails(self):
+        response = self.broad_search()
+        with self.assertRaises(QueryBudgetExceeded):
+            response.getvalue()
+
+    def test_exceeding_a_budget_fails(self):
+        @query_budget(1)
+        def view(request):
+            list(Airport.objects.all())
+            list(Flight.objects.all()[:1])
+            return HttpResponse()
+
+        def get_response(request):
+            middleware.process_view(request, view, (), {})
+            return view(request)
+
+        middleware = InstrumentationMiddleware(get_response)
+        with self.assertRaises(QueryBudgetExceeded):
+            middleware(RequestFactory().get('/'))
+
+
+class PageCacheTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        start = timezone.now() + timedelta(days=1)
+        cls.flights = [
+            make_flight(start + timedelta(hours=i), 100 + i, base_price='200.00', economy=100) for i in range(3)
+        ]
+
+    def setUp(self):
+        cache.clear()
+
+    def listed_seats(self):
+        page = self.client.get(reverse('flights:list')).context['page_obj']
+        return {flight.id: flight.available_seats for flight in page}
+
+    def test_inventory_changes_reach_the_cached_list(self):
+        flight = self.flights[0]
+        self.assertEqual(self.listed_seats()[flight.id], 100)
+        with self.captureOnCommitCallbacks(execute=True):
+            reserve_inventory(flight.id, flight.economy.id, 3)
+        self.assertEqual(self.listed_seats()[flight.id], 97)
+        with self.captureOnCommitCallbacks(execute=True):
+            release_inventory(flight.id, flight.economy.id, 3)
+        self.assertEqual(self.listed_seats()[flight.id], 100)
+
+    def test_unrelated_flights_keep_their_cached_pages(self):
+        version = page_cache.flight_versions([self.flights[1].id])
+        with self.captureOnCommitCallbacks(execute=True):
+            reserve_inventory(self.flights[0].id, self.flights[0].economy.id, 1)
+        self.assertEqual(page_cache.flight_versions([self.flights[1].id]), version)
+
+    @override_settings(PAGE_CACHE_ALIAS='pages', CACHES={
+        'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'default'},
+        'pages': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'pages'},
+    })
+    def test_seat_maps_use_the_page_cache(self):
+        flight = self.flights[0]
+        seatmap.get_seat_map(flight.id)
+        for key in (seatmap.LAYOUT_KEY.format(flight.id), seatmap.AVAILABILITY_KEY.format(flight.id)):
+            self.assertIsNotNone(caches['pages'].get(key))
+            self.assertIsNone(caches['default'].get(key))
+
+    def test_departed_flights_leave_the_cached_list(self):
+        self.assertEqual(len(self.listed_seats()), 3)
+        later = self.flights[0].departure_time + timedelta(minutes=1)
+        with mock.patch('django.utils.timezone.now', return_value=later):
+            self.assertEqual(list(self.listed_seats()), [flight.id for flight in self.flights[1:]])
+
+
+class AsyncSearchTests(TransactionTestCase):
+    """The async views read on worker threads, which only see committed rows."""
+
+    def setUp(self):
+        cache.clear()
+        resolver.invalidate()
+        self.day = timezone.localdate() + timedelta(days=2)
+        start = timezone.make_aware(datetime.combine(self.day, datetime.min.time()))
+        for i in range(12):
+            make_flight(start + timedelta(hours=i), 100 + i, base_price=200 + i, economy=100)
+
+    def search(self, **data):
+        return self.client.post(reverse('flights:async_search'), json.dumps(dict(
+            data, departure_date=str(self.day), flexible_days=1
+        )), content_type='application/json')
+
+    def streamed(self, **data):
+        response = self.search(**data)
+        self.assertTrue(response.streaming)
+
+        async def read(content):
+            return b''.join([chunk async for chunk in content])
+
+        return json.loads(async_to_sync(read)(response.streaming_content))
+
+    @override_settings(SEARCH_STREAM_CHUNK_SIZE=5)
+    def test_broad_search_is_streamed(self):
+        body = self.streamed(departure_city='Origin')
+        self.assertEqual([flight['flight_number'] for flight in body['flights']], [f'TS{100 + i}' for i in range(12)])
+        # The other parts of the answer come along with the stream
+        body = self.streamed(departure_city='Origin', arrival_city='Destination', stream=True)
+        self.assertEqual(len(body['flights']), 12)
+        self.assertEqual(len(body['calendar']), 3)
+
+    def test_route_search_is_cached(self):
+        response = self.search(departure_city='Origin', arrival_city='Destination')
+        self.assertFalse(response.streaming)
+        self.assertEqual(len(response.json()['flights']), 12)
+        self.assertEqual(len(response.json()['calendar']), 3)
+
+
+class SearchPlanTests(TestCase):
+    """The search queries reach flights through an index rather than scanning the table."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.day = timezone.localdate() + timedelta(days=2)
+        start = timezone.make_aware(datetime.combine(cls.day, datetime.min.time()))
+        flight = make_flight(start, 100)
+        airports = list(make_airports()) + [
+            Airport.objects.create(code=f'TS{letter}', name=f'Test {letter}', city=f'City {letter}', country='Test',
+                                   timezone='UTC')
+            for letter in 'CDEFGHIJ'
+        ]
+        # 40 flights a day for two months over 40 routes, only one of them TSA to TSB: a few rows in
+        # thousands match, so a planner working from real row estimates (MySQL) still prefers the index
+        flights = []
+        for day in range(-10, 50):
+            for i in range(40):
+                departure = start + timedelta(days=day, minutes=30 * i)
+                if departure == flight.departure_time:
+                    continue
+                origin, destination = airports[i % 10], airports[(i + 1 + i // 10) % 10]
+                flights.append(Flight(
+                    flight_number=str(1000 + i), airline=flight.airline, aircraft=flight.aircraft,
+                    departure_airport=origin, arrival_airport=destination, departure_time=departure,
+                    arrival_time=departure + timedelta(hours=2), duration=timedelta(hours=2),
+                    base_price=Decimal(200 + i), available_seats=100
+                ))
+        Flight.objects.bulk_create(flights, batch_size=500)
+
+    def assertIndexed(self, queryset):
+        # Strip the prefetch so only the Flight query itself is explained
+        plan = plans.explain(queryset.prefetch_related(None))
+        self.assertFalse(plans.is_full_scan(plan, Flight), plan)
+
+    def test_search_uses_an_index(self):
+        self.assertIndexed(search.search_queryset('TSA', 'TSB', self.day, 1))
+        self.assertIndexed(search.search_queryset('Origin', 'Destination', self.day, 2))
+
+    def test_list_filters_use_an_index(self):
+        self.assertIndexed(search.filter_departure_date(
+            search.filter_route(Flight.objects.filter(status='scheduled'), 'TSA', 'TSB'), self.day
+        ))
+
+    def test_full_scan_is_detected(self):
+        plan = plans.explain(Flight.objects.filter(base_price__gt=Decimal('250')))
+        self.assertTrue(plans.is_full_scan(plan, Flight), plan)
+
+
+class ConnectionGraphTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.origin, cls.destination = make_airports()
+        cls.start = timezone.make_aware(datetime.combine(timezone.localdate() + timedelta(days=2), datetime.min.time()))
+        # Pairs of flights leaving at the same time
+        cls.flights = [
+            make_flight(cls.start + timedelta(hours=i // 2), 100 + i, base_price='200.00') for i in range(6)
+        ]
+
+    def flight_ids(self, graph):
+        return ([edge[FLIGHT] for edge in graph.departures[self.origin.id]],
+                [edge[FLIGHT] for edge in graph.routes[self.origin.id, self.destination.id]])
+
+    def test_remove_and_add_back(self):
+        graph = ConnectionGraph.load(self.start, self.start + timedelta(days=1))
+        ids = [flight.id for flight in self.flights]
+        removed = self.flights[3]
+        departures, routes = self.flight_ids(graph)
+        edge = graph.departures[self.origin.id][departures.index(removed.id)]
+
+        graph.remove(removed.id)
+        graph.remove(removed.id)
+        remaining = [flight_id for flight_id in ids if flight_id != removed.id]
+        self.assertEqual(self.flight_ids(graph), (remaining, remaining))
+
+        graph.add(self.origin.id, edge)
+        self.assertEqual(sorted(self.flight_ids(graph)[0]), ids)
+        self.assertEqual(sorted(self.flight_ids(graph)[1]), ids)
+        graph.remove(removed.id)
+        self.assertNotIn(removed.id, self.flight_ids(graph)[1])
+
+    @override_settings(CONNECTION_WINDOW_DAYS=1, CONNECTION_GRAPH_CACHE_SIZE=2)
+    def test_graph_cache_keeps_recent_windows(self):
+        graphs = GraphCache()
+        day = self.start.date()
+        first = graphs.get(day)
+        graphs.get(day + timedelta(days=1))
+        self.assertIs(graphs.get(day), first)
+        # The least recently searched window makes room for the new one
+        graphs.get(day + timedelta(days=2))
+        self.assertEqual(list(graphs._graphs), [day, day + timedelta(days=2)])
+        self.assertEqual(graphs.get(day).min_connection[self.origin.id], 3600)
+
+
+class ImportScheduleTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.origin, cls.destination = make_airports()
+        Airline.objects.create(code='TS', name='Test Air')
+        Aircraft.objects.create(manufacturer='Test', model='T1', capacity=100)
+        cls.day = timezone.localdate() + timedelta(days=2)
+
+    def setUp(self):
+        cache.clear()
+
+    def ssim_record(self, first_day, last_day, weekdays):
+        line = [' '] * 80
+        for column, text in ((1, '3'), (3, 'TS'), (6, '0100'), (15, f'{first_day:%d%b%y}'.upper()),
+                             (22, f'{last_day:%d%b%y}'.upper()), (29, weekdays), (37, 'TSA'), (40, '2330'),
+                             (48, '+0100'), (55, 'TSB'), (62, '0115'), (66, '+0000'), (73, 'T1')):
+            line[column - 1:column - 1 + len(text)] = text
+        return ''.join(line) + '\n'
+
+    def test_ssim_records_expand_to_operated_days(self):
+        monday = date(2026, 6, 1)
+        handle = io.StringIO('1AIRLINE STANDARD SCHEDULE DATA SET\n'
+                             + self.ssim_record(monday, monday + timedelta(days=13), '1 3    ')
+                             + '3 TS0101 broken\n')
+        rows = list(import_schedule.read_ssim(handle))
+        self.assertEqual([line for line, _ in rows], [2, 2, 2, 2, 3])
+        self.assertIn('error', rows[-1][1])
+        flights = [fields for _, fields in rows[:-1]]
+        self.assertEqual([fields['departure_time'].date() for fields in flights],
+                         [monday + timedelta(days=offset) for offset in (0, 2, 7, 9)])
+        self.assertEqual(flights[0]['flight_number'], '100')
+        self.assertEqual((flights[0]['departure_airport'], flights[0]['arrival_airport'], flights[0]['aircraft']),
+                         ('TSA', 'TSB', 'T1'))
+        # 23:30 at UTC+1 to 01:15 UTC the next day is a 2h45 flight
+        self.assertEqual(flights[0]['arrival_time'] - flights[0]['departure_time'], timedelta(hours=2, minutes=45))
+
+    def test_csv_header_needs_every_column(self):
+        with self.assertRaisesMessage(CommandError, 'CSV header is missing'):
+            list(import_schedule.read_csv(io.StringIO('airline,flight_number\nTS,100\n')))
+
+    def import_csv(self, prices):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'schedule.csv')
+            with open(path, 'w', newline='') as handle:
+                writer = csv.writer(handle)
+                writer.writerow(import_schedule.CSV_COLUMNS)
+                for i, price in enumerate(prices):
+                    writer.writerow(['TS', 100 + i, 'TSA', 'TSB', f'{self.day}T{8 + i:02d}:00', f'{self.day}T{10 + i:02d}:00',
+                                     'T1', price])
+                writer.writerow(['XX', 999, 'TSA', 'TSB', f'{self.day}T08:00', f'{self.day}T10:00', 'T1', '10'])
+            call_command('import_schedule', path, stdout=io.StringIO(), stderr=io.StringIO())
+
+    def lowest_fare(self):
+        return fare_calendar.calendar('TSA', 'TSB', self.day, 1)[0]['lowest_fare']
+
+    def test_reimporting_a_file_updates_flights_in_place(self):
+        # An unrelated calendar row, which only a full rebuild would drop
+        other_day = LowestFare.objects.create(
+            departure_airport=self.destination, arrival_airport=self.origin, date=self.day, class_type='economy',
+            fare=Decimal('1.00'), flight=make_flight(timezone.now() + timedelta(days=5), 900)
+        )
+        generation = cache.get(page_cache.GENERATION_KEY)
+        self.import_csv(['200', '220', '240'])
+        flights = Flight.objects.filter(flight_number__in=['100', '101', '102'])
+        self.assertEqual(flights.count(), 3)
+        self.assertEqual(Seat.objects.filter(flight__in=flights).count(), 300)
+        self.assertEqual(self.lowest_fare(), 200.0)
+        # New flights may belong on any cached list page
+        self.assertNotEqual(cache.get(page_cache.GENERATION_KEY), generation)
+
+        first = flights.get(flight_number='100')
+        Flight.objects.filter(id=first.id).update(available_seats=10)
+        generation = cache.get(page_cache.GENERATION_KEY)
+        versions = page_cache.flight_versions([first.id])
+        with self.captureOnCommitCallbacks(execute=True):
+            self.import_csv(['150', '220', '240'])
+        self.assertEqual(flights.count(), 3)
+        self.assertEqual(Seat.objects.filter(flight__in=flights).count(), 300)
+        first.refresh_from_db()
+        self.assertEqual((first.base_price, first.available_seats), (Decimal('150'), 10))
+        self.assertEqual(self.lowest_fare(), 150.0)
+        self.assertEqual(LowestFare.objects.filter(date=self.day, departure_airport=self.origin).count(), 4)
+        self.assertTrue(LowestFare.objects.filter(id=other_day.id).exists())
+        # Only the pages showing the updated flights are rebuilt
+        self.assertEqual(cache.get(page_cache.GENERATION_KEY), generation)
+        self.assertNotEqual(page_cache.flight_versions([first.id]), versions)
+
+
+class KeysetPaginationTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        start = timezone.now() + timedelta(days=1)
+        # Pairs share a departure time, so the id breaks the tie at every page boundary
+        for i in range(7):
+            make_flight(start + timedelta(hours=i // 2), 100 + i)
+        cls.order = list(Flight.objects.order_by('departure_time', 'id').values_list('id', flat=True))
+
+    def paginator(self):
+        return KeysetPaginator(Flight.objects.all(), per_page=3)
+
+    def ids(self, page):
+        return [flight.id for flight in page]
+
+    def test_next_and_previous_round_trip(self):
+        first = self.paginator().page()
+        self.assertEqual(self.ids(first), self.order[:3])
+        self.assertFalse(first.has_previous())
+        self.assertEqual(first.count, 7)
+
+        second = self.paginator().page(after=first.next_cursor)
+        third = self.paginator().page(after=second.next_cursor)
+        self.assertEqual(self.ids(second), self.order[3:6])
+        self.assertEqual(self.ids(third), self.order[6:])
+        self.assertFalse(third.has_next())
+
+        back = self.paginator().page(before=third.previous_cursor)
+        self.assertEqual(self.ids(back), self.ids(second))
+        self.assertEqual((back.next_cursor, back.previous_cursor), (second.next_cursor, second.previous_cursor))
+        start = self.paginator().page(before=back.previous_cursor)
+        self.assertEqual(self.ids(start), self.ids(first))
+        self.assertFalse(start.has_previous())
+        self.assertEqual(start.next_cursor, first.next_cursor)
+
+    def test_malformed_cursor_starts_over(self):
+        for cursor in ('not-a-cursor', KeysetPaginator(Flight.objects.all(), 3, ordering=('id',)).encode_cursor(
+                Flight.objects.first())):
+            with self.subTest(cursor=cursor):
+                self.assertEqual(self.ids(self.paginator().page(after=cursor)), self.order[:3])
+
+
+class FareTests(SimpleTestCase):
+    def test_seat_fare_is_rounded_half_up_before_multiplying(self):
+        # 100.01 at 1.5x is 150.015 a seat, charged as 150.02
+        self.assertEqual(fares.price_cents(10001, 150).tolist(), 15002)
+        self.assertEqual(fares.price_cents(10001, 150, passengers=3, baggage_cents=2500).tolist(), 47506)
+        self.assertEqual(fares.price_cents([10000, 10001], [100, 150]).tolist(), [10000, 15002])
+        self.assertEqual(fares.seat_price(Decimal('99.99'), Decimal('1.5')), Decimal('149.99'))
+
+    def test_amounts_off_the_cent_fall_back_to_decimal(self):
+        # rint alone would round 0.5 hundredths to even, down to 0
+        self.assertEqual(fares._scaled([Decimal('0.005'), Decimal('0.015')]).tolist(), [1, 2])
+        self.assertEqual(fares._scaled(['19.99', 1.1, Decimal('1.5')]).tolist(), [1999, 110, 150])
+        # Past float64's exact cents
+        self.assertEqual(fares._scaled(Decimal('12345678901234.56')).tolist(), [1234567890123456])
+
+
+class FareCalendarTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.flight = make_flight(timezone.now() + timedelta(days=2), economy=2)
+        cls.business = SeatClass.objects.create(flight=cls.flight, class_type='business',
+                                                price_multiplier=Decimal('3.00'), available_seats=5,
+                                                baggage_allowance=32)
+        cls.day = timezone.localtime(cls.flight.departure_time).date()
+
+    def setUp(self):
+        resolver.invalidate()
+        fare_calendar.rebuild()
+
+    def fares_by_class(self):
+        return dict(LowestFare.objects.filter(date=self.day).values_list('class_type', 'fare'))
+
+    def lowest(self):
+        return fare_calendar.calendar('TSA', 'TSB', self.day, 1)[0]['lowest_fare']
+
+    def flights_to(self, airport):
+        return DestinationPopularity.objects.filter(airport=airport).values_list('flight_count', flat=True).first()
+
+    def test_sold_out_class_leaves_the_calendar(self):
+        self.assertEqual(self.fares_by_class(), {'economy': Decimal('100.00'), 'business': Decimal('300.00')})
+        with self.captureOnCommitCallbacks(execute=True):
+            reserve_inventory(self.flight.id, self.flight.economy.id, 2)
+        self.assertEqual(self.fares_by_class(), {'business': Decimal('300.00')})
+        self.assertEqual(self.lowest(), 300.0)
+        with self.captureOnCommitCallbacks(execute=True):
+            release_inventory(self.flight.id, self.flight.economy.id, 1)
+        self.assertEqual(self.lowest(), 100.0)
+
+    def test_moving_a_flight_refreshes_both_routes(self):
+        elsewhere = Airport.objects.create(code='TSC', name='Test Elsewhere', city='Elsewhere', country='Test',
+                                           timezone='UTC')
+        flight = Flight.objects.get(id=self.flight.id)
+        arrivals = self.flights_to(flight.arrival_airport_id)
+        for _ in range(2):
+            # The second save changes nothing, so it must not count the move again
+            flight.arrival_airport = elsewhere
+            with self.captureOnCommitCallbacks(execute=True):
+                flight.save()
+        self.assertEqual(self.fares_by_class(), {'economy': Decimal('100.00'), 'business': Decimal('300.00')})
+        self.assertEqual(set(LowestFare.objects.values_list('arrival_airport__code', flat=True)), {'TSC'})
+        self.assertEqual((self.flights_to(self.flight.arrival_airport_id), self.flights_to(elsewhere)), (arrivals - 1, 1))
+
+    def test_cancelled_flight_leaves_the_calendar(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            change_flight_status([self.flight.id], 'cancelled')
+        self.assertEqual(self.fares_by_class(), {})
+        self.assertIsNone(self.lowest())
+
+
+class RoundTripTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        origin, destination = make_airports()
+        cls.day = timezone.localdate() + timedelta(days=2)
+        start = timezone.make_aware(datetime.combine(cls.day, datetime.min.time()))
+        for i, price in enumerate((300, 100, 200)):
+            make_flight(start + timedelta(hours=6 + i), 100 + i, base_price=price, economy=10)
+        for i, price in enumerate((160, 50)):
+            make_flight(start + timedelta(days=3, hours=6 + i), 200 + i, destination, origin, base_price=price,
+                        economy=10)
+        # Back the same day, but leaving before the cheapest outbound lands
+        make_flight(start + timedelta(hours=8), 300, destination, origin, base_price=10, economy=10)
+
+    def setUp(self):
+        resolver.invalidate()
+
+    def test_pairs_come_cheapest_first(self):
+        pairs = list(search.pair_round_trips([3, 1, 2], [10, 0], key=lambda fare: fare))
+        self.assertEqual([out + back for out, back in pairs], [1, 2, 3, 11, 12, 13])
+        self.assertEqual(len(set(pairs)), 6)
+        self.assertEqual(list(search.pair_round_trips([], [1], key=lambda fare: fare)), [])
+
+    def test_round_trips_are_ranked_and_capped(self):
+        trips = search.round_trip('TSA', 'TSB', self.day, self.day + timedelta(days=3), passengers=2, max_results=3)
+        self.assertEqual([(trip['outbound']['flight_number'], trip['inbound']['flight_number'], trip['total_price'])
+                          for trip in trips],
+                         [('TS101', 'TS201', 300.0), ('TS102', 'TS201', 500.0), ('TS101', 'TS200', 520.0)])
+
+    def test_same_day_return_leaves_after_landing(self):
+        trips = search.round_trip('TSA', 'TSB', self.day, self.day, max_results=10)
+        self.assertEqual([(trip['outbound']['flight_number'], trip['inbound']['flight_number']) for trip in trips],
+                         [('TS100', 'TS300')])
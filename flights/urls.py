@@ -6,5 +6,11 @@ app_name = 'flights'
 urlpatterns = [
     path('search/', views.search_flights, name='search'),
     path('list/', views.flight_list, name='list'),
+    path('async/search/', views.async_search_flights, name='async_search'),
+    path('async/list/', views.async_flight_list, name='async_list'),
+    path('cache/stats/', views.cache_stats, name='cache_stats'),
+    path('calendar/', views.lowest_fare_calendar, name='fare_calendar'),
+    path('airports/suggest/', views.airport_suggest, name='airport_suggest'),
     path('<int:flight_id>/', views.flight_detail, name='detail'),
+    path('<int:flight_id>/seat-map/', views.seat_map, name='seat_map'),
 ]
@@ -1,13 +1,43 @@
+from django.conf import settings
+from django.contrib.admin.views.decorators import staff_member_required
 from django.shortcuts import render, get_object_or_404
 from django.http import JsonResponse
 from django.db.models import Q
 from django.utils import timezone
 from datetime import datetime, timedelta
 from .models import Flight, Airport, SeatClass
-from django.core.paginator import Paginator
+from . import concurrent, connections, fare_calendar, fares, page_cache, search, seatmap
+from .airports import resolver
+from .pagination import KeysetPaginator
+from .streaming import StreamingJsonResponse
 from django.views.decorators.csrf import csrf_exempt
+from django.views.decorators.http import require_POST
+from flight_booking.instrumentation import query_budget
+from calendar import monthrange
+import asyncio
 import json
 
+
+def _int_param(data, name, default):
+    # Counts come from form fields and JSON bodies alike; anything but a plain number falls back to the default
+    value = str(data.get(name, default))
+    return int(value) if value.isdigit() else default
+
+
+def _snapshot(flights):
+    # What a cached page of `flights` is checked against before it is served again
+    return {
+        'flight_versions': page_cache.flight_versions(flight.id for flight in flights),
+        'first_departure': min((flight.departure_time for flight in flights), default=None),
+    }
+
+
+def _is_current(entry):
+    # Seat counts change without signals, and flights leave the list as they depart
+    return (page_cache.flight_versions(entry['flight_versions']) == entry['flight_versions']
+            and (entry['first_departure'] is None or entry['first_departure'] >= timezone.now()))
+
+@query_budget(10)
 def search_flights(request):
     if request.method == 'POST':
         data = json.loads(request.body)
@@ -15,80 +45,104 @@ def search_flights(request):
         arrival_city = data.get('arrival_city', '')
         departure_date = data.get('departure_date', '')
         return_date = data.get('return_date', '')
-        passengers = int(data.get('passengers', 1))
+        passengers = _int_param(data, 'passengers', 1)
         
-        flights = Flight.objects.filter(
-            departure_airport__city__icontains=departure_city,
-            arrival_airport__city__icontains=arrival_city,
-            departure_time__date=departure_date,
-            available_seats__gte=passengers,
-            status='scheduled'
-        ).select_related('airline', 'departure_airport', 'arrival_airport', 'aircraft')
+        params = {
+            'departure_city': departure_city,
+            'arrival_city': arrival_city,
+            'departure_date': departure_date,
+            'passengers': passengers
+        }
+        # Without both cities a search can match every flight of the day, so it is
+        # streamed chunk by chunk instead of built (and cached) as one list
+        stream = bool(data.get('stream')) or not (departure_city and arrival_city)
+        if stream:
+            flight_data = search.iter_search(departure_city, arrival_city, departure_date, passengers)
+        else:
+            flight_data = page_cache.get_or_build(
+                'search', params,
+                lambda: search.search(departure_city, arrival_city, departure_date, passengers),
+                timeout=getattr(settings, 'SEARCH_CACHE_TIMEOUT', 60)
+            )
+        response = {'flights': flight_data}
         
-        flight_data = []
-        for flight in flights:
-            seat_classes = SeatClass.objects.filter(flight=flight, available_seats__gte=passengers)
-            classes_data = []
-            for seat_class in seat_classes:
-                classes_data.append({
-                    'type': seat_class.class_type,
-                    'price': float(seat_class.get_price()),
-                    'available_seats': seat_class.available_seats,
-                    'baggage_allowance': seat_class.baggage_allowance
-                })
-            
-            flight_data.append({
-                'id': flight.id,
-                'flight_number': f"{flight.airline.code}{flight.flight_number}",
-                'airline': flight.airline.name,
-                'departure_airport': f"{flight.departure_airport.code} - {flight.departure_airport.name}",
-                'arrival_airport': f"{flight.arrival_airport.code} - {flight.arrival_airport.name}",
-                'departure_time': flight.departure_time.strftime('%Y-%m-%d %H:%M'),
-                'arrival_time': flight.arrival_time.strftime('%Y-%m-%d %H:%M'),
-                'duration': str(flight.duration),
-                'available_seats': flight.available_seats,
-                'seat_classes': classes_data
-            })
+        # Round trips when a return date is given
+        if return_date:
+            sort = 'duration' if data.get('sort') == 'duration' else 'price'
+            max_results = _int_param(data, 'max_results', 0) or None
+            response['round_trips'] = page_cache.get_or_build(
+                'round_trip', dict(params, return_date=return_date, sort=sort, max_results=max_results or ''),
+                lambda: search.round_trip(departure_city, arrival_city, departure_date, return_date, passengers,
+                                          sort=sort, max_results=max_results),
+                timeout=getattr(settings, 'SEARCH_CACHE_TIMEOUT', 60)
+            )
         
-        return JsonResponse({'flights': flight_data})
+        # Connecting itineraries are opt-in: max_legs of 2 or 3
+        max_legs = min(_int_param(data, 'max_legs', 1), 3)
+        if max_legs > 1:
+            sort = 'price' if data.get('sort') == 'price' else 'arrival'
+            response['itineraries'] = page_cache.get_or_build(
+                'connections', dict(params, max_legs=max_legs, sort=sort),
+                lambda: connections.search(departure_city, arrival_city, departure_date, passengers,
+                                           max_legs=max_legs, sort=sort),
+                timeout=getattr(settings, 'SEARCH_CACHE_TIMEOUT', 60)
+            )
+        
+        # Flexible dates: lowest fare per day for departure_date ± flexible_days
+        flexible_days = min(_int_param(data, 'flexible_days', 0), fare_calendar.MAX_CALENDAR_DAYS // 2)
+        day = search.parse_date(departure_date)
+        if flexible_days > 0 and day:
+            response['calendar'] = fare_calendar.calendar(
+                departure_city, arrival_city, day - timedelta(days=flexible_days), 2 * flexible_days + 1
+            )
+        
+        if stream:
+            # The flights are read as the body is sent, after this view has returned;
+            # InstrumentationMiddleware counts those reads toward the budget as they happen
+            return StreamingJsonResponse(response)
+        return JsonResponse(response)
     
     # GET request - show search form
-    airports = Airport.objects.all().order_by('city')
-    cities = airports.values_list('city', flat=True).distinct()
-    return render(request, 'flights/search.html', {'cities': cities})
+    return render(request, 'flights/search.html', {'cities': resolver.cities()})
 
+@query_budget(5)
 def flight_list(request):
     flights = Flight.objects.filter(
         departure_time__gte=timezone.now(),
         status='scheduled'
-    ).select_related('airline', 'departure_airport', 'arrival_airport')
+    ).select_related('airline', 'departure_airport', 'arrival_airport').prefetch_related('seat_classes')
     
     # Search filters
     departure_city = request.GET.get('departure_city')
     arrival_city = request.GET.get('arrival_city')
     departure_date = request.GET.get('departure_date')
     
-    if departure_city:
-        flights = flights.filter(departure_airport__city__icontains=departure_city)
-    if arrival_city:
-        flights = flights.filter(arrival_airport__city__icontains=arrival_city)
+    flights = search.filter_route(flights, departure_city, arrival_city)
     if departure_date:
-        try:
-            date_obj = datetime.strptime(departure_date, '%Y-%m-%d').date()
-            flights = flights.filter(departure_time__date=date_obj)
-        except ValueError:
-            pass
+        date_obj = search.parse_date(departure_date)
+        if date_obj:
+            flights = search.filter_departure_date(flights, date_obj)
+    
+    paginator = KeysetPaginator(flights, 10)
+    after = request.GET.get('after')
+    before = request.GET.get('before')
     
-    paginator = Paginator(flights, 10)
-    page_number = request.GET.get('page')
-    page_obj = paginator.get_page(page_number)
+    def build_page():
+        page = paginator.page(after=after, before=before)
+        return dict(_snapshot(page), page=page)
     
-    airports = Airport.objects.all().order_by('city')
-    cities = airports.values_list('city', flat=True).distinct()
+    params = {
+        'departure_city': departure_city or '',
+        'arrival_city': arrival_city or '',
+        'departure_date': departure_date or '',
+        'after': after or '',
+        'before': before or ''
+    }
+    page_obj = page_cache.get_or_build('flight_list', params, build_page, is_fresh=_is_current)['page']
     
     return render(request, 'flights/list.html', {
         'page_obj': page_obj,
-        'cities': cities,
+        'cities': resolver.cities(),
         'search_params': {
             'departure_city': departure_city or '',
             'arrival_city': arrival_city or '',
@@ -96,11 +150,149 @@ def flight_list(request):
         }
     })
 
+@require_POST
+@query_budget(10)
+async def async_search_flights(request):
+    """search_flights for the ASGI application: the independent parts of the answer are read side by side."""
+    data = json.loads(request.body)
+    departure_city = data.get('departure_city', '')
+    arrival_city = data.get('arrival_city', '')
+    departure_date = data.get('departure_date', '')
+    return_date = data.get('return_date', '')
+    passengers = _int_param(data, 'passengers', 1)
+    timeout = getattr(settings, 'SEARCH_CACHE_TIMEOUT', 60)
+    
+    params = {
+        'departure_city': departure_city,
+        'arrival_city': arrival_city,
+        'departure_date': departure_date,
+        'passengers': passengers
+    }
+    # Broad searches are streamed rather than built and cached whole, as in search_flights
+    stream = bool(data.get('stream')) or not (departure_city and arrival_city)
+    parts = {}
+    if not stream:
+        parts['flights'] = page_cache.aget_or_build(
+            'search', params,
+            lambda: search.asearch(departure_city, arrival_city, departure_date, passengers),
+            timeout=timeout
+        )
+    
+    if return_date:
+        sort = 'duration' if data.get('sort') == 'duration' else 'price'
+        max_results = _int_param(data, 'max_results', 0) or None
+        parts['round_trips'] = page_cache.aget_or_build(
+            'round_trip', dict(params, return_date=return_date, sort=sort, max_results=max_results or ''),
+            lambda: concurrent.read(search.round_trip, departure_city, arrival_city, departure_date, return_date,
+                                    passengers, sort=sort, max_results=max_results),
+            timeout=timeout
+        )
+    
+    max_legs = min(_int_param(data, 'max_legs', 1), 3)
+    if max_legs > 1:
+        sort = 'price' if data.get('sort') == 'price' else 'arrival'
+        parts['itineraries'] = page_cache.aget_or_build(
+            'connections', dict(params, max_legs=max_legs, sort=sort),
+            lambda: concurrent.read(connections.search, departure_city, arrival_city, departure_date, passengers,
+                                    max_legs=max_legs, sort=sort),
+            timeout=timeout
+        )
+    
+    flexible_days = min(_int_param(data, 'flexible_days', 0), fare_calendar.MAX_CALENDAR_DAYS // 2)
+    day = search.parse_date(departure_date)
+    if flexible_days > 0 and day:
+        parts['calendar'] = concurrent.read(
+            fare_calendar.calendar, departure_city, arrival_city, day - timedelta(days=flexible_days),
+            2 * flexible_days + 1
+        )
+    
+    results = dict(zip(parts, await asyncio.gather(*parts.values())))
+    if stream:
+        flights = search.aiter_search(departure_city, arrival_city, departure_date, passengers)
+        return StreamingJsonResponse({'flights': flights, **results}, asynchronous=True)
+    return JsonResponse(results)
+
+@query_budget(5)
+async def async_flight_list(request):
+    """The flight list as JSON for the ASGI application, with the page and its count read side by side."""
+    departure_city = request.GET.get('departure_city', '')
+    arrival_city = request.GET.get('arrival_city', '')
+    departure_date = request.GET.get('departure_date', '')
+    passengers = _int_param(request.GET, 'passengers', 1)
+    after = request.GET.get('after')
+    before = request.GET.get('before')
+    
+    async def build_page():
+        flights = await concurrent.read(
+            search.filter_route, Flight.objects.filter(departure_time__gte=timezone.now(), status='scheduled'),
+            departure_city, arrival_city
+        )
+        date_obj = search.parse_date(departure_date)
+        if date_obj:
+            flights = search.filter_departure_date(flights, date_obj)
+        page = await KeysetPaginator(search.with_availability(flights, passengers), 10).apage(after=after, before=before)
+        fares.price_flights(page.object_list, passengers)
+        return dict(await concurrent.read(_snapshot, page), page={
+            'flights': [search.serialize_flight(flight) for flight in page],
+            'count': page.count,
+            'count_is_capped': page.count_is_capped,
+            'next': page.next_cursor,
+            'previous': page.previous_cursor,
+        })
+    
+    params = {
+        'departure_city': departure_city,
+        'arrival_city': arrival_city,
+        'departure_date': departure_date,
+        'passengers': passengers,
+        'after': after or '',
+        'before': before or ''
+    }
+    entry = await page_cache.aget_or_build('flight_list_json', params, build_page, is_fresh=_is_current)
+    return JsonResponse(entry['page'])
+
 def flight_detail(request, flight_id):
-    flight = get_object_or_404(Flight, id=flight_id)
-    seat_classes = SeatClass.objects.filter(flight=flight)
+    def build_detail():
+        flight = get_object_or_404(
+            Flight.objects.select_related('airline', 'aircraft', 'departure_airport', 'arrival_airport'),
+            id=flight_id
+        )
+        return {'flight': flight, 'seat_classes': list(SeatClass.objects.filter(flight=flight))}
     
-    return render(request, 'flights/detail.html', {
-        'flight': flight,
-        'seat_classes': seat_classes
-    })
+    # Keyed on the inventory version so a booking or release shows up at once
+    version = page_cache.flight_versions([flight_id])[flight_id]
+    context = page_cache.get_or_build('flight_detail', {'id': flight_id, 'version': version}, build_detail)
+    
+    return render(request, 'flights/detail.html', context)
+
+@query_budget(3)
+def lowest_fare_calendar(request):
+    # Either ?month=YYYY-MM or ?start=YYYY-MM-DD&days=N
+    month = request.GET.get('month')
+    if month:
+        start = search.parse_date(f'{month}-01')
+        days = monthrange(start.year, start.month)[1] if start else 0
+    else:
+        start = request.GET.get('start')
+        days = request.GET.get('days', '30')
+        days = int(days) if days.isdigit() else 30
+    return JsonResponse({'calendar': fare_calendar.calendar(
+        request.GET.get('departure_city', ''), request.GET.get('arrival_city', ''),
+        start, days, request.GET.get('class')
+    )})
+
+@query_budget(2)
+def airport_suggest(request):
+    query = request.GET.get('q', '')
+    return JsonResponse({'airports': resolver.suggest(query)})
+
+@query_budget(4)
+def seat_map(request, flight_id):
+    get_object_or_404(Flight, id=flight_id)
+    seat_class = request.GET.get('class')
+    seat_class_id = int(seat_class) if seat_class and seat_class.isdigit() else None
+    return JsonResponse(seatmap.get_seat_map(flight_id, seat_class_id))
+
+@staff_member_required
+def cache_stats(request):
+    return JsonResponse({'views': page_cache.stats()})
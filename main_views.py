@@ -1,48 +1,49 @@
 from django.shortcuts import render
 from django.contrib.auth.decorators import login_required
-from django.db.models import Count, Q
 from django.utils import timezone
 from datetime import timedelta
 from flights.models import Flight, Airport
+from bookings import summary
 from bookings.models import Booking
+from flights import page_cache, popularity
+from flight_booking.instrumentation import query_budget
 
+@query_budget(4)
 def home(request):
-    # Get popular destinations
-    popular_destinations = Airport.objects.annotate(
-        flight_count=Count('arriving_flights')
-    ).order_by('-flight_count')[:6]
-    
-    # Get upcoming flights
-    upcoming_flights = Flight.objects.filter(
-        departure_time__gte=timezone.now(),
-        departure_time__lte=timezone.now() + timedelta(days=7),
-        status='scheduled'
-    ).select_related('airline', 'departure_airport', 'arrival_airport')[:6]
+    def build_home():
+        # Get popular destinations
+        popular_destinations = popularity.popular_destinations()
+        
+        # Get upcoming flights
+        now = timezone.now()
+        upcoming_flights = Flight.objects.filter(
+            status='scheduled',
+            departure_time__gte=now,
+            departure_time__lt=now + timedelta(days=7)
+        ).order_by('departure_time').select_related('airline', 'departure_airport', 'arrival_airport')[:6]
+        
+        return {
+            'popular_destinations': list(popular_destinations),
+            'upcoming_flights': list(upcoming_flights)
+        }
     
-    return render(request, 'home.html', {
-        'popular_destinations': popular_destinations,
-        'upcoming_flights': upcoming_flights
-    })
+    return render(request, 'home.html', page_cache.get_or_build('home', {}, build_home))
 
 @login_required
+@query_budget(5)
 def dashboard(request):
-    # Get all user bookings (without slicing first)
-    all_user_bookings = Booking.objects.filter(user=request.user).order_by('-created_at')
-    
-    # Statistics
-    total_bookings = all_user_bookings.count()
-    upcoming_trips = all_user_bookings.filter(
-        flight__departure_time__gte=timezone.now(),
-        status='confirmed'
-    ).count()
+    # Statistics in one aggregate query (or none, when the summary is cached)
+    stats = summary.booking_summary(request.user.id)
     
-    # Get recent bookings for display (slice at the end)
-    user_bookings = all_user_bookings[:5]
+    # Recent bookings with their flight, airline and airports in the same query
+    user_bookings = Booking.objects.filter(user=request.user).select_related(
+        'flight__airline', 'flight__departure_airport', 'flight__arrival_airport'
+    ).order_by('-created_at', '-id')[:5]
     
     return render(request, 'dashboard.html', {
         'user_bookings': user_bookings,
-        'total_bookings': total_bookings,
-        'upcoming_trips': upcoming_trips
+        'total_bookings': stats['total_bookings'],
+        'upcoming_trips': stats['upcoming_trips']
     })
 
 def contact(request):